@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Benchmark — asyncio ingestion engine vs thread-per-camera receivers
+
+Starts a local fake camera (fake_camera.py serving synthetic H.264 frames,
+or a recording with --input) and connects N "cameras" to it with:
+
+    threads : receiver + processor thread per camera, blocking `requests`
+              stream (motion_detect.connect_camera_stream), as before
+    asyncio : ingest.IngestEngine — one event loop + shared worker pool
+
+Processing is a stand-in (NAL parse of every frame) so the comparison is
+about ingestion overhead, not decoding.  Each engine runs in a fresh
+process and reports frames/s, OS threads, CPU% and peak RSS.
+
+Usage:
+    python benchmarks/bench_ingest.py --cameras 20
+    python benchmarks/bench_ingest.py --cameras 20 --fast --json
+    python benchmarks/bench_ingest.py --input camera_stream.h264
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+TPLINK_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TPLINK_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from h264_stream import H264FrameQueue, nal_types  # noqa: E402
+from fake_camera import FakeCamera, load_frames, make_self_signed_cert, server_ssl_context  # noqa: E402
+from bench_parser import synthetic_units  # noqa: E402
+from bench_pipeline import peak_rss_mb  # noqa: E402
+
+
+# ========================
+# Engines (child process)
+# ========================
+class BenchMonitor:
+    """Just enough of CameraMonitor for both receive paths."""
+
+    def __init__(self, port):
+        self.ip = "127.0.0.1"
+        self.port = port
+        self.username = "bench"
+        self.password = "bench"
+        self.frame_queue = H264FrameQueue(maxsize=1000)
+        self.frames_received = 0
+        self.bytes_received = 0
+        self.reconnects = 0
+        self.frames_processed = 0
+        self.status = "starting"
+        self.running = False
+
+    def start_processing(self):
+        pass
+
+    def process_frame(self, h264_frame):
+        nal_types(h264_frame)
+        self.frames_processed += 1
+
+    def check_idle(self):
+        pass
+
+    def stop_processing(self):
+        pass
+
+
+def run_threads(monitors, seconds):
+    import queue
+    from motion_detect import connect_camera_stream
+    from h264_stream import parse_h264_frames
+
+    def receiver(m):
+        response = connect_camera_stream(m.ip, m.port, m.username, m.password)
+        for h264_frame in parse_h264_frames(response):
+            if not m.running:
+                break
+            m.frame_queue.put(h264_frame)
+            m.frames_received += 1
+
+    def processor(m):
+        while m.running:
+            try:
+                m.process_frame(m.frame_queue.get(timeout=1.0))
+            except queue.Empty:
+                pass
+
+    for m in monitors:
+        m.running = True
+        threading.Thread(target=receiver, args=(m,), daemon=True).start()
+        threading.Thread(target=processor, args=(m,), daemon=True).start()
+    time.sleep(seconds)
+    threads = threading.active_count()
+    for m in monitors:
+        m.running = False
+    return threads
+
+
+def run_asyncio(monitors, seconds, workers):
+    from ingest import IngestEngine
+
+    engine = IngestEngine(monitors, workers=workers)
+    engine.start()
+    time.sleep(seconds)
+    threads = threading.active_count()
+    engine.stop()
+    return threads
+
+
+def child(args):
+    monitors = [BenchMonitor(args.port) for _ in range(args.cameras)]
+    cpu0, t0 = time.process_time(), time.monotonic()
+    if args.child == "threads":
+        threads = run_threads(monitors, args.seconds)
+    else:
+        threads = run_asyncio(monitors, args.seconds, args.workers)
+    cpu, wall = time.process_time() - cpu0, time.monotonic() - t0
+
+    print(json.dumps({
+        "frames_per_s": sum(m.frames_processed for m in monitors) / wall,
+        "dropped": sum(m.frame_queue.dropped for m in monitors),
+        "threads": threads,
+        "cpu_percent": 100.0 * cpu / wall,
+        "rss_mb": peak_rss_mb(),
+    }))
+
+
+def main():
+    p = argparse.ArgumentParser(description="asyncio vs threaded ingestion benchmark")
+    p.add_argument("--cameras", type=int, default=20)
+    p.add_argument("--seconds", type=float, default=10.0)
+    p.add_argument("--workers", type=int, default=4, help="asyncio engine processing threads")
+    p.add_argument("--fps", type=float, default=30.0, help="Frames/s per camera")
+    p.add_argument("--fast", action="store_true", help="No pacing: send as fast as possible")
+    p.add_argument("--port", type=int, default=19443)
+    p.add_argument("--input", nargs="+", help="Recorded .h264 files to serve (default: synthetic)")
+    p.add_argument("--engines", nargs="+", default=["threads", "asyncio"])
+    p.add_argument("--json", action="store_true", help="Print results as JSON")
+    p.add_argument("--child", choices=["threads", "asyncio"], help=argparse.SUPPRESS)
+    args = p.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    tmp = tempfile.mkdtemp()
+    try:
+        cert, key = make_self_signed_cert(tmp)
+        frames = load_frames(args.input) if args.input else synthetic_units(300)
+        camera = FakeCamera(frames, fps=args.fps, fast=args.fast)
+        camera.start_in_thread("127.0.0.1", args.port, server_ssl_context(cert, key))
+
+        results = {}
+        for engine in args.engines:
+            cmd = [sys.executable, os.path.abspath(__file__), "--child", engine,
+                   "--cameras", str(args.cameras), "--seconds", str(args.seconds),
+                   "--workers", str(args.workers), "--port", str(args.port)]
+            out = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            results[engine] = json.loads(out.stdout.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    pacing = "as fast as possible" if args.fast else f"{args.fps:g} fps each"
+    print("=" * 60)
+    print(f"  Ingestion Benchmark — {args.cameras} cameras, {pacing}, {args.seconds:g}s")
+    print("=" * 60)
+    for engine, r in results.items():
+        rss = f"{r['rss_mb']:6.0f} MB" if r["rss_mb"] is not None else "   n/a"
+        print(f"  {engine:<8} {r['frames_per_s']:9.0f} frames/s  threads={r['threads']:<4} "
+              f"CPU={r['cpu_percent']:5.0f}%  RSS={rss}  dropped={r['dropped']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Benchmark — motion detection modes and background models
+
+Runs MotionDetector (motion.py) over the same decoded frames and reports:
+
+  Modes ("full", and "fast" at each of --widths), previous-frame background:
+    speed      p50 / p99 ms per detect() and frames/s
+    agreement  with the full-frame detector, frame by frame: both trigger /
+               fast only / full only, median area ratio (fast / full) and
+               mean IoU of the union motion box when both trigger
+
+  Background models (--backgrounds, in --bg-mode):
+    triggers, false triggers (frames without motion that triggered),
+    missed motion frames, p50 ms and CPU%
+
+Frames come from a recording (--input, decoded with H264Decoder every
+--decode-interval frames, like the monitors) or from a synthetic 1080p
+scene: a textured background with sensor noise, exposure drift, a patch
+of swaying foliage and person-sized objects crossing it part of the time.
+The synthetic scene knows which frames contain motion; for a recording,
+pass --no-motion if nothing moves in it, so every trigger counts as false.
+
+Usage:
+    python benchmarks/bench_motion.py
+    python benchmarks/bench_motion.py --widths 240 320 480 --threshold 35 --min-area 2000
+    python benchmarks/bench_motion.py --backgrounds frame average mog2 --bg-rate 0.05
+    python benchmarks/bench_motion.py --input empty_yard.h264 --no-motion
+    python benchmarks/bench_motion.py --input camera_stream.h264 --json
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import cv2
+import numpy as np
+
+TPLINK_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TPLINK_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from motion import (  # noqa: E402
+    MotionDetector, DEFAULT_THRESHOLD, DEFAULT_MIN_AREA, DEFAULT_BG_RATE, BACKGROUNDS, MODES,
+)
+from bench_pipeline import StageTimer  # noqa: E402
+
+
+# ========================
+# Frame Sources
+# ========================
+def synthetic_scene(count, width=1920, height=1080, seed=0):
+    """
+    1080p frames (as decoded every ~10 stream frames) and, per frame, whether
+    an object moves: static texture + noise, exposure drift and clouds, a
+    swaying foliage patch, and objects crossing during half of the frames.
+    """
+    rnd = np.random.default_rng(seed)
+    texture = rnd.integers(40, 200, (height // 16, width // 16, 3), dtype=np.uint8)
+    background = cv2.GaussianBlur(cv2.resize(texture, (width, height)), (31, 31), 0).astype(np.int16)
+    leaves = rnd.integers(20, 235, (height // 4 // 6, width // 4 // 6, 3), dtype=np.uint8)
+    leaves = cv2.resize(leaves, (width // 4 + 40, height // 4), interpolation=cv2.INTER_NEAREST).astype(np.int16)
+
+    frames, truth = [], []
+    for i in range(count):
+        frame = background + rnd.normal(0, 3, (height, width, 1)).astype(np.int16)
+        frame += int(12 * np.sin(i / 25.0))  # exposure drift
+        if i % 90 >= 70:                     # a cloud dims the scene for a while
+            frame -= 4 * min(i % 90 - 69, 91 - i % 90)
+        sway = int(20 + 14 * np.sin(i * 1.3))  # foliage in the top-left corner
+        frame[:height // 4, :width // 4] = leaves[:, sway:sway + width // 4]
+
+        phase = i % 120
+        moving = phase < 60  # an object crosses during the first half of every 120 frames
+        if moving:
+            x = int((width - 200) * phase / 60)
+            cv2.rectangle(frame, (x, height // 3), (x + 160, height // 3 + 380), (30, 30, 30), -1)
+            if i % 240 < 60:  # and sometimes a second, smaller one
+                y = int((height - 120) * phase / 60)
+                cv2.circle(frame, (width // 4 * 3, y + 60), 50, (230, 230, 230), -1)
+        frames.append(np.clip(frame, 0, 255).astype(np.uint8))
+        truth.append(moving)
+    return frames, truth
+
+
+def decoded_frames(paths, interval, backend=None):
+    from h264_stream import H264Decoder
+    from fake_camera import load_frames
+
+    decoder = H264Decoder(backend=backend)
+    frames = []
+    for i, frame in enumerate(load_frames(paths), 1):
+        decoder.push(frame)
+        if i % interval == 0:
+            img = decoder.read()
+            if img is not None:
+                frames.append(img)
+    decoder.close()
+    return frames
+
+
+# ========================
+# Runs
+# ========================
+def run_mode(frames, threshold, min_area, mode, width=None, background="frame", bg_rate=DEFAULT_BG_RATE):
+    detector = MotionDetector(threshold=threshold, min_area=min_area, mode=mode,
+                              background=background, bg_rate=bg_rate,
+                              **({"width": width} if width else {}))
+    timer = StageTimer(mode if mode == "full" else f"fast@{detector.width}")
+    results = []
+    with timer:
+        for frame in frames:
+            motion, area, _ = timer.call(detector.detect, frame)
+            results.append((motion, area, list(detector.last_boxes)))
+    return timer, results
+
+
+def union_box(boxes):
+    x0 = min(x for x, _, _, _ in boxes)
+    y0 = min(y for _, y, _, _ in boxes)
+    x1 = max(x + w for x, _, w, _ in boxes)
+    y1 = max(y + h for _, y, _, h in boxes)
+    return x0, y0, x1, y1
+
+
+def iou(a, b):
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union else 0.0
+
+
+def agreement(reference, results):
+    both = fast_only = full_only = 0
+    ratios, ious = [], []
+    for (ref_motion, ref_area, ref_boxes), (motion, area, boxes) in zip(reference, results):
+        if ref_motion and motion:
+            both += 1
+            ratios.append(area / ref_area)
+            ious.append(iou(union_box(ref_boxes), union_box(boxes)))
+        elif motion:
+            fast_only += 1
+        elif ref_motion:
+            full_only += 1
+    frames = len(reference)
+    return {
+        "both": both,
+        "fast_only": fast_only,
+        "full_only": full_only,
+        "agree_percent": 100.0 * (frames - fast_only - full_only) / frames if frames else 0.0,
+        "area_ratio_median": float(np.median(ratios)) if ratios else None,
+        "box_iou_mean": float(np.mean(ious)) if ious else None,
+    }
+
+
+def false_triggers(results, truth):
+    """Triggers on frames without motion, and motion frames that didn't trigger."""
+    quiet = [motion for (motion, _, _), moving in zip(results, truth) if not moving]
+    active = [motion for (motion, _, _), moving in zip(results, truth) if moving]
+    return {
+        "false_triggers": sum(quiet),
+        "false_trigger_percent": 100.0 * sum(quiet) / len(quiet) if quiet else None,
+        "missed": len(active) - sum(active),
+        "missed_percent": 100.0 * (len(active) - sum(active)) / len(active) if active else None,
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description="MotionDetector full vs fast mode benchmark")
+    p.add_argument("--input", nargs="+", help="Recorded raw .h264 files (default: synthetic 1080p scene)")
+    p.add_argument("--frames", type=int, default=360, help="Synthetic frame count")
+    p.add_argument("--decode-interval", type=int, default=10)
+    p.add_argument("--decoder", choices=["av", "ffmpeg", "file"], default=None)
+    p.add_argument("--widths", type=int, nargs="+", default=[320], help="Fast mode analysis widths")
+    p.add_argument("--threshold", type=int, default=DEFAULT_THRESHOLD)
+    p.add_argument("--min-area", type=int, default=DEFAULT_MIN_AREA)
+    p.add_argument("--backgrounds", nargs="+", choices=BACKGROUNDS, default=list(BACKGROUNDS),
+                   help="Background models to compare (default: all)")
+    p.add_argument("--bg-mode", choices=MODES, default="fast", help="Mode for the background comparison")
+    p.add_argument("--bg-rate", type=float, default=DEFAULT_BG_RATE)
+    p.add_argument("--no-motion", action="store_true", help="The --input recording has no real motion")
+    p.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = p.parse_args()
+
+    if args.input:
+        frames = decoded_frames(args.input, args.decode_interval, args.decoder)
+        truth = [False] * len(frames) if args.no_motion else None
+        source = ", ".join(args.input)
+    else:
+        frames, truth = synthetic_scene(args.frames)
+        source = f"synthetic ({args.frames} frames)"
+    if len(frames) < 2:
+        sys.exit("Need at least two decoded frames")
+
+    timer, reference = run_mode(frames, args.threshold, args.min_area, "full")
+    results = {"full": dict(timer.result(), triggers=sum(r[0] for r in reference))}
+    for width in args.widths:
+        timer, fast = run_mode(frames, args.threshold, args.min_area, "fast", width)
+        results[timer.name] = dict(timer.result(), triggers=sum(r[0] for r in fast),
+                                   **agreement(reference, fast))
+
+    backgrounds = {}
+    for background in args.backgrounds:
+        timer, res = run_mode(frames, args.threshold, args.min_area, args.bg_mode,
+                              background=background, bg_rate=args.bg_rate)
+        backgrounds[background] = dict(timer.result(), triggers=sum(r[0] for r in res),
+                                       **(false_triggers(res, truth) if truth else {}))
+
+    if args.json:
+        print(json.dumps({"source": source, "frames": len(frames), "modes": results,
+                          "backgrounds": backgrounds}, indent=2))
+        return
+
+    h, w = frames[0].shape[:2]
+    print("=" * 78)
+    print(f"  Motion Detection Benchmark — {source}, {len(frames)} frames at {w}x{h}")
+    print(f"  threshold={args.threshold} min_area={args.min_area}")
+    print("=" * 78)
+    print(f"  {'mode':<10}{'p50 ms':>8}{'p99 ms':>8}{'fps':>8}{'trig':>6}{'agree':>8}"
+          f"{'+fast':>7}{'-fast':>7}{'area':>7}{'IoU':>6}")
+    full_p50 = results["full"]["p50_ms"]
+    for name, r in results.items():
+        line = f"  {name:<10}{r['p50_ms']:>8.2f}{r['p99_ms']:>8.2f}{r['per_sec']:>8.0f}{r['triggers']:>6}"
+        if name != "full":
+            area = f"{r['area_ratio_median']:.2f}" if r["area_ratio_median"] is not None else "-"
+            box = f"{r['box_iou_mean']:.2f}" if r["box_iou_mean"] is not None else "-"
+            line += (f"{r['agree_percent']:>7.1f}%{r['fast_only']:>7}{r['full_only']:>7}{area:>7}{box:>6}"
+                     f"   x{full_p50 / r['p50_ms']:.1f} faster")
+        print(line)
+
+    if backgrounds:
+        print()
+        print(f"  Background models ({args.bg_mode} mode, bg_rate={args.bg_rate:g})")
+        print(f"  {'model':<10}{'p50 ms':>8}{'CPU%':>7}{'trig':>6}{'false':>7}{'false%':>8}{'missed':>8}{'miss%':>7}")
+        for name, r in backgrounds.items():
+            line = f"  {name:<10}{r['p50_ms']:>8.2f}{r['cpu_percent']:>7.0f}{r['triggers']:>6}"
+            if "false_triggers" in r:
+                pct = lambda v: f"{v:.1f}" if v is not None else "-"  # noqa: E731
+                line += (f"{r['false_triggers']:>7}{pct(r['false_trigger_percent']):>8}"
+                         f"{r['missed']:>8}{pct(r['missed_percent']):>7}")
+            print(line)
+        if truth is None:
+            print("  (false triggers need the synthetic scene or --no-motion)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Benchmark — multipart H.264 parser throughput
+
+Replays a recorded stream (or a synthetic one) through the original
+bytes-concatenating parser and the incremental bytearray parser in
+h264_stream.py, and reports MB/s and frames/s for each.
+
+Usage:
+    # Synthetic 1080p-like stream (GOP of 30, ~150 KB IDR / ~15 KB P-frames)
+    python benchmarks/bench_parser.py
+
+    # Recorded stream from `tplink_camera.py --save`
+    python benchmarks/bench_parser.py --input recording.h264
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from h264_stream import MultipartH264Parser, BOUNDARY  # noqa: E402
+
+
+def legacy_parse_h264_frames(chunks):
+    """The original parser (copies the buffer on every part)."""
+    boundary = BOUNDARY
+    buffer = b""
+
+    for chunk in chunks:
+        buffer += chunk
+
+        while True:
+            idx = buffer.find(boundary)
+            if idx == -1:
+                if len(buffer) > 200000:
+                    buffer = buffer[-100000:]
+                break
+
+            after = buffer[idx + len(boundary):]
+            header_end = after.find(b"\r\n\r\n")
+            if header_end == -1:
+                break
+
+            headers_raw = after[:header_end].decode("latin-1")
+            body_start = header_end + 4
+
+            content_length = 0
+            content_type = ""
+            for line in headers_raw.split("\r\n"):
+                lo = line.lower().strip()
+                if lo.startswith("content-length:"):
+                    content_length = int(line.split(":", 1)[1].strip())
+                elif lo.startswith("content-type:"):
+                    content_type = line.split(":", 1)[1].strip()
+
+            if content_length == 0:
+                buffer = after[body_start:]
+                continue
+
+            if len(after) < body_start + content_length:
+                break
+
+            frame_data = after[body_start : body_start + content_length]
+            buffer = after[body_start + content_length:]
+
+            if "h264" in content_type.lower() or "video" in content_type.lower():
+                yield frame_data
+
+
+def split_access_units(data):
+    """Split a raw Annex-B file into NAL units (start code included)."""
+    start_code = b"\x00\x00\x00\x01"
+    units = []
+    idx = data.find(start_code)
+    while idx != -1:
+        nxt = data.find(start_code, idx + 4)
+        units.append(data[idx:nxt if nxt != -1 else len(data)])
+        idx = nxt
+    return units
+
+
+def synthetic_units(count, gop=30, idr_size=150000, p_size=15000):
+    rnd = random.Random(0)
+    units = []
+    for i in range(count):
+        size = idr_size if i % gop == 0 else rnd.randint(p_size // 2, p_size * 2)
+        nal_type = 5 if i % gop == 0 else 1
+        units.append(b"\x00\x00\x00\x01" + bytes([0x60 | nal_type]) + os.urandom(size))
+    return units
+
+
+def build_multipart(units, audio_every=3):
+    """Wrap NAL units in the camera's multipart framing (with audio parts)."""
+    parts = []
+    for i, unit in enumerate(units):
+        parts.append(
+            BOUNDARY + b"\r\nContent-Type: video/x-h264\r\n"
+            + b"Content-Length: %d\r\nX-Timestamp: %d\r\n\r\n" % (len(unit), i)
+            + unit + b"\r\n"
+        )
+        if audio_every and i % audio_every == 0:
+            audio = b"\xd5" * 320
+            parts.append(
+                BOUNDARY + b"\r\nContent-Type: audio/g711\r\n"
+                + b"Content-Length: %d\r\n\r\n" % len(audio) + audio + b"\r\n"
+            )
+    return b"".join(parts)
+
+
+def chunked(stream, chunk_size):
+    return [stream[i:i + chunk_size] for i in range(0, len(stream), chunk_size)]
+
+
+def run(name, parse, chunks, total_bytes, repeat):
+    best = None
+    frames = 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        frames = sum(1 for _ in parse(chunks))
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    mb_s = total_bytes / best / 1e6
+    print(f"  {name:<12} {best * 1000:8.1f} ms  {mb_s:8.1f} MB/s  {frames / best:9.0f} frames/s")
+    return frames, best
+
+
+def incremental_parse(chunks):
+    parser = MultipartH264Parser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Multipart H.264 parser benchmark")
+    p.add_argument("--input", help="Recorded raw .h264 file (default: synthetic)")
+    p.add_argument("--frames", type=int, default=900, help="Synthetic frame count")
+    p.add_argument("--chunk-size", type=int, default=65536)
+    p.add_argument("--repeat", type=int, default=3)
+    args = p.parse_args()
+
+    if args.input:
+        with open(args.input, "rb") as f:
+            units = split_access_units(f.read())
+        source = args.input
+    else:
+        units = synthetic_units(args.frames)
+        source = f"synthetic ({args.frames} frames)"
+
+    stream = build_multipart(units)
+    chunks = chunked(stream, args.chunk_size)
+
+    print("=" * 60)
+    print("  Multipart H.264 Parser Benchmark")
+    print("=" * 60)
+    print(f"  Source : {source}")
+    print(f"  Stream : {len(stream) / 1e6:.1f} MB in {len(chunks)} chunks of {args.chunk_size}")
+    print("=" * 60)
+
+    old_frames, old_t = run("legacy", legacy_parse_h264_frames, chunks, len(stream), args.repeat)
+    new_frames, new_t = run("incremental", incremental_parse, chunks, len(stream), args.repeat)
+
+    if old_frames != new_frames:
+        print(f"[!] Frame count mismatch: legacy={old_frames} incremental={new_frames}")
+    print(f"\n  Speed-up: {old_t / new_t:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Benchmark — motion pipeline, stage by stage
+
+Replays a recorded stream through each stage of the motion monitor on its
+own, feeding every stage the previous stage's output:
+
+    parse        parse_h264_frames over the camera's multipart framing
+    decode       H264Decoder push + read (the monitors' decoder session)
+    decode_file  decode_latest_frame on the GOP so far (legacy temp-file path)
+    motion       MotionDetector.detect on the decoded frames
+    ai           ObjectDetector.detect_relevant_object on frames with motion
+    save         CameraMonitor._save_motion_event for whole clips
+
+and reports, per stage, calls/s, p50/p99 latency and CPU%, plus peak RSS
+for the run.  --json/--output write the results for comparison between
+versions; --compare prints the change against an earlier result file.
+
+Without --input only the parse stage can run (synthetic frames aren't
+decodable H.264).
+
+Usage:
+    python tplink_camera.py --save --duration 60
+    python benchmarks/bench_pipeline.py --input camera_stream.h264
+    python benchmarks/bench_pipeline.py --input camera_stream.h264 --output before.json
+    python benchmarks/bench_pipeline.py --input camera_stream.h264 --compare before.json
+    python benchmarks/bench_pipeline.py --input camera_stream.h264 --stages decode motion
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource  # Unix only
+except ImportError:
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+TPLINK_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TPLINK_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from h264_stream import (  # noqa: E402
+    parse_h264_frames, H264Decoder, GopBuffer, decode_latest_frame,
+)
+from fake_camera import load_frames  # noqa: E402
+from bench_parser import synthetic_units, build_multipart  # noqa: E402
+
+STAGES = ("parse", "decode", "decode_file", "motion", "ai", "save")
+
+
+# ========================
+# Measurement
+# ========================
+class StageTimer:
+    """Per-call latencies plus the stage's wall and CPU time."""
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.note = ""
+
+    def __enter__(self):
+        self._wall0 = time.perf_counter()
+        self._cpu0 = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall += time.perf_counter() - self._wall0
+        self.cpu += time.process_time() - self._cpu0
+
+    def call(self, fn, *args):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        self.latencies.append(time.perf_counter() - t0)
+        return result
+
+    def result(self):
+        lat = sorted(self.latencies)
+        if not lat:
+            return {"calls": 0, "note": self.note}
+        return {
+            "calls": len(lat),
+            "per_sec": len(lat) / self.wall if self.wall else 0.0,
+            "p50_ms": percentile(lat, 50) * 1000,
+            "p99_ms": percentile(lat, 99) * 1000,
+            "max_ms": lat[-1] * 1000,
+            "cpu_percent": 100.0 * self.cpu / self.wall if self.wall else 0.0,
+            "note": self.note,
+        }
+
+
+def percentile(sorted_values, pct):
+    idx = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+def peak_rss_mb():
+    """
+    Peak RSS of this process in MB (psutil on Windows), or None if
+    unavailable.  Also used by bench_ingest.py and bench_startup.py.
+    """
+    if resource is not None:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == "darwin":
+            rss //= 1024
+        return rss / 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    return None
+
+
+def git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=TPLINK_DIR,
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class FakeResponse:
+    """Stands in for a streaming requests.Response."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def iter_content(self, chunk_size=65536):
+        for i in range(0, len(self.stream), chunk_size):
+            yield self.stream[i:i + chunk_size]
+
+
+# ========================
+# Stages
+# ========================
+def stage_parse(units, repeat):
+    stream = build_multipart(units)
+    timer = StageTimer("parse")
+    frames = []
+    with timer:
+        for _ in range(repeat):
+            frames = []
+            it = parse_h264_frames(FakeResponse(stream))
+            while True:
+                t0 = time.perf_counter()
+                frame = next(it, None)
+                timer.latencies.append(time.perf_counter() - t0)
+                if frame is None:
+                    timer.latencies.pop()  # end-of-stream probe
+                    break
+                frames.append(frame)
+    timer.note = f"{len(stream) / 1e6:.1f} MB x{repeat}"
+    return timer, frames
+
+
+def stage_decode(frames, interval, backend):
+    timer = StageTimer("decode")
+    decoder = H264Decoder(backend=backend)
+    decoded = []
+    with timer:
+        for i, frame in enumerate(frames, 1):
+            timer.call(decoder.push, frame)
+            if i % interval == 0:
+                img = timer.call(decoder.read)
+                if img is not None:
+                    decoded.append(img)
+    decoder.close()
+    timer.note = f"backend={decoder.backend}, {len(decoded)} frames out"
+    return timer, decoded
+
+
+def stage_decode_file(frames, interval, limit):
+    timer = StageTimer("decode_file")
+    gop = GopBuffer()
+    tmp = os.path.join(tempfile.mkdtemp(), "_bench_decode.h264")
+    with timer:
+        for i, frame in enumerate(frames, 1):
+            gop.push(frame)
+            if i % interval == 0 and gop.has_idr:
+                timer.call(decode_latest_frame, gop.snapshot(), tmp)
+                if len(timer.latencies) >= limit:
+                    break
+    timer.note = f"every {interval} frames, first {limit} decodes"
+    return timer
+
+
+def stage_motion(decoded, mode):
+    from motion import MotionDetector
+
+    timer = StageTimer("motion")
+    detector = MotionDetector(mode=mode)
+    hits = []
+    with timer:
+        for img in decoded:
+            motion, _, _ = timer.call(detector.detect, img)
+            if motion:
+                hits.append((img, list(detector.last_boxes)))
+    timer.note = f"{mode} mode, {len(hits)} frames with motion"
+    return timer, hits
+
+
+def stage_ai(hits, decoded, backend, limit):
+    from motion_detect_v2 import ObjectDetector
+
+    timer = StageTimer("ai")
+    detector = ObjectDetector(backend=backend)
+    if detector.backend is None:
+        timer.note = f"backend {backend} unavailable"
+        return timer
+    samples = hits or [(img, None) for img in decoded]
+    samples = samples[:limit]
+    timer.call(detector.detect_relevant_object, samples[0][0], samples[0][1])  # warm-up
+    timer.latencies.clear()
+    with timer:
+        for img, boxes in samples:
+            timer.call(detector.detect_relevant_object, img, boxes)
+    timer.note = f"{detector.backend}, {'motion crops' if hits else 'full frames'}"
+    return timer
+
+
+def stage_save(frames, decoded, clips, clip_format, clip_seconds=10):
+    from motion_detect_v2 import CameraMonitor
+
+    timer = StageTimer("save")
+    out = tempfile.mkdtemp()
+    monitor = CameraMonitor("bench", out, clip_format=clip_format)
+    per_clip = max(1, min(len(decoded), 30))
+    raw = frames[:int(clip_seconds * 30)] if clip_format == "mp4" else None
+    with timer:
+        for _ in range(clips):
+            store = monitor._new_frame_store()
+            for img in decoded[:per_clip]:
+                store.append(img)
+            timer.call(monitor._save_motion_event, store, 0, raw, 30.0)
+            store.close()
+    timer.note = f"{clip_format}, {per_clip} decoded + {len(raw or [])} raw frames/clip"
+    return timer
+
+
+# ========================
+# Report
+# ========================
+def print_report(results, baseline=None):
+    print("=" * 78)
+    print("  Motion Pipeline Benchmark")
+    print("=" * 78)
+    print(f"  Source : {results['source']} -> {results['frames']} frames parsed")
+    rss = results["peak_rss_mb"]
+    rss = f"{rss:.0f} MB" if rss is not None else "n/a (install psutil)"
+    print(f"  Rev    : {results['revision']}  |  peak RSS {rss}")
+    print("=" * 78)
+    print(f"  {'stage':<12}{'calls':>7}{'per sec':>10}{'p50 ms':>10}{'p99 ms':>10}{'CPU%':>7}  note")
+    for name, r in results["stages"].items():
+        if not r["calls"]:
+            print(f"  {name:<12}{'-':>7}  {r['note']}")
+            continue
+        line = (f"  {name:<12}{r['calls']:>7}{r['per_sec']:>10.1f}{r['p50_ms']:>10.2f}"
+                f"{r['p99_ms']:>10.2f}{r['cpu_percent']:>7.0f}  {r['note']}")
+        old = (baseline or {}).get("stages", {}).get(name)
+        if old and old.get("calls"):
+            line += f"  [p50 {r['p50_ms'] / old['p50_ms'] - 1:+.0%} vs baseline]"
+        print(line)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Per-stage motion pipeline benchmark")
+    p.add_argument("--input", nargs="+", help="Recorded raw .h264 files (from tplink_camera.py --save)")
+    p.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    p.add_argument("--frames", type=int, default=900, help="Synthetic frame count (no --input)")
+    p.add_argument("--repeat", type=int, default=3, help="Parse passes")
+    p.add_argument("--decode-interval", type=int, default=10)
+    p.add_argument("--decoder", choices=["av", "ffmpeg", "file"], default=None)
+    p.add_argument("--file-decodes", type=int, default=20, help="Max decode_latest_frame calls")
+    p.add_argument("--motion-mode", choices=["full", "fast"], default="full")
+    p.add_argument("--ai-backend", default="torch")
+    p.add_argument("--ai-frames", type=int, default=30)
+    p.add_argument("--clips", type=int, default=3)
+    p.add_argument("--clip-format", choices=["mp4", "avi"], default="mp4")
+    p.add_argument("--json", action="store_true", help="Print results as JSON")
+    p.add_argument("--output", help="Also write the JSON results to this file")
+    p.add_argument("--compare", help="Earlier JSON result to compare against")
+    args = p.parse_args()
+
+    units = load_frames(args.input) if args.input else synthetic_units(args.frames)
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    timers = {}
+
+    parse_timer, frames = stage_parse(units, args.repeat)
+    if "parse" in args.stages:
+        timers["parse"] = parse_timer
+
+    decoded = []
+    if args.input:
+        if {"decode", "motion", "ai", "save"} & set(args.stages):
+            timer, decoded = stage_decode(frames, args.decode_interval, args.decoder)
+            if "decode" in args.stages:
+                timers["decode"] = timer
+        if "decode_file" in args.stages:
+            timers["decode_file"] = stage_decode_file(frames, args.decode_interval, args.file_decodes)
+        hits = []
+        if {"motion", "ai"} & set(args.stages):
+            timer, hits = stage_motion(decoded, args.motion_mode)
+            if "motion" in args.stages:
+                timers["motion"] = timer
+        if "ai" in args.stages and decoded:
+            timers["ai"] = stage_ai(hits, decoded, args.ai_backend, args.ai_frames)
+        if "save" in args.stages and decoded:
+            timers["save"] = stage_save(frames, decoded, args.clips, args.clip_format)
+    for name in args.stages:
+        if name not in timers:
+            timers[name] = StageTimer(name)
+            timers[name].note = "needs --input (recorded stream)" if not args.input else "no decoded frames"
+
+    results = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "source": ", ".join(args.input) if args.input else f"synthetic ({args.frames} frames)",
+        "frames": len(frames),
+        "peak_rss_mb": peak_rss_mb(),
+        "cpu_percent": 100.0 * (time.process_time() - cpu0) / (time.perf_counter() - wall0),
+        "stages": {name: timers[name].result() for name in STAGES if name in args.stages},
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
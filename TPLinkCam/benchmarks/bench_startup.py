@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark — motion_detect_v2 startup cost
+
+Measures, in fresh interpreter processes, how long `import motion_detect_v2`
+takes and the resulting peak RSS:
+
+    lazy  : the module as shipped (torch is imported on first AI use)
+    eager : the module plus an immediate torch/torchvision import, i.e. the
+            old behaviour of importing the AI stack at module import time
+
+The difference is the time camera receivers used to wait before they
+could start streaming.
+
+Usage:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --repeat 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+TPLINK_DIR = os.path.dirname(BENCH_DIR)
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import motion_detect_v2
+if {eager}:
+    import detector_backends
+    detector_backends._import_torch()
+elapsed = time.perf_counter() - t0
+# Imported after timing; motion_detect_v2 already loaded its heavy modules
+sys.path.insert(0, {bench_dir!r})
+from bench_pipeline import peak_rss_mb
+print(json.dumps({{"seconds": elapsed, "rss_mb": peak_rss_mb()}}))
+"""
+
+
+def measure(eager, repeat):
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", CHILD.format(eager=eager, bench_dir=BENCH_DIR)],
+            cwd=TPLINK_DIR, capture_output=True, text=True, check=True,
+        )
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    rss = [r["rss_mb"] for r in runs if r["rss_mb"] is not None]
+    return {
+        "seconds": statistics.median(r["seconds"] for r in runs),
+        "rss_mb": statistics.median(rss) if rss else None,
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description="motion_detect_v2 startup benchmark")
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = p.parse_args()
+
+    results = {"lazy": measure(False, args.repeat)}
+    try:
+        results["eager"] = measure(True, args.repeat)
+    except subprocess.CalledProcessError:
+        results["eager"] = None  # torch not installed
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print("=" * 60)
+    print("  motion_detect_v2 Startup Benchmark (median of %d)" % args.repeat)
+    print("=" * 60)
+    for name, r in results.items():
+        if r is None:
+            print(f"  {name:<6} (torch not installed)")
+        else:
+            rss = f"{r['rss_mb']:7.0f} MB" if r["rss_mb"] is not None else "n/a (install psutil)"
+            print(f"  {name:<6} import {r['seconds'] * 1000:8.0f} ms   peak RSS {rss}")
+    if results["eager"]:
+        saved = results["eager"]["seconds"] - results["lazy"]["seconds"]
+        print(f"\n  Receivers start {saved:.2f}s sooner", end="")
+        if results["eager"]["rss_mb"] is not None and results["lazy"]["rss_mb"] is not None:
+            print(f"; {results['eager']['rss_mb'] - results['lazy']['rss_mb']:.0f} MB less RSS "
+                  f"until first AI use", end="")
+        print()
+
+
+if __name__ == "__main__":
+    main()
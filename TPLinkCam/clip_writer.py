@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+TP-Link Kasa Camera — Background Clip Writer Pool
+
+Saving a motion clip (JPEG snapshot + ffmpeg remux or XVID encode) takes
+from a fraction of a second to several seconds.  Done inline, the camera's
+processor loop stops decoding for that long, its frame queue fills up and
+H.264 frames get dropped, corrupting the decoder until the next IDR.
+
+ClipWriterPool runs clip jobs on a few worker threads shared by every
+camera (ffmpeg and the OpenCV encoders release the GIL).  The job queue is
+bounded: when `max_pending` clips are already waiting, `submit()` blocks the
+caller until a slot frees up, so a slow disk throttles clip creation
+instead of letting queued clips (and their frame buffers) pile up.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+DEFAULT_WRITERS = 2          # Worker threads shared by all cameras
+DEFAULT_WRITER_QUEUE = 8     # Clips waiting to be written before submit() blocks
+
+
+class ClipWriterPool:
+    def __init__(self, workers=DEFAULT_WRITERS, max_pending=DEFAULT_WRITER_QUEUE):
+        self.workers = workers
+        self.jobs = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.active = 0
+        self.blocked = 0            # submit() calls that had to wait for a slot
+        self.blocked_seconds = 0.0  # total time callers spent waiting
+        self.write_seconds = 0.0    # total time spent in jobs
+        self.last_write_seconds = 0.0
+
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"clip-writer-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queue `fn(*args, **kwargs)` for a worker thread and return a Future.
+        Blocks while the queue is full (backpressure).
+        """
+        future = Future()
+        job = (fn, args, kwargs, future)
+        try:
+            self.jobs.put_nowait(job)
+        except queue.Full:
+            t0 = time.monotonic()
+            self.jobs.put(job)
+            with self._lock:
+                self.blocked += 1
+                self.blocked_seconds += time.monotonic() - t0
+        with self._lock:
+            self.submitted += 1
+        return future
+
+    def _worker(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            fn, args, kwargs, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            with self._lock:
+                self.active += 1
+            t0 = time.monotonic()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                future.set_exception(e)
+                ok = False
+            else:
+                future.set_result(result)
+                ok = True
+            elapsed = time.monotonic() - t0
+
+            with self._lock:
+                self.active -= 1
+                self.write_seconds += elapsed
+                self.last_write_seconds = elapsed
+                if ok:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+    @property
+    def queued(self):
+        """Clips waiting for a worker."""
+        return self.jobs.qsize()
+
+    @property
+    def pending(self):
+        """Clips queued or being written."""
+        return self.queued + self.active
+
+    @property
+    def mean_write_seconds(self):
+        done = self.completed + self.failed
+        return self.write_seconds / done if done else 0.0
+
+    def stats(self):
+        return (f"queued={self.queued} writing={self.active} done={self.completed} "
+                f"failed={self.failed} avg={self.mean_write_seconds:.1f}s "
+                f"blocked={self.blocked} ({self.blocked_seconds:.1f}s)")
+
+    def shutdown(self, wait=True):
+        """Let queued clips finish, then stop the workers."""
+        for _ in self._threads:
+            self.jobs.put(None)
+        if wait:
+            for t in self._threads:
+                t.join()
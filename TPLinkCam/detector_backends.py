@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+TP-Link Kasa Camera — Object Detector Backends
+
+Inference backends for the SSDLite320-MobileNetV3 person/animal filter
+used by motion_detect_v2.ObjectDetector:
+
+- "torch"     : eager torchvision model (default, needs torch + torchvision)
+- "onnx"      : exported FP32 model on ONNX Runtime's CPU provider
+- "onnx-int8" : dynamically quantized (int8 weights) ONNX model
+
+The ONNX models are produced by export_detector.py and only need
+`onnxruntime` at run time, which is far lighter than torch on the
+GPU-less x5-Z8350 boards.
+
+torch/torchvision are imported on first use, not at module import:
+they add seconds of startup and hundreds of MB RSS, which is wasted with
+--no-ai or an ONNX backend and delays the camera receivers otherwise.
+
+Every backend takes a list of RGB uint8 images (any size) and returns,
+per image, (boxes, labels, scores) numpy arrays with boxes as
+(x1, y1, x2, y2) in that image's pixel coordinates, sorted by score.
+"""
+
+import importlib.util
+import os
+import threading
+
+import cv2
+import numpy as np
+
+# Optional AI imports (deferred — see _import_torch)
+HAS_TORCH = (
+    importlib.util.find_spec("torch") is not None
+    and importlib.util.find_spec("torchvision") is not None
+)
+torch = None
+torchvision = None
+_torch_lock = threading.Lock()
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+MODEL_INPUT_SIZE = 320
+DEFAULT_ONNX_MODELS = {
+    "onnx": os.path.join(MODEL_DIR, "ssdlite320.onnx"),
+    "onnx-int8": os.path.join(MODEL_DIR, "ssdlite320_int8.onnx"),
+}
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def _import_torch():
+    """Import torch + torchvision on first use; returns (torch, torchvision)."""
+    global torch, torchvision
+    with _torch_lock:
+        if torch is None:
+            if not HAS_TORCH:
+                raise ImportError("torch/torchvision not installed")
+            import torch as _torch
+            import torchvision as _torchvision
+            import torchvision.models.detection  # noqa: F401
+            torch, torchvision = _torch, _torchvision
+    return torch, torchvision
+
+
+def load_torch_model():
+    """Build the pretrained SSDLite320-MobileNetV3 model in eval mode."""
+    _, tv = _import_torch()
+    detection = tv.models.detection
+    model = detection.ssdlite320_mobilenet_v3_large(
+        weights=detection.SSDLite320_MobileNet_V3_Large_Weights.DEFAULT
+    )
+    model.eval()
+    return model
+
+
+class TorchBackend:
+    """Eager torchvision model (batched forward pass, GPU if available)."""
+    name = "torch"
+
+    def __init__(self):
+        _import_torch()
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.model = load_torch_model().to(self.device)
+
+    def predict(self, images):
+        tensors = [torchvision.transforms.functional.to_tensor(img).to(self.device) for img in images]
+
+        # The model resizes every image to 320x320 and stacks them
+        with torch.no_grad():
+            predictions = self.model(tensors)
+
+        return [
+            (p["boxes"].cpu().numpy(), p["labels"].cpu().numpy(), p["scores"].cpu().numpy())
+            for p in predictions
+        ]
+
+    def __str__(self):
+        return f"torch ({self.device})"
+
+
+class OnnxBackend:
+    """
+    Exported model on ONNX Runtime (CPU).
+
+    The model is exported for one 320x320 image, so inputs are resized here
+    and the boxes scaled back to each image's size.  A list of images is run
+    as one session.run per image: DetectorService's micro-batches only save
+    forward passes on the torch backend (the torchvision detector's
+    per-image post-processing does not export with a batch axis).
+    """
+
+    def __init__(self, name="onnx", model_path=None, threads=None):
+        import onnxruntime as ort
+
+        self.name = name
+        self.model_path = model_path or DEFAULT_ONNX_MODELS[name]
+        if not os.path.exists(self.model_path):
+            raise FileNotFoundError(
+                f"{self.model_path} not found — run export_detector.py first"
+            )
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            self.model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, images):
+        results = []
+        size = MODEL_INPUT_SIZE
+        for img in images:
+            h, w = img.shape[:2]
+            resized = cv2.resize(img, (size, size), interpolation=cv2.INTER_LINEAR)
+            blob = resized.astype(np.float32).transpose(2, 0, 1) / 255.0
+
+            boxes, scores, labels = self.session.run(None, {self.input_name: blob})
+            boxes = boxes * np.array([w / size, h / size, w / size, h / size], dtype=np.float32)
+            order = np.argsort(-scores)
+            results.append((boxes[order], labels[order], scores[order]))
+        return results
+
+    def __str__(self):
+        return f"{self.name} ({os.path.basename(self.model_path)})"
+
+
+def create_backend(name="torch", model_path=None):
+    """
+    Create a detector backend by name.
+
+    Raises ImportError if the backend's runtime is missing and
+    FileNotFoundError if an ONNX model hasn't been exported yet.
+    """
+    if name == "torch":
+        return TorchBackend()
+    if name in DEFAULT_ONNX_MODELS:
+        return OnnxBackend(name, model_path)
+    raise ValueError(f"Unknown detector backend: {name} (choose from {', '.join(BACKENDS)})")
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Export the SSDLite320-MobileNetV3 detector for ONNX Runtime
+
+Writes two models used by the "onnx" and "onnx-int8" backends in
+detector_backends.py:
+
+    models/ssdlite320.onnx       FP32, exported from torchvision
+    models/ssdlite320_int8.onnx  same graph with int8 (dynamically quantized) weights
+
+Only this script needs torch; the monitor itself then runs on
+`onnxruntime` alone.
+
+Usage:
+    pip install torch torchvision onnx onnxruntime
+    python export_detector.py
+    python test_detector_parity.py            # check against the eager model
+    python motion_detect_v2.py --ai-backend onnx-int8
+"""
+
+import argparse
+import os
+
+import torch
+
+from detector_backends import DEFAULT_ONNX_MODELS, MODEL_INPUT_SIZE, load_torch_model
+
+
+def export_fp32(path, opset):
+    model = load_torch_model()
+    dummy = torch.rand(3, MODEL_INPUT_SIZE, MODEL_INPUT_SIZE)
+
+    print(f"[*] Exporting FP32 model -> {path}")
+    torch.onnx.export(
+        model,
+        ([dummy],),
+        path,
+        opset_version=opset,
+        input_names=["images"],
+        output_names=["boxes", "scores", "labels"],
+        dynamic_axes={"boxes": {0: "n"}, "scores": {0: "n"}, "labels": {0: "n"}},
+        do_constant_folding=True,
+    )
+
+
+def export_int8(src, dst):
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    print(f"[*] Quantizing weights to int8 -> {dst}")
+    quantize_dynamic(src, dst, weight_type=QuantType.QUInt8)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Export the AI filter model to ONNX")
+    p.add_argument("--output", default=DEFAULT_ONNX_MODELS["onnx"], help="FP32 model path")
+    p.add_argument("--int8-output", default=DEFAULT_ONNX_MODELS["onnx-int8"], help="Int8 model path")
+    p.add_argument("--opset", type=int, default=11)
+    p.add_argument("--no-int8", action="store_true", help="Skip the quantized model")
+    args = p.parse_args()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    export_fp32(args.output, args.opset)
+    if not args.no_int8:
+        export_int8(args.output, args.int8_output)
+
+    for path in [args.output] + ([] if args.no_int8 else [args.int8_output]):
+        print(f"[+] {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+TP-Link Kasa Camera — Local Fake Camera Server
+
+Replays recorded raw H.264 files (e.g. from `tplink_camera.py --save`) the
+way a Kasa camera streams them, so CameraMonitor, the parser and the
+decoders can be load-tested and profiled without real cameras:
+
+- HTTPS on a configurable port (self-signed certificate via the openssl
+  CLI unless --cert/--key are given)
+- GET /https/stream/mixed with HTTP basic auth, password base64-encoded
+  inside it like the real camera (see SETUP.md "Authentication")
+- multipart/x-mixed-replace parts separated by `--data-boundary--`, with
+  Content-Type / Content-Length / X-Timestamp headers, one frame per part
+- realtime pacing (--fps) or as fast as the client reads (--fast)
+- any number of simultaneous clients (optionally capped with --max-clients)
+
+Usage:
+    python tplink_camera.py --save --duration 60          # record camera_stream.h264
+    python fake_camera.py camera_stream.h264              # serve it on :19443
+    python fake_camera.py a.h264 b.h264 --fast --user me@x.com --password secret
+    python motion_detect.py --cameras 127.0.0.1
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import shutil
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+
+STREAM_PATH = "/https/stream/mixed"
+BOUNDARY = b"--data-boundary--"
+DEFAULT_PORT = 19443
+DEFAULT_FPS = 30.0
+
+START_CODE = b"\x00\x00\x01"
+VCL_TYPES = (1, 5)  # slice / IDR slice
+
+
+# ========================
+# Recorded Stream
+# ========================
+def split_frames(data):
+    """
+    Split a raw Annex-B stream into frames (access units), as the camera
+    sends them: SPS/PPS/SEI are kept with the picture that follows them,
+    and a picture's extra slices stay with its first slice.
+    """
+    frames = []
+    frame_start = 0
+    seen_slice = False
+    idx = data.find(START_CODE)
+    while idx != -1 and idx + 3 < len(data):
+        unit_start = idx - 1 if idx > 0 and data[idx - 1] == 0 else idx
+        nal_type = data[idx + 3] & 0x1F
+        first_slice = (
+            nal_type in VCL_TYPES and idx + 4 < len(data) and data[idx + 4] & 0x80
+        )  # first_mb_in_slice == 0 (ue(v) "1")
+        if seen_slice and (first_slice or nal_type not in VCL_TYPES):
+            frames.append(data[frame_start:unit_start])
+            frame_start = unit_start
+            seen_slice = False
+        if nal_type in VCL_TYPES:
+            seen_slice = True
+        idx = data.find(START_CODE, idx + 3)
+    if frame_start < len(data):
+        frames.append(data[frame_start:])
+    return frames
+
+
+def load_frames(paths):
+    frames = []
+    for path in paths:
+        with open(path, "rb") as f:
+            frames.extend(split_frames(f.read()))
+    return frames
+
+
+def make_self_signed_cert(directory):
+    """Write a throwaway certificate + key into `directory` (needs the openssl CLI)."""
+    cert = os.path.join(directory, "fake_camera_cert.pem")
+    key = os.path.join(directory, "fake_camera_key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "7",
+         "-subj", "/CN=fake-kasa-camera", "-keyout", key, "-out", cert],
+        check=True, capture_output=True,
+    )
+    return cert, key
+
+
+# ========================
+# Server
+# ========================
+class FakeCamera:
+    """
+    Streams `frames` to every client that requests /https/stream/mixed.
+
+    With `username`/`password` set, requests must carry exactly those
+    credentials; otherwise any basic-auth header is accepted (but one is
+    still required, like the camera).
+    """
+
+    def __init__(self, frames, fps=DEFAULT_FPS, fast=False, loop=True,
+                 username=None, password=None, max_clients=0, audio=False):
+        if not frames:
+            raise ValueError("no frames to serve")
+        self.frames = frames
+        self.fps = fps
+        self.fast = fast
+        self.loop = loop
+        self.username = username
+        self.password = password
+        self.max_clients = max_clients
+        self.audio = audio
+
+        self.clients = 0
+        self.peak_clients = 0
+        self.connections = 0
+        self.rejected = 0
+        self.frames_sent = 0
+        self.bytes_sent = 0
+
+    def _authorized(self, header):
+        if not header.lower().startswith("basic "):
+            return False
+        try:
+            user, password_b64 = base64.b64decode(header[6:].strip()).decode().split(":", 1)
+            password = base64.b64decode(password_b64).decode()
+        except Exception:
+            return False
+        if self.username is None:
+            return True
+        return user == self.username and password == self.password
+
+    @staticmethod
+    def _part(content_type, body, timestamp):
+        return (
+            BOUNDARY + b"\r\n"
+            + b"Content-Type: " + content_type + b"\r\n"
+            + b"Content-Length: %d\r\n" % len(body)
+            + b"X-UtcTime: %d\r\n" % int(time.time())
+            + b"X-Timestamp: %.3f\r\n\r\n" % timestamp
+            + body + b"\r\n"
+        )
+
+    async def handle(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 15)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ConnectionError, ssl.SSLError):
+            writer.close()
+            return
+
+        lines = head.decode("latin-1").split("\r\n")
+        request = lines[0].split(" ")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                key, value = line.split(":", 1)
+                headers[key.strip().lower()] = value.strip()
+
+        if len(request) < 2 or request[0] != "GET" or not request[1].startswith(STREAM_PATH):
+            await self._reply(writer, "404 Not Found")
+            return
+        if not self._authorized(headers.get("authorization", "")):
+            await self._reply(writer, "401 Unauthorized",
+                              'WWW-Authenticate: Basic realm="camera"\r\n')
+            return
+        if self.max_clients and self.clients >= self.max_clients:
+            self.rejected += 1
+            await self._reply(writer, "503 Service Unavailable")
+            return
+
+        self.clients += 1
+        self.connections += 1
+        self.peak_clients = max(self.peak_clients, self.clients)
+        try:
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: multipart/x-mixed-replace;boundary=data-boundary--\r\n"
+                b"Connection: close\r\n\r\n"
+            )
+            await self._stream(writer)
+        except (ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            self.clients -= 1
+            writer.close()
+
+    async def _stream(self, writer):
+        interval = 0.0 if self.fast else 1.0 / self.fps
+        next_at = time.monotonic()
+        index = 0
+        silence = b"\xd5" * 320  # 40 ms of G.711 silence
+
+        while True:
+            for frame in self.frames:
+                timestamp = index / self.fps
+                part = self._part(b"video/x-h264", frame, timestamp)
+                if self.audio:
+                    part += self._part(b"audio/g711", silence, timestamp)
+                writer.write(part)
+                await writer.drain()
+                self.frames_sent += 1
+                self.bytes_sent += len(part)
+                index += 1
+
+                if interval:
+                    next_at += interval
+                    delay = next_at - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    elif delay < -1.0:
+                        next_at = time.monotonic()  # client fell behind; don't burst
+            if not self.loop:
+                return
+
+    @staticmethod
+    async def _reply(writer, status, extra_headers=""):
+        writer.write(
+            f"HTTP/1.1 {status}\r\n{extra_headers}Content-Length: 0\r\nConnection: close\r\n\r\n".encode()
+        )
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def serve(self, host, port, ssl_context):
+        server = await asyncio.start_server(self.handle, host, port, ssl=ssl_context)
+        async with server:
+            await server.serve_forever()
+
+    def start_in_thread(self, host, port, ssl_context):
+        """Run the server on a background event loop; returns once it is listening."""
+        ready = threading.Event()
+        errors = []
+
+        def run():
+            loop = asyncio.new_event_loop()
+            try:
+                server = loop.run_until_complete(
+                    asyncio.start_server(self.handle, host, port, ssl=ssl_context)
+                )
+            except OSError as e:
+                errors.append(e)
+                ready.set()
+                return
+            ready.set()
+            try:
+                loop.run_forever()
+            finally:
+                server.close()
+
+        threading.Thread(target=run, name="fake-camera", daemon=True).start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+
+
+def server_ssl_context(cert, key):
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ctx.load_cert_chain(cert, key)
+    return ctx
+
+
+def main():
+    p = argparse.ArgumentParser(
+        description="Fake TP-Link Kasa camera: replays .h264 recordings over HTTPS",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python fake_camera.py camera_stream.h264
+  python fake_camera.py camera_stream.h264 --port 19444 --fps 15
+  python fake_camera.py camera_stream.h264 --fast --max-clients 50
+        """,
+    )
+    p.add_argument("files", nargs="+", help="Raw H.264 recordings to replay (in order, looped)")
+    p.add_argument("--host", default="0.0.0.0")
+    p.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p.add_argument("--fps", type=float, default=DEFAULT_FPS, help=f"Realtime pacing (default: {DEFAULT_FPS:g})")
+    p.add_argument("--fast", action="store_true", help="Send as fast as each client reads")
+    p.add_argument("--once", action="store_true", help="End each stream after one pass")
+    p.add_argument("--user", default=None, help="Required username (default: accept any)")
+    p.add_argument("--password", default=None, help="Required password (with --user)")
+    p.add_argument("--max-clients", type=int, default=0, help="Reject clients beyond N (0 = unlimited)")
+    p.add_argument("--audio", action="store_true", help="Interleave G.711 audio parts like the camera")
+    p.add_argument("--cert", default=None, help="TLS certificate (default: self-signed)")
+    p.add_argument("--key", default=None, help="TLS private key")
+    args = p.parse_args()
+
+    frames = load_frames(args.files)
+    camera = FakeCamera(
+        frames, fps=args.fps, fast=args.fast, loop=not args.once,
+        username=args.user, password=args.password,
+        max_clients=args.max_clients, audio=args.audio,
+    )
+
+    tmp = None
+    cert, key = args.cert, args.key
+    if not cert:
+        tmp = tempfile.mkdtemp()
+        cert, key = make_self_signed_cert(tmp)
+
+    print("=" * 60)
+    print("  Fake TP-Link Kasa Camera")
+    print("=" * 60)
+    print(f"  Source  : {', '.join(args.files)} ({len(frames)} frames)")
+    print(f"  URL     : https://{args.host}:{args.port}{STREAM_PATH}")
+    print(f"  Pacing  : {'as fast as possible' if args.fast else f'{args.fps:g} fps'}"
+          f"{', once' if args.once else ', looped'}")
+    print(f"  Auth    : {args.user or 'any credentials'}")
+    print("=" * 60)
+
+    async def run():
+        async def report():
+            while True:
+                await asyncio.sleep(10)
+                print(f"  clients={camera.clients} (peak {camera.peak_clients}) "
+                      f"frames={camera.frames_sent} sent={camera.bytes_sent / 1e6:.1f} MB "
+                      f"rejected={camera.rejected}")
+        asyncio.ensure_future(report())
+        await camera.serve(args.host, args.port, server_ssl_context(cert, key))
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
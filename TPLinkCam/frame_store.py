@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+TP-Link Kasa Camera — Compact Decoded-Frame Store
+
+Bounded-memory replacement for the lists/deques of full BGR frames used by
+the motion monitors (pre-record ring + frames collected for a clip).  A
+1080p BGR frame is ~6 MB; the same frame as a JPEG is ~150-300 KB.
+
+- Frames are kept JPEG-encoded, optionally downscaled first
+- Once the in-memory bytes exceed `budget_bytes`, the oldest frames are
+  spilled to `spill_dir` (already-encoded bytes, so spilling is one write)
+- `maxlen` gives ring-buffer semantics (oldest frame dropped on append)
+- `memory_bytes` / `disk_bytes` per store, `FrameStore.total_memory()`
+  across every store in the process
+
+Indexing and iteration decode back to BGR arrays, so code written for a
+list of frames (`frames[i]`, `for f in frames`, `len(frames)`) works as is.
+A store is not thread-safe; it is owned by one thread at a time.
+"""
+
+import itertools
+import os
+import threading
+from collections import deque
+
+import cv2
+import numpy as np
+
+DEFAULT_BUDGET_MB = 64       # In-memory JPEG bytes per store before spilling
+DEFAULT_QUALITY = 85         # JPEG quality for stored frames
+DEFAULT_SCALE = 1.0          # Resize factor applied before encoding
+
+_store_ids = itertools.count(1)
+_total_lock = threading.Lock()
+_total_memory = 0
+
+
+def _account(delta):
+    global _total_memory
+    with _total_lock:
+        _total_memory += delta
+
+
+class FrameStore:
+    def __init__(self, budget_bytes=DEFAULT_BUDGET_MB * 1024 * 1024, spill_dir=None,
+                 quality=DEFAULT_QUALITY, scale=DEFAULT_SCALE, maxlen=None):
+        self.budget_bytes = budget_bytes
+        self.spill_dir = spill_dir
+        self.quality = quality
+        self.scale = scale
+        self.maxlen = maxlen
+
+        self._entries = deque()   # bytes (in memory) or str (path of a spilled frame)
+        self._resident = 0        # index of the first in-memory entry (older ones are spilled)
+        self._id = next(_store_ids)
+        self._seq = 0
+
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self.frames_spilled = 0
+
+    @staticmethod
+    def total_memory():
+        """In-memory bytes held by every FrameStore in the process."""
+        return _total_memory
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getitem__(self, idx):
+        return self._decode(self._entries[idx])
+
+    def __iter__(self):
+        for entry in list(self._entries):
+            yield self._decode(entry)
+
+    def append(self, frame):
+        """Encode and store a BGR frame."""
+        if self.scale != 1.0:
+            frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale,
+                               interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if ok:
+            self._append_encoded(buf.tobytes())
+
+    def copy(self, **kwargs):
+        """
+        New store holding the same frames (JPEG bytes are shared, spilled
+        frames are read back so the two stores never share files).
+        Settings default to this store's; override with keyword arguments.
+        """
+        settings = dict(budget_bytes=self.budget_bytes, spill_dir=self.spill_dir,
+                        quality=self.quality, scale=self.scale, maxlen=None)
+        settings.update(kwargs)
+        other = FrameStore(**settings)
+        for entry in list(self._entries):
+            other._append_encoded(self._read(entry))
+        return other
+
+    def clear(self):
+        """Drop every frame and delete spilled files."""
+        while self._entries:
+            self._pop_oldest()
+
+    close = clear
+
+    # --- internals ---
+    def _append_encoded(self, data):
+        if self.maxlen is not None and len(self._entries) >= self.maxlen:
+            self._pop_oldest()
+        self._entries.append(data)
+        self.memory_bytes += len(data)
+        _account(len(data))
+
+        while self.memory_bytes > self.budget_bytes and self._resident < len(self._entries) - 1:
+            self._spill_oldest()
+
+    def _spill_oldest(self):
+        data = self._entries[self._resident]
+        if self.spill_dir is None:
+            # Nowhere to spill: drop the frame rather than exceed the budget
+            del self._entries[self._resident]
+            self.memory_bytes -= len(data)
+            _account(-len(data))
+            return
+
+        os.makedirs(self.spill_dir, exist_ok=True)
+        self._seq += 1
+        path = os.path.join(self.spill_dir, f"_frame_{os.getpid()}_{self._id}_{self._seq}.jpg")
+        with open(path, "wb") as f:
+            f.write(data)
+
+        self._entries[self._resident] = path
+        self._resident += 1
+        self.memory_bytes -= len(data)
+        self.disk_bytes += len(data)
+        self.frames_spilled += 1
+        _account(-len(data))
+
+    def _pop_oldest(self):
+        entry = self._entries.popleft()
+        if isinstance(entry, str):
+            self._resident -= 1
+            try:
+                self.disk_bytes -= os.path.getsize(entry)
+                os.remove(entry)
+            except OSError:
+                pass
+        else:
+            self.memory_bytes -= len(entry)
+            _account(-len(entry))
+
+    @staticmethod
+    def _read(entry):
+        if isinstance(entry, str):
+            with open(entry, "rb") as f:
+                return f.read()
+        return entry
+
+    def _decode(self, entry):
+        return cv2.imdecode(np.frombuffer(self._read(entry), np.uint8), cv2.IMREAD_COLOR)
+
+    def __del__(self):
+        try:
+            self.clear()
+        except Exception:
+            pass
@@ -0,0 +1,809 @@
+#!/usr/bin/env python3
+"""
+TP-Link Kasa Camera — H.264 Stream Helpers
+
+Shared building blocks for the camera scripts (tplink_camera.py,
+motion_detect.py, motion_detect_v2.py):
+
+- Incremental parser for the camera's multipart/x-mixed-replace stream
+- NAL unit helpers and a GOP index (SPS/PPS + frames since the last IDR)
+- Bounded receiver -> processor frame queue that drops by NAL type
+- Compressed-domain activity filter based on P-frame sizes
+- Raw H.264 pre-record ring and passthrough (no re-encode) clip writer
+- Persistent H.264 decoder session (PyAV, ffmpeg pipe, or temp-file fallback)
+"""
+
+import os
+import queue
+import re
+import shutil
+import subprocess
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+# Optional in-process decoder
+try:
+    import av
+    HAS_AV = True
+except ImportError:
+    HAS_AV = False
+
+# ========================
+# Multipart H.264 Parser
+# ========================
+BOUNDARY = b"--data-boundary--"
+HEADER_END = b"\r\n\r\n"
+MAX_GARBAGE = 200000  # Bytes of non-boundary data kept while resyncing
+
+
+class MultipartH264Parser:
+    """
+    Incremental parser for the camera's multipart H.264 stream.
+
+    Incoming chunks are appended to a single ``bytearray`` and parsed in
+    place with a read cursor, so every byte is scanned once and copied
+    once (into the yielded frame).  Partially received headers or bodies
+    simply wait for the next chunk; the boundary / header search resumes
+    where it stopped instead of re-scanning the buffer.
+
+    Consumed bytes are released from the front of the buffer after each
+    chunk, which CPython implements without moving the remaining data.
+
+    Usage:
+        parser = MultipartH264Parser()
+        for chunk in response.iter_content(chunk_size=65536):
+            for frame in parser.feed(chunk):
+                ...
+    """
+
+    def __init__(self, boundary=BOUNDARY, max_garbage=MAX_GARBAGE):
+        self.boundary = boundary
+        self.max_garbage = max_garbage
+
+        self._buf = bytearray()
+        self._scan = 0            # where the next find() starts
+        self._header_start = -1   # set while waiting for the part headers
+        self._body_start = -1     # set while waiting for the part body
+        self._body_length = 0
+        self._is_video = False
+
+        self.bytes_received = 0
+        self.parts_parsed = 0
+
+    def feed(self, chunk):
+        """
+        Append a chunk and yield every complete H.264 frame it finishes.
+
+        Frames are yielded as ``bytes`` (one copy out of the receive
+        buffer); the generator must be exhausted before the next call.
+        """
+        buf = self._buf
+        buf += chunk
+        self.bytes_received += len(chunk)
+        pos = 0  # start of data not yet consumed
+
+        while True:
+            if self._body_start >= 0:
+                end = self._body_start + self._body_length
+                if len(buf) < end:
+                    break  # need more data for body
+
+                if self._is_video:
+                    with memoryview(buf) as view:
+                        frame = bytes(view[self._body_start:end])
+                    yield frame
+                self.parts_parsed += 1
+                pos = self._scan = end
+                self._body_start = -1
+                continue
+
+            if self._header_start >= 0:
+                header_end = buf.find(HEADER_END, self._scan)
+                if header_end == -1:
+                    if len(buf) - self._header_start > self.max_garbage:
+                        # No header terminator in sight — resync on next boundary
+                        self._header_start = -1
+                        pos = self._scan = len(buf)
+                        continue
+                    self._scan = max(self._header_start, len(buf) - len(HEADER_END) + 1)
+                    break  # need more data for headers
+
+                self._parse_headers(bytes(buf[self._header_start:header_end]))
+                self._header_start = -1
+                pos = self._scan = header_end + len(HEADER_END)
+                if self._body_length > 0:
+                    self._body_start = pos
+                continue
+
+            idx = buf.find(self.boundary, self._scan)
+            if idx == -1:
+                # Keep only enough of the tail to match a split boundary
+                self._scan = max(pos, len(buf) - len(self.boundary) + 1)
+                if len(buf) - pos > self.max_garbage:
+                    pos = self._scan
+                break
+
+            pos = idx
+            self._header_start = self._scan = idx + len(self.boundary)
+
+        if pos:
+            del buf[:pos]
+            self._scan -= pos
+            if self._header_start >= 0:
+                self._header_start -= pos
+            if self._body_start >= 0:
+                self._body_start -= pos
+
+    def _parse_headers(self, headers_raw):
+        content_length = 0
+        content_type = ""
+        for line in headers_raw.decode("latin-1").split("\r\n"):
+            lo = line.lower().strip()
+            if lo.startswith("content-length:"):
+                content_length = int(line.split(":", 1)[1].strip())
+            elif lo.startswith("content-type:"):
+                content_type = line.split(":", 1)[1].strip().lower()
+
+        self._body_length = content_length
+        self._is_video = "h264" in content_type or "video" in content_type
+
+    @property
+    def buffered(self):
+        """Bytes currently held in the receive buffer."""
+        return len(self._buf)
+
+
+def parse_h264_frames(response, chunk_size=65536):
+    """Generator yielding raw H.264 frame bytes from multipart stream."""
+    parser = MultipartH264Parser()
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        yield from parser.feed(chunk)
+
+
+# ========================
+# NAL Units / GOP Index
+# ========================
+START_CODE = b"\x00\x00\x01"
+
+NAL_SLICE = 1   # non-IDR picture (P/B)
+NAL_IDR = 5     # IDR picture (keyframe)
+NAL_SEI = 6
+NAL_SPS = 7
+NAL_PPS = 8
+NAL_AUD = 9
+
+
+def iter_nal_units(data):
+    """
+    Yield ``(nal_type, start, end)`` for each Annex-B NAL unit in data.
+    ``data[start:end]`` is the unit including its start code.
+    """
+    n = len(data)
+    idx = data.find(START_CODE)
+    while idx != -1 and idx + 3 < n:
+        start = idx - 1 if idx > 0 and data[idx - 1] == 0 else idx
+        nxt = data.find(START_CODE, idx + 3)
+        if nxt == -1:
+            end = n
+        else:
+            end = nxt - 1 if data[nxt - 1] == 0 else nxt
+        yield data[idx + 3] & 0x1F, start, end
+        idx = nxt
+
+
+def nal_types(data):
+    """List of NAL unit types contained in one H.264 frame."""
+    return [nal_type for nal_type, _, _ in iter_nal_units(data)]
+
+
+class GopBuffer:
+    """
+    Index of the current group of pictures.
+
+    Keeps the latest SPS/PPS and every frame since the most recent IDR,
+    which is exactly what a decoder needs to reproduce the newest picture.
+    Frames that arrive before the first IDR (or after an overflow) can't be
+    decoded and are dropped until the next IDR.
+
+    Args:
+        max_frames: Safety cap for streams that stop sending IDRs.
+    """
+
+    def __init__(self, max_frames=600):
+        self.max_frames = max_frames
+        self.sps = b""
+        self.pps = b""
+        self.frames = []
+        self.frames_waiting = 0   # dropped while waiting for an IDR
+        self.last_gop_length = 0  # length of the previous complete GOP
+        self.last_types = []
+
+    def push(self, data):
+        """Index one frame; returns its NAL unit types."""
+        types = []
+        for nal_type, start, end in iter_nal_units(data):
+            types.append(nal_type)
+            if nal_type == NAL_SPS:
+                self.sps = bytes(data[start:end])
+            elif nal_type == NAL_PPS:
+                self.pps = bytes(data[start:end])
+        self.last_types = types
+
+        if NAL_IDR in types:
+            if self.frames:
+                self.last_gop_length = len(self.frames)
+            self.frames = [data]
+        elif self.frames:
+            self.frames.append(data)
+            if len(self.frames) > self.max_frames:
+                self.frames = []  # lost sync — wait for the next IDR
+        elif NAL_SLICE in types:
+            self.frames_waiting += 1
+        return types
+
+    @property
+    def has_idr(self):
+        return bool(self.frames)
+
+    @property
+    def gop_length(self):
+        """Frames since (and including) the last IDR."""
+        return len(self.frames)
+
+    @property
+    def header(self):
+        return self.sps + self.pps
+
+    def snapshot(self):
+        """SPS + PPS + frames since the last IDR, ready to decode."""
+        if not self.frames:
+            return b""
+        return self.header + b"".join(self.frames)
+
+    def reset(self):
+        self.frames = []
+
+
+# ========================
+# Reference-Preserving Frame Queue
+# ========================
+def is_droppable(data):
+    """
+    True if nothing else references this frame: every slice in it has
+    nal_ref_idc == 0 and it carries no IDR/SPS/PPS.
+    """
+    slices = 0
+    for nal_type, start, end in iter_nal_units(data):
+        if nal_type in (NAL_IDR, NAL_SPS, NAL_PPS):
+            return False
+        if nal_type == NAL_SLICE:
+            header = data.find(START_CODE, start) + 3
+            if data[header] & 0x60:
+                return False
+            slices += 1
+    return slices > 0
+
+
+class H264FrameQueue:
+    """
+    Bounded receiver -> processor queue that drops frames by NAL type.
+
+    A plain queue.Queue drops whichever frame arrives when it is full, and
+    a missing reference frame smears every picture until the next IDR.
+    When this queue is full it degrades cleanly instead:
+
+    1. Queued non-reference frames (nal_ref_idc == 0) are discarded first,
+       then an incoming non-reference frame is dropped ("non_ref").
+    2. An incoming reference P-frame that doesn't fit starts a skip: it and
+       the rest of its GOP are dropped ("gop_tail") and the stream resumes
+       at the next IDR, so the decoder never sees a broken reference chain.
+    3. SPS/PPS/IDR frames are never dropped.  To admit one, queued P-frames
+       at the tail of the previous GOP are evicted ("evicted"); if there are
+       none it is queued over capacity ("overflow", not a drop).
+
+    `put()` never blocks, so the network reader keeps draining the socket.
+    `get()` matches queue.Queue (raises queue.Empty on timeout).
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._items = deque()          # (data, droppable, essential)
+        self._cond = threading.Condition()
+        self._skipping = False         # dropping a GOP tail, waiting for an IDR
+
+        self.frames_put = 0
+        self.overflow = 0
+        self.drops = {"non_ref": 0, "gop_tail": 0, "evicted": 0}
+
+    def put(self, data):
+        """Queue one frame; returns False if it was dropped."""
+        types = nal_types(data)
+        essential = NAL_IDR in types or NAL_SPS in types or NAL_PPS in types
+        droppable = not essential and is_droppable(data)
+
+        with self._cond:
+            self.frames_put += 1
+            if NAL_IDR in types:
+                self._skipping = False
+            elif self._skipping and NAL_SLICE in types:
+                self.drops["gop_tail"] += 1
+                return False
+
+            if len(self._items) >= self.maxsize:
+                self._evict_non_ref()
+            if len(self._items) >= self.maxsize:
+                if droppable:
+                    self.drops["non_ref"] += 1
+                    return False
+                if not essential:
+                    self._skipping = True
+                    self.drops["gop_tail"] += 1
+                    return False
+                self._evict_gop_tail()
+                if len(self._items) >= self.maxsize:
+                    self.overflow += 1
+
+            self._items.append((data, droppable, essential))
+            self._cond.notify()
+            return True
+
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items, timeout):
+                raise queue.Empty
+            return self._items.popleft()[0]
+
+    def qsize(self):
+        return len(self._items)
+
+    @property
+    def dropped(self):
+        return sum(self.drops.values())
+
+    def _evict_non_ref(self):
+        for i, (_, droppable, _) in enumerate(self._items):
+            if droppable:
+                del self._items[i]
+                self.drops["non_ref"] += 1
+                return
+
+    def _evict_gop_tail(self):
+        # Newest first, so what stays queued is still a decodable prefix
+        while self._items and not self._items[-1][2]:
+            self._items.pop()
+            self.drops["evicted"] += 1
+            if len(self._items) < self.maxsize:
+                return
+
+
+# ========================
+# Compressed-Domain Activity Filter
+# ========================
+class NalActivityFilter:
+    """
+    Estimates scene activity from the sizes of incoming P-frames.
+
+    A static scene compresses to small, steady P-frames; anything moving
+    makes them spike.  The filter learns a per-camera baseline (running
+    mean and mean absolute deviation of P-frame sizes) and reports the
+    scene as active when a frame exceeds ``mean + sensitivity * deviation``.
+    While inactive the caller can skip pixel decoding entirely.
+
+    Args:
+        sensitivity: Deviations above the baseline that count as activity.
+        learning_rate: Weight of each new P-frame in the baseline.
+        warmup_frames: P-frames to learn from before filtering anything.
+        hold_seconds: Stay active this long after the last spike.
+        refresh_seconds: Report active briefly this often even when static,
+                         so the pixel motion detector's reference stays fresh.
+    """
+
+    def __init__(self, sensitivity=4.0, learning_rate=0.02, warmup_frames=150,
+                 hold_seconds=2.0, refresh_seconds=60.0):
+        self.sensitivity = sensitivity
+        self.learning_rate = learning_rate
+        self.warmup_frames = warmup_frames
+        self.hold_seconds = hold_seconds
+        self.refresh_seconds = refresh_seconds
+
+        self.mean = 0.0
+        self.deviation = 0.0
+        self.samples = 0
+        self.active_until = 0.0
+        self.last_refresh = 0.0
+
+        self.frames_active = 0
+        self.frames_static = 0
+        self.spikes = 0
+
+    def update(self, data, now=None):
+        """Feed one H.264 frame; returns True while the scene looks active."""
+        now = time.time() if now is None else now
+        types = nal_types(data)
+
+        if NAL_SLICE in types and NAL_IDR not in types:
+            size = len(data)
+            if self.samples < self.warmup_frames:
+                self._learn(size, self.learning_rate * 5)
+                self.active_until = now + self.hold_seconds
+            else:
+                limit = self.mean + self.sensitivity * max(self.deviation, 0.05 * self.mean)
+                if size > limit:
+                    self.spikes += 1
+                    self.active_until = now + self.hold_seconds
+                    # Keep adapting (slowly) so a lasting change, e.g. rain,
+                    # doesn't pin the filter open forever
+                    self._learn(size, self.learning_rate * 0.1)
+                else:
+                    self._learn(size, self.learning_rate)
+
+        if now - self.last_refresh >= self.refresh_seconds:
+            self.last_refresh = now
+            self.active_until = max(self.active_until, now + self.hold_seconds)
+
+        active = now < self.active_until
+        if active:
+            self.frames_active += 1
+        else:
+            self.frames_static += 1
+        return active
+
+    def _learn(self, size, rate):
+        if self.samples == 0:
+            self.mean = float(size)
+        else:
+            self.deviation += rate * (abs(size - self.mean) - self.deviation)
+            self.mean += rate * (size - self.mean)
+        self.samples += 1
+
+
+# ========================
+# Passthrough Clip Recording
+# ========================
+class H264ClipRing:
+    """
+    Pre-record ring of raw H.264 frames for passthrough clip recording.
+
+    Holds the compressed frames of at least the last `seconds`, always
+    starting at an IDR so the clip is decodable from its first frame.
+    Whole GOPs are dropped from the front once the next IDR is itself
+    older than the window.
+
+    Args:
+        seconds: Pre-record window.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.frames = deque()   # (timestamp, data)
+        self._idrs = deque()    # (seq, timestamp) of each IDR in the ring
+        self._seq_first = 0     # sequence number of frames[0]
+        self._seq_next = 0
+        self.bytes_used = 0
+
+    def push(self, data, types, now=None):
+        """Add one frame (types: its NAL unit types, e.g. GopBuffer.last_types)."""
+        now = time.time() if now is None else now
+        is_idr = NAL_IDR in types
+        if not self.frames and not is_idr:
+            return  # a clip can't start before the first IDR
+
+        if is_idr:
+            self._idrs.append((self._seq_next, now))
+        self.frames.append((now, data))
+        self._seq_next += 1
+        self.bytes_used += len(data)
+
+        # Drop the oldest GOP once the next one alone covers the window
+        while len(self._idrs) >= 2 and self._idrs[1][1] <= now - self.seconds:
+            self._idrs.popleft()
+            next_start = self._idrs[0][0]
+            while self._seq_first < next_start:
+                _, old = self.frames.popleft()
+                self.bytes_used -= len(old)
+                self._seq_first += 1
+
+    @property
+    def fps(self):
+        """Frame rate measured over the ring (falls back to 30)."""
+        if len(self.frames) < 2:
+            return 30.0
+        span = self.frames[-1][0] - self.frames[0][0]
+        return min(60.0, max(1.0, (len(self.frames) - 1) / span)) if span > 0 else 30.0
+
+    def snapshot(self, header=b""):
+        """Frames in the ring as a list, prefixed by SPS/PPS `header`."""
+        clip = [header] if header else []
+        clip.extend(data for _, data in self.frames)
+        return clip
+
+
+def write_h264_clip(frames, path_base, fps=30.0):
+    """
+    Write raw H.264 frames as a clip without re-encoding.
+
+    The stream is remuxed into `path_base`.mp4 with `ffmpeg -c copy`
+    (near-zero CPU, original resolution and frame rate).  Without ffmpeg,
+    or if the remux fails, the raw `path_base`.h264 is kept instead
+    (plays in VLC/ffplay).  Returns the path written.
+    """
+    raw_path = path_base + ".h264"
+    with open(raw_path, "wb") as f:
+        for data in frames:
+            f.write(data)
+
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        return raw_path
+
+    mp4_path = path_base + ".mp4"
+    result = subprocess.run(
+        [ffmpeg, "-y", "-hide_banner", "-loglevel", "error",
+         "-framerate", f"{fps:.3f}", "-f", "h264", "-i", raw_path,
+         "-c", "copy", "-movflags", "+faststart", mp4_path],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    if result.returncode != 0:
+        return raw_path
+    os.remove(raw_path)
+    return mp4_path
+
+
+# ========================
+# H.264 Decoder
+# ========================
+def decode_latest_frame(h264_data, tmp_path):
+    """
+    Write accumulated H.264 data to a temp file and decode the last frame.
+    Returns the decoded frame (numpy array) or None.
+    """
+    with open(tmp_path, "wb") as f:
+        f.write(h264_data)
+
+    cap = cv2.VideoCapture(tmp_path, cv2.CAP_FFMPEG)
+    if not cap.isOpened():
+        return None
+
+    last_frame = None
+    while True:
+        ok, frm = cap.read()
+        if not ok:
+            break
+        last_frame = frm
+    cap.release()
+    return last_frame
+
+
+class H264Decoder:
+    """
+    Long-lived H.264 decoder session for one camera.
+
+    NAL units are pushed in as they arrive and each one is decoded exactly
+    once; ``read()`` hands out the newest decoded frame.  This replaces the
+    old pattern of re-writing the whole buffer to a temp file and decoding
+    it from the start on every refresh.
+
+    Every frame is indexed in a GopBuffer.  Nothing reaches the backend
+    until the first IDR (so there are no garbled frames after a connect),
+    a restarted backend is primed from SPS/PPS + the current GOP, and the
+    "file" backend only ever re-decodes the current GOP.
+
+    Backends (picked automatically, best first):
+        "av"     — PyAV codec context, in-process, no copies through a pipe
+        "ffmpeg" — persistent ffmpeg subprocess, raw BGR frames over a pipe
+        "file"   — legacy temp-file re-decode, used when neither is available
+
+    PyAV is preferred because a frame is only converted to BGR when it is
+    read.  The ffmpeg pipe converts and copies every frame it outputs — a
+    1080p bgr24 frame is ~6 MB, ~180 MB/s per camera at 30 fps — so callers
+    that only read every Nth frame should pass ``output_every=N`` to have
+    ffmpeg drop the rest before conversion (every frame is still decoded,
+    as later frames reference it).
+
+    Args:
+        backend: Force a backend ("av", "ffmpeg" or "file").
+        tmp_path: Temp file for the "file" backend.
+        max_gop_frames: Cap on the GOP index for streams without IDRs.
+        output_every: "ffmpeg" backend: output only every Nth decoded frame.
+    """
+
+    def __init__(self, backend=None, tmp_path=None, max_gop_frames=600, output_every=1):
+        if backend is None:
+            if HAS_AV:
+                backend = "av"
+            elif shutil.which("ffmpeg"):
+                backend = "ffmpeg"
+            else:
+                backend = "file"
+        self.backend = backend
+        self.tmp_path = tmp_path or os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "_decode_buffer.h264"
+        )
+        self.gop = GopBuffer(max_frames=max_gop_frames)
+        self.output_every = max(1, int(output_every))
+
+        self.frames_pushed = 0
+        self.frames_decoded = 0
+        self.frames_skipped = 0
+        self.decode_errors = 0
+        self.restarts = 0
+
+        self._lock = threading.Lock()
+        self._latest = None       # newest decoded frame not yet read
+        self._codec = None        # "av"
+        self._proc = None         # "ffmpeg"
+        self._size = None
+        self._synced = False      # backend has been fed from an IDR
+        self._file_dirty = False  # "file": GOP changed since last read
+
+        self._open()
+
+    # --------------------------------------------------
+    # Public API
+    # --------------------------------------------------
+    def push(self, data, decode=True):
+        """
+        Feed one H.264 frame (one or more Annex-B NAL units).
+
+        With ``decode=False`` the frame is only indexed; the next decoded
+        push catches up from SPS/PPS + the latest IDR.
+        """
+        self.frames_pushed += 1
+        self.gop.push(data)
+
+        if not decode:
+            self.frames_skipped += 1
+            self._synced = False
+            return
+        if not self.gop.has_idr:
+            self._synced = False
+            return  # nothing decodable until the next IDR
+        if not self._synced:
+            # First IDR (or resync) — start from SPS/PPS + current GOP
+            data = self.gop.snapshot()
+            self._synced = True
+
+        if self.backend == "av":
+            self._push_av(data)
+        elif self.backend == "ffmpeg":
+            self._push_ffmpeg(data)
+        else:
+            self._file_dirty = True
+
+    def resync(self):
+        """Re-feed the backend from SPS/PPS + the current GOP on next push."""
+        self._synced = False
+
+    def read(self):
+        """
+        Return the newest frame decoded since the last call (BGR ndarray),
+        or None if nothing new has been decoded.
+        """
+        if self.backend == "file":
+            if not self._file_dirty:
+                return None
+            self._file_dirty = False
+            frame = decode_latest_frame(self.gop.snapshot(), self.tmp_path)
+            if frame is not None:
+                self.frames_decoded += 1
+            return frame
+
+        with self._lock:
+            latest, self._latest = self._latest, None
+        if latest is None:
+            return None
+        if self.backend == "av":
+            return latest.to_ndarray(format="bgr24")
+        data, (w, h) = latest  # size of the ffmpeg process that produced it
+        return np.frombuffer(data, dtype=np.uint8).reshape(h, w, 3)
+
+    def close(self):
+        if self._proc is not None:
+            proc, self._proc = self._proc, None
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+            proc.kill()
+            proc.wait()
+        self._codec = None
+        if self.backend == "file" and os.path.exists(self.tmp_path):
+            try:
+                os.remove(self.tmp_path)
+            except OSError:
+                pass
+
+    # --------------------------------------------------
+    # Backends
+    # --------------------------------------------------
+    def _open(self):
+        if self.backend == "av":
+            self._codec = av.CodecContext.create("h264", "r")
+        elif self.backend == "ffmpeg":
+            self._start_ffmpeg()
+
+    def _push_av(self, data):
+        try:
+            for packet in self._codec.parse(data):
+                for frame in self._codec.decode(packet):
+                    self.frames_decoded += 1
+                    with self._lock:
+                        self._latest = frame
+        except Exception:
+            # Corrupt/partial data — the next IDR recovers the session
+            self.decode_errors += 1
+
+    def _start_ffmpeg(self):
+        cmd = [
+            shutil.which("ffmpeg") or "ffmpeg", "-hide_banner", "-loglevel", "info",
+            "-fflags", "nobuffer", "-flags", "low_delay",
+            # Input always starts at SPS/PPS + IDR, so a short probe is enough
+            "-probesize", "32768", "-analyzeduration", "0",
+            "-f", "h264", "-i", "pipe:0",
+            "-vsync", "passthrough",
+        ]
+        if self.output_every > 1:
+            # Drop unread frames inside ffmpeg, before the bgr24 conversion
+            cmd += ["-vf", f"select=not(mod(n\\,{self.output_every}))"]
+        cmd += ["-f", "rawvideo", "-pix_fmt", "bgr24", "pipe:1"]
+        self._size = None
+        with self._lock:
+            self._latest = None  # a frame from the old process may have another size
+        self._proc = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            bufsize=0,
+        )
+        size_ready = threading.Event()
+        threading.Thread(
+            target=self._ffmpeg_stderr, args=(self._proc, size_ready), daemon=True
+        ).start()
+        threading.Thread(
+            target=self._ffmpeg_stdout, args=(self._proc, size_ready), daemon=True
+        ).start()
+
+    def _ffmpeg_stderr(self, proc, size_ready):
+        """Drain ffmpeg's log, picking the output frame size out of it."""
+        pattern = re.compile(rb"Video: rawvideo.*?(\d{2,5})x(\d{2,5})")
+        for line in proc.stderr:
+            if not size_ready.is_set():
+                m = pattern.search(line)
+                if m:
+                    self._size = (int(m.group(1)), int(m.group(2)))
+                    size_ready.set()
+        size_ready.set()  # process exited — unblock the reader
+
+    def _ffmpeg_stdout(self, proc, size_ready):
+        size_ready.wait()
+        if self._size is None:
+            return
+        size = self._size
+        frame_bytes = size[0] * size[1] * 3
+        while True:
+            # The pipe is unbuffered (~64 KB per read): fill one preallocated
+            # buffer in place instead of concatenating ~100 chunks per frame
+            data = bytearray(frame_bytes)
+            view = memoryview(data)
+            got = 0
+            while got < frame_bytes:
+                n = proc.stdout.readinto(view[got:])
+                if not n:
+                    return
+                got += n
+            self.frames_decoded += 1
+            with self._lock:
+                self._latest = (data, size)
+
+    def _push_ffmpeg(self, data):
+        if self._proc is None or self._proc.poll() is not None:
+            self.close()
+            self.restarts += 1
+            self._start_ffmpeg()
+            data = self.gop.snapshot()
+        try:
+            self._proc.stdin.write(data)
+        except (BrokenPipeError, OSError):
+            self.decode_errors += 1
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+TP-Link Kasa Camera — asyncio Ingestion Engine
+
+Holds every camera's HTTPS stream on one asyncio event loop and feeds the
+frames to a small shared pool of processing threads, instead of one
+receiver thread + one processor thread (and a blocking `requests` session)
+per camera.  A box watching 20 cameras runs 1 loop thread + `workers`
+processing threads rather than 40 threads contending for the GIL.
+
+Works with the CameraMonitor classes of motion_detect.py and
+motion_detect_v2.py, which expose the processing steps the pool drives:
+
+    monitor.start_processing()        # decoder, buffers, recording state
+    monitor.process_frame(h264_frame) # one H.264 frame
+    monitor.check_idle()              # no frames lately (finalize clips)
+    monitor.stop_processing()
+
+Frames go through each monitor's H264FrameQueue, and a camera is handled
+by at most one worker at a time, so per-camera state needs no locking.
+
+Usage:
+    engine = IngestEngine(monitors, workers=4)
+    engine.start()
+    ...
+    engine.stop()
+"""
+
+import asyncio
+import base64
+import os
+import queue
+import ssl
+import threading
+import time
+
+from h264_stream import MultipartH264Parser
+from tracing import tracer
+
+STREAM_PATH = "/https/stream/mixed?video=h264&audio=g711&resolution=hd"
+DEFAULT_WORKERS = max(2, min(4, os.cpu_count() or 2))  # Shared processing threads
+DEFAULT_CHUNK_SIZE = 65536
+DEFAULT_BATCH = 30               # Frames a worker processes per camera before rotating
+RECONNECT_DELAY = 10             # Seconds between reconnect attempts
+IDLE_INTERVAL = 1.0              # Seconds between check_idle() passes
+
+
+# ========================
+# Async Camera Connection
+# ========================
+def camera_ssl_context():
+    """TLS context for the cameras' old, self-signed certificates."""
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    ctx.check_hostname = False
+    ctx.verify_mode = ssl.CERT_NONE
+    ctx.set_ciphers("ALL:@SECLEVEL=0")
+    return ctx
+
+
+async def open_camera_stream(host, port, username, password, path=STREAM_PATH,
+                             ssl_context=None, timeout=15):
+    """
+    Connect and send the stream request. Returns (reader, writer, headers)
+    once the camera answers 200; raises ConnectionError otherwise.
+
+    Like the requests-based clients, the password is sent base64-encoded
+    inside HTTP basic auth.
+    """
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(host, port, ssl=ssl_context or camera_ssl_context()),
+        timeout,
+    )
+    password_b64 = base64.b64encode(password.encode()).decode()
+    token = base64.b64encode(f"{username}:{password_b64}".encode()).decode()
+    writer.write(
+        f"GET {path} HTTP/1.1\r\n"
+        f"Host: {host}:{port}\r\n"
+        f"Authorization: Basic {token}\r\n"
+        f"Connection: keep-alive\r\n\r\n".encode()
+    )
+    await writer.drain()
+
+    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+    lines = head.decode("latin-1").split("\r\n")
+    status = lines[0].split(" ", 2)
+    if len(status) < 2 or status[1] != "200":
+        writer.close()
+        raise ConnectionError(f"HTTP {' '.join(status[1:]) or lines[0]}")
+
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            key, value = line.split(":", 1)
+            headers[key.strip().lower()] = value.strip()
+    return reader, writer, headers
+
+
+async def iter_body(reader, headers, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the response body in chunks, undoing chunked transfer-encoding."""
+    if "chunked" not in headers.get("transfer-encoding", "").lower():
+        while True:
+            data = await reader.read(chunk_size)
+            if not data:
+                return
+            yield data
+
+    while True:
+        size_line = await reader.readuntil(b"\r\n")
+        size = int(size_line.split(b";", 1)[0], 16)
+        if size == 0:
+            return
+        data = await reader.readexactly(size + 2)
+        yield data[:-2]
+
+
+# ========================
+# Shared Processing Pool
+# ========================
+class ProcessorPool:
+    """
+    Worker threads that run CameraMonitor processing for many cameras.
+
+    A camera is scheduled when frames arrive (or for an idle check); a
+    worker drains up to `batch` of its frames and re-schedules it if more
+    are waiting, so busy cameras can't starve the others.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, batch=DEFAULT_BATCH):
+        self.batch = batch
+        self.ready = queue.Queue()
+        self._scheduled = {}  # monitor -> time.perf_counter() when queued
+        self._lock = threading.Lock()
+
+        self.frames_processed = 0
+        self.errors = 0
+
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"processor-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def schedule(self, monitor):
+        """Queue a camera for processing unless it is already queued or running."""
+        with self._lock:
+            if monitor in self._scheduled:
+                return
+            self._scheduled[monitor] = time.perf_counter()
+        self.ready.put(monitor)
+
+    def _worker(self):
+        while True:
+            monitor = self.ready.get()
+            if monitor is None:
+                break
+
+            processed = 0
+            tracer.add(monitor.ip, "queue_wait", self._scheduled[monitor], time.perf_counter())
+            try:
+                while processed < self.batch:
+                    try:
+                        h264_frame = monitor.frame_queue.get(timeout=0)
+                    except queue.Empty:
+                        break
+                    with tracer.span(monitor.ip, "frame"):
+                        monitor.process_frame(h264_frame)
+                    processed += 1
+                if not processed:
+                    monitor.check_idle()
+            except Exception as e:
+                self.errors += 1
+                print(f"  [{monitor.ip}] Processor error: {e}")
+
+            with self._lock:
+                del self._scheduled[monitor]
+                self.frames_processed += processed
+            if monitor.frame_queue.qsize():
+                self.schedule(monitor)
+
+    def shutdown(self):
+        for _ in self._threads:
+            self.ready.put(None)
+        for t in self._threads:
+            t.join()
+
+
+# ========================
+# Ingestion Engine
+# ========================
+class IngestEngine:
+    """
+    One asyncio loop (in a background thread) receiving every camera's
+    stream, plus a ProcessorPool doing the decoding and detection.
+    """
+
+    def __init__(self, monitors, workers=DEFAULT_WORKERS, chunk_size=DEFAULT_CHUNK_SIZE,
+                 reconnect_delay=RECONNECT_DELAY, path=STREAM_PATH):
+        self.monitors = list(monitors)
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.reconnect_delay = reconnect_delay
+        self.path = path
+
+        self.running = False
+        self.pool = None
+        self.connects = 0
+        self._loop = None
+        self._thread = None
+        self._tasks = []
+
+    def start(self):
+        self.running = True
+        for m in self.monitors:
+            m.running = True
+            m.start_processing()
+        self.pool = ProcessorPool(self.workers)
+        self._thread = threading.Thread(target=self._run_loop, name="ingest-loop", daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._main())
+        finally:
+            self._loop.close()
+
+    async def _main(self):
+        tasks = [asyncio.ensure_future(self._camera(m)) for m in self.monitors]
+        tasks.append(asyncio.ensure_future(self._idle_ticker()))
+        self._tasks = tasks
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _camera(self, m):
+        while self.running and m.running:
+            m.status = "connecting"
+            writer = None
+            try:
+                reader, writer, headers = await open_camera_stream(
+                    m.ip, m.port, m.username, m.password, path=self.path
+                )
+                self.connects += 1
+                m.status = "streaming"
+                print(f"  [{m.ip}] Connected! Receiving on the shared event loop.")
+
+                parser = MultipartH264Parser()
+                async for chunk in iter_body(reader, headers, self.chunk_size):
+                    for h264_frame in parser.feed(chunk):
+                        m.frame_queue.put(h264_frame)
+                        m.frames_received += 1
+                        m.bytes_received += len(h264_frame)
+                    if m.frame_queue.qsize():
+                        self.pool.schedule(m)
+                    if not (self.running and m.running):
+                        break
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                m.status = f"error: {e}"
+                print(f"  [{m.ip}] Receiver Error: {e!r}")
+            finally:
+                if writer is not None:
+                    writer.close()
+
+            if self.running and m.running:
+                m.status = "reconnecting"
+                m.reconnects += 1
+                print(f"  [{m.ip}] Reconnecting in {self.reconnect_delay}s...")
+                await asyncio.sleep(self.reconnect_delay)
+
+    async def _idle_ticker(self):
+        while self.running:
+            await asyncio.sleep(IDLE_INTERVAL)
+            for m in self.monitors:
+                self.pool.schedule(m)
+
+    def stop(self):
+        """Close the streams, let the workers finish, then release each monitor."""
+        self.running = False
+        for m in self.monitors:
+            m.running = False
+        if self._loop is not None and self._loop.is_running():
+            for task in self._tasks:
+                self._loop.call_soon_threadsafe(task.cancel)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.pool.shutdown()
+        for m in self.monitors:
+            m.stop_processing()
+
+    @property
+    def threads(self):
+        """OS threads used for ingestion + processing."""
+        return 1 + self.workers
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+TP-Link Kasa Camera — Prometheus Metrics Endpoint
+
+Serves the CameraMonitor fleet's counters in the Prometheus text format
+(GET /metrics) from a small background HTTP server in the monitor process.
+
+The counters are plain attributes on each CameraMonitor, each written by a
+single thread (receiver or processor) and only read here, so recording a
+sample is an integer add — no locks on the hot path.  A scrape may see a
+histogram's count one sample ahead of its sum, which Prometheus tolerates.
+
+Alert on cameras that silently stop decoding with e.g.
+
+    time() - tplink_camera_last_decode_timestamp_seconds > 120
+    rate(tplink_camera_frames_decoded_total[5m]) == 0
+
+Usage:
+    python motion_detect.py --metrics-port 9108
+    curl http://localhost:9108/metrics
+"""
+
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from frame_store import FrameStore
+
+# Latency buckets in seconds (decode / motion detect / AI)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram with a single writer."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+class _Writer:
+    """Collects samples per metric family (the text format wants each family contiguous)."""
+
+    def __init__(self):
+        self.families = {}  # name -> lines, in first-declared order
+
+    def declare(self, name, kind, doc):
+        if name not in self.families:
+            self.families[name] = [f"# HELP {name} {doc}", f"# TYPE {name} {kind}"]
+        return self.families[name]
+
+    def sample(self, name, kind, doc, value, **labels):
+        self.declare(name, kind, doc).append(f"{name}{_labels(**labels) if labels else ''} {value}")
+
+    def histogram(self, name, doc, hist, **labels):
+        lines = self.declare(name, "histogram", doc)
+        cumulative = 0
+        for bound, n in zip(hist.buckets, hist.counts):
+            cumulative += n
+            lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}")
+        cumulative += hist.counts[-1]
+        lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {cumulative}")
+        lines.append(f"{name}_sum{_labels(**labels)} {hist.sum}")
+        lines.append(f"{name}_count{_labels(**labels)} {cumulative}")
+
+    def text(self):
+        return "\n".join(line for lines in self.families.values() for line in lines) + "\n"
+
+
+def render(monitors, clip_writer=None, detector_service=None):
+    """Prometheus text exposition for every monitor (plus shared services)."""
+    w = _Writer()
+    p = "tplink_camera_"
+    for m in monitors:
+        cam = m.ip
+        w.sample(p + "up", "gauge", "1 while the stream is connected", int(m.status == "streaming"), camera=cam)
+        w.sample(p + "bytes_received_total", "counter", "H.264 payload bytes received", m.bytes_received, camera=cam)
+        w.sample(p + "frames_received_total", "counter", "H.264 frames received", m.frames_received, camera=cam)
+        w.sample(p + "frames_decoded_total", "counter", "Frames decoded to pixels", m.frames_decoded, camera=cam)
+        w.sample(p + "frames_skipped_total", "counter", "Frames skipped by the pre-filter", m.frames_skipped, camera=cam)
+        for reason, n in m.frame_queue.drops.items():
+            w.sample(p + "frames_dropped_total", "counter", "Frames dropped by the receiver queue",
+                     n, camera=cam, reason=reason)
+        w.sample(p + "queue_depth", "gauge", "Frames waiting for the processor", m.frame_queue.qsize(), camera=cam)
+        w.sample(p + "clips_saved_total", "counter", "Motion clips saved", m.motions_saved, camera=cam)
+        w.sample(p + "reconnects_total", "counter", "Stream reconnect attempts", m.reconnects, camera=cam)
+        w.sample(p + "buffer_bytes", "gauge", "Decoded-frame buffer bytes in memory", m.buffer_bytes, camera=cam)
+        w.sample(p + "last_decode_timestamp_seconds", "gauge", "Unix time of the last decoded frame",
+                 m.last_decode_time, camera=cam)
+        w.histogram(p + "decode_seconds", "Decode time per decoded frame", m.decode_latency, camera=cam)
+        w.histogram(p + "detect_seconds", "Motion detection time per frame", m.detect_latency, camera=cam)
+        ai_latency = getattr(m, "ai_latency", None)
+        if ai_latency is not None:
+            w.histogram(p + "ai_seconds", "AI confirmation latency (submit to result)", ai_latency, camera=cam)
+
+    w.sample("tplink_frame_buffer_bytes", "gauge", "Decoded-frame buffer bytes, all cameras",
+             FrameStore.total_memory())
+    if clip_writer is not None:
+        w.sample("tplink_clip_writer_queued", "gauge", "Clips waiting to be written", clip_writer.queued)
+        w.sample("tplink_clip_writer_active", "gauge", "Clips being written", clip_writer.active)
+        w.sample("tplink_clip_writer_completed_total", "counter", "Clips written", clip_writer.completed)
+        w.sample("tplink_clip_writer_failed_total", "counter", "Clip writes that failed", clip_writer.failed)
+        w.sample("tplink_clip_writer_blocked_seconds_total", "counter",
+                 "Time cameras waited for a free writer slot", clip_writer.blocked_seconds)
+    if detector_service is not None:
+        svc = detector_service
+        w.sample("tplink_ai_requests_total", "counter", "AI requests submitted", svc.submitted)
+        w.sample("tplink_ai_completed_total", "counter", "AI requests completed", svc.completed)
+        w.sample("tplink_ai_rejected_total", "counter", "AI requests rejected (queue full)", svc.rejected)
+        w.sample("tplink_ai_batches_total", "counter", "AI forward passes", svc.batches)
+        w.sample("tplink_ai_ready", "gauge", "1 once the AI model is loaded", int(svc.ready.is_set()))
+    return w.text()
+
+
+class MetricsServer:
+    """
+    Background HTTP server for GET /metrics.
+
+    `sources` is a callable returning keyword arguments for render(), so
+    services created later (e.g. the lazily created detector service) show
+    up without restarting the server.  `routes` adds debug endpoints:
+    {path: handler(query) -> (content_type, text)} (see tracing.http_routes).
+    """
+
+    def __init__(self, port, sources, host="0.0.0.0", routes=None):
+        self.port = port
+        self.sources = sources
+        self.routes = dict(routes or {})
+        self.started = time.time()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if url.path == "/metrics":
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                    body = render(**server.sources()).encode()
+                elif url.path in server.routes:
+                    content_type, text = server.routes[url.path](parse_qs(url.query))
+                    body = text.encode()
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                pass  # keep the monitor's console readable
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name="metrics", daemon=True).start()
+        print(f"[*] Metrics on http://0.0.0.0:{self.port}/metrics")
+
+    def stop(self):
+        self.httpd.shutdown()
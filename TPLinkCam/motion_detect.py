@@ -35,10 +35,23 @@ import argparse
 import datetime
 import urllib3
 import requests.adapters
-from collections import deque
 import queue
 from urllib3.util.ssl_ import create_urllib3_context
 
+from h264_stream import (
+    parse_h264_frames, H264Decoder, NalActivityFilter, H264ClipRing, write_h264_clip,
+    H264FrameQueue,
+)
+from frame_store import FrameStore, DEFAULT_QUALITY as DEFAULT_BUFFER_QUALITY
+from clip_writer import ClipWriterPool, DEFAULT_WRITERS, DEFAULT_WRITER_QUEUE
+from ingest import IngestEngine, DEFAULT_WORKERS
+from metrics import Histogram, MetricsServer
+from tracing import tracer, http_routes, install_signal_handlers, DEFAULT_SPANS
+from motion import (
+    MotionDetector, load_tuning, DEFAULT_MODE as DEFAULT_MOTION_MODE, DEFAULT_FAST_WIDTH,
+    MODES as MOTION_MODES, DEFAULT_BACKGROUND, DEFAULT_BG_RATE, BACKGROUNDS,
+)
+
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 # ========================
@@ -56,6 +69,9 @@ DEFAULT_COOLDOWN = 5         # Seconds of quiet before finalising a clip
 DEFAULT_PRE_RECORD = 5       # Seconds of footage to keep BEFORE motion
 DEFAULT_POST_RECORD = 3      # Reduced to 3s to avoid large files and potential overhead
 DEFAULT_DECODE_INTERVAL = 10 # Decode every N H.264 frames (~3 decoded fps)
+DEFAULT_CLIP_FORMAT = "mp4"  # mp4: original H.264 stream, no re-encode | avi: decoded frames as XVID
+DEFAULT_BUFFER_MB = 64       # In-memory budget per decoded-frame buffer (excess spills to disk)
+DEFAULT_BUFFER_SCALE = 1.0   # Resize decoded frames before buffering (0.5 = quarter the pixels)
 
 
 # ========================
@@ -105,121 +121,6 @@ def connect_camera_stream(ip, port, username, password):
         return None
 
 
-def parse_h264_frames(response):
-    """Generator yielding raw H.264 frame bytes from multipart stream."""
-    boundary = b"--data-boundary--"
-    buffer = b""
-
-    for chunk in response.iter_content(chunk_size=65536):
-        buffer += chunk
-
-        while True:
-            idx = buffer.find(boundary)
-            if idx == -1:
-                if len(buffer) > 200000:
-                    buffer = buffer[-100000:]
-                break
-
-            after = buffer[idx + len(boundary):]
-            header_end = after.find(b"\r\n\r\n")
-            if header_end == -1:
-                break
-
-            headers_raw = after[:header_end].decode("latin-1")
-            body_start = header_end + 4
-
-            content_length = 0
-            content_type = ""
-            for line in headers_raw.split("\r\n"):
-                lo = line.lower().strip()
-                if lo.startswith("content-length:"):
-                    content_length = int(line.split(":", 1)[1].strip())
-                elif lo.startswith("content-type:"):
-                    content_type = line.split(":", 1)[1].strip()
-
-            if content_length == 0:
-                buffer = after[body_start:]
-                continue
-
-            if len(after) < body_start + content_length:
-                break
-
-            frame_data = after[body_start : body_start + content_length]
-            buffer = after[body_start + content_length:]
-
-            if "h264" in content_type.lower() or "video" in content_type.lower():
-                yield frame_data
-
-
-def decode_latest_frame(h264_data, tmp_path):
-    """
-    Write accumulated H.264 data to a temp file and decode the last frame.
-    Returns the decoded frame (numpy array) or None.
-    """
-    with open(tmp_path, "wb") as f:
-        f.write(h264_data)
-
-    cap = cv2.VideoCapture(tmp_path, cv2.CAP_FFMPEG)
-    if not cap.isOpened():
-        return None
-
-    last_frame = None
-    while True:
-        ok, frm = cap.read()
-        if not ok:
-            break
-        last_frame = frm
-    cap.release()
-    return last_frame
-
-
-# ========================
-# Motion Detector
-# ========================
-class MotionDetector:
-    """
-    Simple frame-differencing motion detector.
-    Compares consecutive decoded frames and triggers when enough
-    pixels have changed beyond a threshold.
-    """
-
-    def __init__(self, threshold=DEFAULT_THRESHOLD, min_area=DEFAULT_MIN_AREA):
-        self.threshold = threshold
-        self.min_area = min_area
-        self.prev_gray = None
-
-    def detect(self, frame):
-        """
-        Check for motion between this frame and the previous one.
-
-        Returns:
-            (motion_detected: bool, motion_area: int, diff_frame: ndarray)
-        """
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        gray = cv2.GaussianBlur(gray, (21, 21), 0)
-
-        if self.prev_gray is None:
-            self.prev_gray = gray
-            return False, 0, None
-
-        delta = cv2.absdiff(self.prev_gray, gray)
-        thresh = cv2.threshold(delta, self.threshold, 255, cv2.THRESH_BINARY)[1]
-        thresh = cv2.dilate(thresh, None, iterations=2)
-
-        contours, _ = cv2.findContours(
-            thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
-        )
-
-        total_area = 0
-        for c in contours:
-            area = cv2.contourArea(c)
-            if area > self.min_area:
-                total_area += area
-
-        self.prev_gray = gray
-        return total_area > 0, total_area, thresh
-
-
 # ========================
 # Per-Camera Monitor
 # ========================
@@ -232,13 +133,35 @@ class CameraMonitor(threading.Thread):
     already contains `pre_record` seconds of footage leading up to
     the event.  After motion stops, recording continues for
     `post_record` seconds so the clip has context on both sides.
+
+    Clips are saved in `clip_format` "mp4" by default: the camera's own
+    H.264 frames (full frame rate, no re-encode) are kept in a raw
+    pre-record ring that starts at an IDR and remuxed on save.  "avi"
+    re-encodes the decoded frames as before.
+
+    Decoded frames (pre-record ring and the frames collected for a clip)
+    live in JPEG-compressed FrameStores with a `buffer_mb` memory budget
+    each; a long event spills to `<cam_dir>/_spill` instead of growing RAM.
+
+    Finished clips are handed to `clip_writer` (a shared ClipWriterPool) so
+    decoding and detection continue while they are written; without one
+    they are saved inline.
+
+    With `prefilter` enabled, P-frame sizes are watched in the
+    compressed domain and pixel decoding is skipped entirely while
+    the scene is static (see h264_stream.NalActivityFilter).
     """
 
     def __init__(self, ip, output_dir, port=DEFAULT_PORT,
                  username=DEFAULT_USERNAME, password=DEFAULT_PASSWORD,
                  threshold=DEFAULT_THRESHOLD, min_area=DEFAULT_MIN_AREA,
                  cooldown=DEFAULT_COOLDOWN, decode_interval=DEFAULT_DECODE_INTERVAL,
-                 pre_record=DEFAULT_PRE_RECORD, post_record=DEFAULT_POST_RECORD):
+                 pre_record=DEFAULT_PRE_RECORD, post_record=DEFAULT_POST_RECORD,
+                 prefilter=False, clip_format=DEFAULT_CLIP_FORMAT,
+                 buffer_mb=DEFAULT_BUFFER_MB, buffer_quality=DEFAULT_BUFFER_QUALITY,
+                 buffer_scale=DEFAULT_BUFFER_SCALE, clip_writer=None,
+                 motion_mode=DEFAULT_MOTION_MODE, motion_width=DEFAULT_FAST_WIDTH,
+                 background=DEFAULT_BACKGROUND, bg_rate=DEFAULT_BG_RATE):
         super().__init__(daemon=True)
         self.ip = ip
         self.port = port
@@ -251,11 +174,28 @@ class CameraMonitor(threading.Thread):
         self.decode_interval = decode_interval
         self.pre_record = pre_record
         self.post_record = post_record
+        self.prefilter = prefilter
+        self.clip_format = clip_format
+        self.buffer_mb = buffer_mb
+        self.buffer_quality = buffer_quality
+        self.buffer_scale = buffer_scale
+        self.clip_writer = clip_writer
+        self.motion_mode = motion_mode
+        self.motion_width = motion_width
+        self.background = background
+        self.bg_rate = bg_rate
 
         self.running = False
         self.frames_received = 0
         self.frames_decoded = 0
+        self.frames_skipped = 0
         self.motions_saved = 0
+        self.bytes_received = 0
+        self.reconnects = 0
+        self.last_decode_time = 0.0
+        self._decode_seconds = 0.0       # decoder time since the last decoded frame
+        self.decode_latency = Histogram()
+        self.detect_latency = Histogram()
         self.last_motion_time = 0
         self.status = "starting"
 
@@ -267,16 +207,33 @@ class CameraMonitor(threading.Thread):
         # Temp file for H.264 decoding
         self.tmp_path = os.path.join(cam_dir, "_decode_buffer.h264")
 
+        # Decoded frames over the memory budget are spilled here
+        self.spill_dir = os.path.join(cam_dir, "_spill")
+        self.frame_stores = []
+
         # Estimated decoded FPS  (camera ~30 raw fps / decode_interval)
         self._decoded_fps = max(1.0, 30.0 / decode_interval)
 
+        # Receiver -> processor hand-off
+        self.frame_queue = H264FrameQueue(maxsize=2000)
+
+    @property
+    def buffer_bytes(self):
+        """In-memory bytes held by this camera's decoded-frame buffers."""
+        return sum(store.memory_bytes for store in self.frame_stores)
+
+    def _new_frame_store(self, maxlen=None):
+        return FrameStore(
+            budget_bytes=self.buffer_mb * 1024 * 1024, spill_dir=self.spill_dir,
+            quality=self.buffer_quality, scale=self.buffer_scale, maxlen=maxlen,
+        )
+
     def run(self):
         """Main loop: starts receiver and processor threads."""
         self.running = True
-        self.frame_queue = queue.Queue(maxsize=2000)
 
         # Start the processing thread
-        processor = threading.Thread(target=self._processor_loop, daemon=True)
+        processor = threading.Thread(target=self._processor_loop, name=f"processor-{self.ip}", daemon=True)
         processor.start()
 
         # Receiver loop (runs in this thread)
@@ -289,6 +246,7 @@ class CameraMonitor(threading.Thread):
 
             if self.running:
                 self.status = "reconnecting"
+                self.reconnects += 1
                 print(f"  [{self.ip}] Reconnecting in 10s...")
                 time.sleep(10)
 
@@ -311,125 +269,195 @@ class CameraMonitor(threading.Thread):
             if not self.running:
                 break
             
-            try:
-                # Use a small timeout so we can check self.running regularly
-                self.frame_queue.put(h264_frame, timeout=0.1)
-                self.frames_received += 1
-            except queue.Full:
-                # If queue is full, we are lagging significantly. 
-                # Drop frames to keep the network connection alive?
-                # Actually, dropping H.264 frames mid-stream causes corruption.
-                # But blocking the network causes disconnect.
-                # We'll wait a bit and try again, but if it stays full, we're in trouble.
-                pass
+            # Never blocks: if the processor lags, the queue sheds
+            # non-reference frames / GOP tails and resumes at the next IDR
+            self.frame_queue.put(h264_frame)
+            self.frames_received += 1
+            self.bytes_received += len(h264_frame)
 
     def _processor_loop(self):
         """Dedicated loop for decoding, detecting motion, and saving clips."""
-        detector = MotionDetector(
-            threshold=self.threshold, min_area=self.min_area
-        )
-        
-        # --- Decoder buffer management ---
-        h264_buf = b""
-        h264_header = b""  # Store SPS/PPS so resets don't break decoding
-        h264_count = 0
-
-        # --- Ring buffer: always keeps the last `pre_record` seconds ---
-        ring_size = max(10, int(self._decoded_fps * self.pre_record))
-        ring_buffer = deque(maxlen=ring_size)
-
-        # --- Recording state ---
-        recording = False           # currently saving a clip?
-        motion_clip_frames = []     # frames collected for current clip
-        last_motion_at = 0.0        # timestamp of most recent motion frame
-        clip_start_time = None      # when recording started (for logging)
-
-        print(f"  [{self.ip}] Processor started. Pre-record: {self.pre_record}s | Post-record: {self.post_record}s")
+        self.start_processing()
 
         while self.running:
             try:
                 # Get frame from queue
+                t0 = time.perf_counter()
                 try:
                     h264_frame = self.frame_queue.get(timeout=1.0)
                 except queue.Empty:
-                    # If we are recording and no frames arrive for a while, finalize the clip
-                    if recording and (time.time() - last_motion_at >= self.post_record):
-                        print(f"  [{self.ip}] Finalizing clip due to inactivity/disconnect.")
-                        total_seconds = time.time() - clip_start_time
-                        self._save_motion_event(motion_clip_frames, total_seconds)
-                        recording = False
-                        motion_clip_frames = []
-                        h264_buf = h264_header
-                        h264_count = 0
+                    self.check_idle()
                     continue
+                tracer.add(self.ip, "queue_wait", t0, time.perf_counter())
+                with tracer.span(self.ip, "frame"):
+                    self.process_frame(h264_frame)
+            except Exception as e:
+                print(f"  [{self.ip}] Processor loop error: {e}")
+                time.sleep(1)
 
-                # Capture SPS/PPS header
-                if not h264_header and len(h264_frame) > 4:
-                    nal_type = h264_frame[4] & 0x1F
-                    if nal_type in (7, 8):
-                        h264_header += h264_frame
+        self.stop_processing()
 
-                h264_buf += h264_frame
-                h264_count += 1
+    # ---- Processing steps (also driven by ingest.IngestEngine's worker pool) ----
+    def start_processing(self):
+        """Create the decoder, buffers and recording state."""
+        self.detector = MotionDetector(
+            threshold=self.threshold, min_area=self.min_area,
+            mode=self.motion_mode, width=self.motion_width,
+            background=self.background, bg_rate=self.bg_rate,
+        )
 
-                # Reset buffer periodically
-                if h264_count > 300 and not recording:
-                    h264_buf = h264_header + h264_frame
-                    h264_count = 1
+        # --- Persistent decoder session (each frame decoded once) ---
+        self.decoder = H264Decoder(tmp_path=self.tmp_path, output_every=self.decode_interval)
+        self.h264_count = 0
 
-                # Decode periodically
-                if h264_count % self.decode_interval != 0:
-                    continue
+        # --- Optional compressed-domain pre-filter ---
+        self.activity = NalActivityFilter() if self.prefilter else None
 
-                frame = decode_latest_frame(h264_buf, self.tmp_path)
-                if frame is None:
-                    continue
+        # --- Ring buffer: always keeps the last `pre_record` seconds ---
+        ring_size = max(10, int(self._decoded_fps * self.pre_record))
+        self.ring_buffer = self._new_frame_store(maxlen=ring_size)
 
-                self.frames_decoded += 1
-                now = time.time()
-
-                # Always push into ring buffer
-                ring_buffer.append((now, frame.copy()))
-
-                # Run motion detection
-                motion, area, _ = detector.detect(frame)
-
-                if motion:
-                    self.last_motion_time = now
-                    last_motion_at = now
-
-                    if not recording:
-                        recording = True
-                        clip_start_time = now
-                        motion_clip_frames = [f.copy() for (_, f) in ring_buffer]
-                        print(
-                            f"  [{self.ip}] >>> STARTING CLIP: Motion detected (Area={area:.0f}) "
-                            f"at {datetime.datetime.now():%H:%M:%S}"
-                        )
-                    else:
-                        motion_clip_frames.append(frame.copy())
-
-                elif recording:
-                    motion_clip_frames.append(frame.copy())
-                    silence_duration = now - last_motion_at
-                    if silence_duration >= self.post_record:
-                        total_seconds = now - clip_start_time
-                        self._save_motion_event(motion_clip_frames, total_seconds)
-                        recording = False
-                        motion_clip_frames = []
-                        h264_buf = h264_header
-                        h264_count = 0
-                
-                self.frame_queue.task_done()
-            except Exception as e:
-                print(f"  [{self.ip}] Processor loop error: {e}")
-                time.sleep(1)
+        # --- Raw H.264 ring for passthrough clips (starts at an IDR) ---
+        self.raw_ring = H264ClipRing(self.pre_record) if self.clip_format == "mp4" else None
+
+        # --- Recording state ---
+        self.recording = False           # currently saving a clip?
+        self.motion_clip_frames = None   # FrameStore of frames collected for current clip
+        self.frame_stores = [self.ring_buffer]
+        self.raw_clip = None             # raw H.264 frames for current clip
+        self.raw_fps = 30.0              # stream frame rate measured by the raw ring
+        self.last_motion_at = 0.0        # timestamp of most recent motion frame
+        self.clip_start_time = None      # when recording started (for logging)
 
-    def _save_motion_event(self, frames, clip_duration=0):
+        print(
+            f"  [{self.ip}] Processor started. Pre-record: {self.pre_record}s | "
+            f"Post-record: {self.post_record}s | Decoder: {self.decoder.backend}"
+        )
+
+    def check_idle(self):
+        """No frames arriving: finalize the clip once post-record has elapsed."""
+        if self.recording and (time.time() - self.last_motion_at >= self.post_record):
+            print(f"  [{self.ip}] Finalizing clip due to inactivity/disconnect.")
+            self._end_clip(time.time())
+
+    def process_frame(self, h264_frame):
+        """Index/decode one H.264 frame and run motion detection on it."""
+        decoder = self.decoder
+
+        # Static scene: index the frame but skip decode + detection
+        if self.activity is not None and not self.recording:
+            if not self.activity.update(h264_frame):
+                decoder.push(h264_frame, decode=False)
+                if self.raw_ring is not None:
+                    self.raw_ring.push(h264_frame, decoder.gop.last_types)
+                self.frames_skipped += 1
+                return
+
+        t0 = time.perf_counter()
+        decoder.push(h264_frame)
+        t1 = time.perf_counter()
+        self._decode_seconds += t1 - t0
+        tracer.add(self.ip, "decode", t0, t1)
+        self.h264_count += 1
+
+        # Keep every compressed frame for passthrough clips
+        if self.raw_ring is not None:
+            self.raw_ring.push(h264_frame, decoder.gop.last_types)
+            if self.raw_clip is not None:
+                self.raw_clip.append(h264_frame)
+
+        # Grab the newest decoded frame periodically
+        if self.h264_count % self.decode_interval != 0:
+            return
+
+        t0 = time.perf_counter()
+        frame = decoder.read()
+        t1 = time.perf_counter()
+        tracer.add(self.ip, "decode", t0, t1)
+        if frame is None:
+            return
+        self.decode_latency.observe(self._decode_seconds + t1 - t0)
+        self._decode_seconds = 0.0
+
+        self.frames_decoded += 1
+        now = time.time()
+        self.last_decode_time = now
+
+        # Always push into ring buffer
+        with tracer.span(self.ip, "append"):
+            self.ring_buffer.append(frame)
+
+        # Run motion detection
+        t0 = time.perf_counter()
+        motion, area, _ = self.detector.detect(frame)
+        t1 = time.perf_counter()
+        self.detect_latency.observe(t1 - t0)
+        tracer.add(self.ip, "motion", t0, t1)
+
+        if motion:
+            self.last_motion_time = now
+            self.last_motion_at = now
+
+            if not self.recording:
+                self.recording = True
+                self.clip_start_time = now
+                self.motion_clip_frames = self.ring_buffer.copy()
+                self.frame_stores = [self.ring_buffer, self.motion_clip_frames]
+                if self.raw_ring is not None:
+                    self.raw_clip = self.raw_ring.snapshot(header=decoder.gop.header)
+                    self.raw_fps = self.raw_ring.fps
+                print(
+                    f"  [{self.ip}] >>> STARTING CLIP: Motion detected (Area={area:.0f}) "
+                    f"at {datetime.datetime.now():%H:%M:%S}"
+                )
+            else:
+                with tracer.span(self.ip, "append"):
+                    self.motion_clip_frames.append(frame)
+
+        elif self.recording:
+            with tracer.span(self.ip, "append"):
+                self.motion_clip_frames.append(frame)
+            silence_duration = now - self.last_motion_at
+            if silence_duration >= self.post_record:
+                self._end_clip(now)
+
+    def stop_processing(self):
+        self.decoder.close()
+        for store in self.frame_stores:
+            store.close()
+
+    def _end_clip(self, now):
+        total_seconds = now - self.clip_start_time
+        with tracer.span(self.ip, "finalize"):
+            self._queue_clip(self.motion_clip_frames, total_seconds, self.raw_clip, self.raw_fps)
+        self.recording = False
+        self.motion_clip_frames = None
+        self.frame_stores = [self.ring_buffer]
+        self.raw_clip = None
+
+    def _queue_clip(self, frames, clip_duration, raw_clip, raw_fps):
+        """Hand a finished clip to the writer pool (or save it inline). Takes ownership of `frames`."""
+        if self.clip_writer is None:
+            self._write_clip(frames, clip_duration, raw_clip, raw_fps)
+        else:
+            self.clip_writer.submit(self._write_clip, frames, clip_duration, raw_clip, raw_fps)
+
+    def _write_clip(self, frames, clip_duration, raw_clip, raw_fps):
+        try:
+            with tracer.span(self.ip, "clip_write"):
+                self._save_motion_event(frames, clip_duration, raw_clip, raw_fps)
+        except Exception as e:
+            print(f"  [{self.ip}] Clip save error: {e}")
+            raise
+        finally:
+            frames.close()
+
+    def _save_motion_event(self, frames, clip_duration=0, raw_clip=None, raw_fps=30.0):
         """
         Save collected motion frames as:
           - A JPEG snapshot (first frame with actual motion = after pre-buffer)
-          - An AVI video clip of all frames
+          - An MP4 clip of the original H.264 stream (`raw_clip`, no re-encode),
+            or an AVI video clip of all decoded frames
         """
         if not frames:
             return
@@ -445,22 +473,30 @@ class CameraMonitor(threading.Thread):
         cv2.imwrite(jpg_path, frames[snap_idx], [cv2.IMWRITE_JPEG_QUALITY, 90])
 
         # Video clip
-        h, w = frames[0].shape[:2]
-        clip_path = os.path.join(date_dir, f"clip_{timestamp}.avi")
-        writer = cv2.VideoWriter(
-            clip_path,
-            cv2.VideoWriter_fourcc(*"XVID"),
-            self._decoded_fps,
-            (w, h),
-        )
-        for f in frames:
-            writer.write(f)
-        writer.release()
+        if raw_clip:
+            # Passthrough: remux the camera's own H.264 frames
+            clip_path = write_h264_clip(
+                raw_clip, os.path.join(date_dir, f"clip_{timestamp}"), raw_fps
+            )
+            frame_count, fps = len(raw_clip), raw_fps
+        else:
+            h, w = frames[0].shape[:2]
+            clip_path = os.path.join(date_dir, f"clip_{timestamp}.avi")
+            writer = cv2.VideoWriter(
+                clip_path,
+                cv2.VideoWriter_fourcc(*"XVID"),
+                self._decoded_fps,
+                (w, h),
+            )
+            for f in frames:
+                writer.write(f)
+            writer.release()
+            frame_count, fps = len(frames), self._decoded_fps
 
         self.motions_saved += 1
-        est_seconds = len(frames) / self._decoded_fps
+        est_seconds = frame_count / fps
         print(
-            f"  [{self.ip}] Saved clip: {len(frames)} frames "
+            f"  [{self.ip}] Saved clip: {frame_count} frames "
             f"(~{est_seconds:.1f}s) -> {clip_path}"
         )
 
@@ -471,7 +507,7 @@ class CameraMonitor(threading.Thread):
 # ========================
 # Main Monitor Manager
 # ========================
-def status_printer(monitors, interval=30):
+def status_printer(monitors, interval=30, clip_writer=None):
     """Periodically print status of all camera monitors."""
     while True:
         time.sleep(interval)
@@ -484,10 +520,16 @@ def status_printer(monitors, interval=30):
             )
             print(
                 f"  [{m.ip}] {m.status} | "
-                f"recv={m.frames_received} decoded={m.frames_decoded} | "
+                f"recv={m.frames_received} decoded={m.frames_decoded} "
+                f"skipped={m.frames_skipped} | "
+                f"queue={m.frame_queue.qsize()} dropped={m.frame_queue.drops} | "
+                f"buffers={m.buffer_bytes / 1e6:.1f}MB | "
                 f"motions_saved={m.motions_saved} | "
                 f"last_motion={last_motion}"
             )
+        print(f"  Frame buffers (all cameras): {FrameStore.total_memory() / 1e6:.1f} MB in memory")
+        if clip_writer is not None:
+            print(f"  Clip writer: {clip_writer.stats()}")
         print()
 
 
@@ -502,6 +544,8 @@ Examples:
   python motion_detect.py --threshold 20 --min-area 1500
   python motion_detect.py --pre-record 10 --post-record 15
   python motion_detect.py --output D:/SecurityFootage
+  python motion_detect.py --prefilter
+  python motion_detect.py --engine threads
         """,
     )
     p.add_argument(
@@ -539,10 +583,81 @@ Examples:
         "--decode-interval", type=int, default=DEFAULT_DECODE_INTERVAL,
         help=f"Decode every N H.264 frames (default: {DEFAULT_DECODE_INTERVAL})",
     )
+    p.add_argument(
+        "--clip-format", choices=["mp4", "avi"], default=DEFAULT_CLIP_FORMAT,
+        help="mp4: original H.264 stream, no re-encode; avi: decoded frames re-encoded as XVID "
+             f"(default: {DEFAULT_CLIP_FORMAT})",
+    )
+    p.add_argument(
+        "--buffer-mb", type=int, default=DEFAULT_BUFFER_MB,
+        help="In-memory budget (MB) per decoded-frame buffer before spilling to disk "
+             f"(default: {DEFAULT_BUFFER_MB})",
+    )
+    p.add_argument(
+        "--buffer-quality", type=int, default=DEFAULT_BUFFER_QUALITY,
+        help=f"JPEG quality of buffered decoded frames (default: {DEFAULT_BUFFER_QUALITY})",
+    )
+    p.add_argument(
+        "--buffer-scale", type=float, default=DEFAULT_BUFFER_SCALE,
+        help=f"Resize buffered decoded frames by this factor (default: {DEFAULT_BUFFER_SCALE})",
+    )
+    p.add_argument(
+        "--engine", choices=["asyncio", "threads"], default="asyncio",
+        help="asyncio: all streams on one event loop + shared worker pool; "
+             "threads: receiver + processor thread per camera (default: asyncio)",
+    )
+    p.add_argument(
+        "--workers", type=int, default=DEFAULT_WORKERS,
+        help=f"Processing threads shared by all cameras with --engine asyncio (default: {DEFAULT_WORKERS})",
+    )
+    p.add_argument(
+        "--writers", type=int, default=DEFAULT_WRITERS,
+        help=f"Background clip writer threads, 0 = save inline (default: {DEFAULT_WRITERS})",
+    )
+    p.add_argument(
+        "--writer-queue", type=int, default=DEFAULT_WRITER_QUEUE,
+        help=f"Clips waiting to be written before detection blocks (default: {DEFAULT_WRITER_QUEUE})",
+    )
+    p.add_argument(
+        "--prefilter", action="store_true",
+        help="Skip decoding while P-frame sizes show a static scene",
+    )
+    p.add_argument(
+        "--motion-mode", choices=MOTION_MODES, default=DEFAULT_MOTION_MODE,
+        help="full: detect on the full frame; fast: on a downscaled frame (default: full)",
+    )
+    p.add_argument(
+        "--motion-width", type=int, default=DEFAULT_FAST_WIDTH,
+        help=f"Analysis width of --motion-mode fast (default: {DEFAULT_FAST_WIDTH})",
+    )
+    p.add_argument(
+        "--background", choices=BACKGROUNDS, default=DEFAULT_BACKGROUND,
+        help="Background model: previous frame, running average, or MOG2 (default: frame)",
+    )
+    p.add_argument(
+        "--bg-rate", type=float, default=DEFAULT_BG_RATE,
+        help=f"Background learning rate per decoded frame (default: {DEFAULT_BG_RATE})",
+    )
+    p.add_argument(
+        "--tuning", default=None,
+        help="JSON file of per-camera motion settings (see motion.load_tuning)",
+    )
     p.add_argument(
         "--status-interval", type=int, default=60,
         help="Print status every N seconds (default: 60)",
     )
+    p.add_argument(
+        "--metrics-port", type=int, default=0,
+        help="Serve Prometheus metrics (and /trace, /profile) on this port (default: off)",
+    )
+    p.add_argument(
+        "--trace", action="store_true",
+        help="Record per-frame processing spans (export via /trace or SIGUSR1)",
+    )
+    p.add_argument(
+        "--trace-spans", type=int, default=DEFAULT_SPANS,
+        help=f"Spans kept in the trace ring buffer (default: {DEFAULT_SPANS})",
+    )
     return p.parse_args()
 
 
@@ -559,34 +674,81 @@ def main():
     print(f"  Pre-record  : {args.pre_record}s")
     print(f"  Post-record : {args.post_record}s")
     print(f"  Decode every: {args.decode_interval} frames")
+    print(f"  Pre-filter  : {'ON' if args.prefilter else 'OFF'}")
+    print(f"  Motion mode : {args.motion_mode}"
+          + (f" ({args.motion_width} px wide)" if args.motion_mode == "fast" else ""))
+    print(f"  Background  : {args.background}"
+          + (f" (rate {args.bg_rate:g})" if args.background != "frame" else ""))
+    if args.tuning:
+        print(f"  Tuning      : {args.tuning}")
+    print(f"  Clip format : {args.clip_format}")
+    print(f"  Frame buffer: {args.buffer_mb} MB, JPEG q{args.buffer_quality}, x{args.buffer_scale}")
+    print(f"  Clip writers: {args.writers or 'inline'}")
+    print(f"  Engine      : {args.engine}"
+          + (f" ({args.workers} workers)" if args.engine == "asyncio" else ""))
     print("=" * 60)
 
     os.makedirs(args.output, exist_ok=True)
+    if args.trace:
+        tracer.enable(args.trace_spans)
+    install_signal_handlers(args.output)
 
-    # Start a monitor thread for each camera
+    clip_writer = (
+        ClipWriterPool(workers=args.writers, max_pending=args.writer_queue)
+        if args.writers > 0 else None
+    )
+
+    tuning = load_tuning(args.tuning) if args.tuning else {}
+
+    # One monitor per camera
     monitors = []
     for ip in args.cameras:
+        # Motion settings: command line, then the camera's entry in --tuning
+        motion_settings = dict(
+            threshold=args.threshold,
+            min_area=args.min_area,
+            motion_mode=args.motion_mode,
+            motion_width=args.motion_width,
+            background=args.background,
+            bg_rate=args.bg_rate,
+        )
+        motion_settings.update(tuning.get(ip, {}))
         m = CameraMonitor(
             ip=ip,
             output_dir=args.output,
             port=args.port,
             username=args.user,
             password=args.password,
-            threshold=args.threshold,
-            min_area=args.min_area,
             cooldown=args.cooldown,
             decode_interval=args.decode_interval,
             pre_record=args.pre_record,
             post_record=args.post_record,
+            prefilter=args.prefilter,
+            clip_format=args.clip_format,
+            buffer_mb=args.buffer_mb,
+            buffer_quality=args.buffer_quality,
+            buffer_scale=args.buffer_scale,
+            clip_writer=clip_writer,
+            **motion_settings,
         )
         monitors.append(m)
-        m.start()
-        print(f"  Started monitor for {ip}")
-        time.sleep(2)  # Stagger connections
+        if args.engine == "threads":
+            m.start()
+            print(f"  Started monitor for {ip}")
+            time.sleep(2)  # Stagger connections
+
+    engine = None
+    if args.engine == "asyncio":
+        engine = IngestEngine(monitors, workers=args.workers)
+        engine.start()
+
+    if args.metrics_port:
+        MetricsServer(args.metrics_port, lambda: dict(monitors=monitors, clip_writer=clip_writer),
+                      routes=http_routes()).start()
 
     # Status printer thread
     status_thread = threading.Thread(
-        target=status_printer, args=(monitors, args.status_interval), daemon=True
+        target=status_printer, args=(monitors, args.status_interval, clip_writer), daemon=True
     )
     status_thread.start()
 
@@ -597,9 +759,15 @@ def main():
             time.sleep(1)
     except KeyboardInterrupt:
         print("\n[*] Stopping monitors...")
-        for m in monitors:
-            m.stop()
-        time.sleep(2)
+        if engine is not None:
+            engine.stop()
+        else:
+            for m in monitors:
+                m.stop()
+            time.sleep(2)
+        if clip_writer is not None and clip_writer.pending:
+            print(f"[*] Waiting for {clip_writer.pending} clip(s) to finish writing...")
+            clip_writer.shutdown(wait=True)
         print("[+] Done.")
 
 
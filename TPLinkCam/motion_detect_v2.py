@@ -8,7 +8,8 @@ from wind, trees, and small lighting changes.
 
 Features:
 - Dual-thread architecture (Receiver/Processor)
-- Torchvision-based Object Detection (Person, Dog, Cat)
+- Torchvision-based Object Detection (Person, Dog, Cat), optionally on
+  ONNX Runtime / int8 (see detector_backends.py)
 - Higher sensitivity thresholds for outdoor/noisy environments
 """
 
@@ -26,17 +27,24 @@ import datetime
 import urllib3
 import requests.adapters
 import queue
-from collections import deque
+from concurrent.futures import Future
 from urllib3.util.ssl_ import create_urllib3_context
 
-# Optional AI imports
-try:
-    import torch
-    import torchvision
-    from torchvision.models.detection import ssdlite320_mobilenet_v3_large, SSDLite320_MobileNet_V3_Large_Weights
-    HAS_AI = True
-except ImportError:
-    HAS_AI = False
+from h264_stream import (
+    parse_h264_frames, H264Decoder, NalActivityFilter, H264ClipRing, write_h264_clip,
+    H264FrameQueue,
+)
+from frame_store import FrameStore, DEFAULT_QUALITY as DEFAULT_BUFFER_QUALITY
+from clip_writer import ClipWriterPool, DEFAULT_WRITERS, DEFAULT_WRITER_QUEUE
+from ingest import IngestEngine, DEFAULT_WORKERS
+from metrics import Histogram, MetricsServer
+from tracing import tracer, http_routes, install_signal_handlers, DEFAULT_SPANS
+from motion import (
+    MotionDetector, load_tuning, DEFAULT_MODE as DEFAULT_MOTION_MODE, DEFAULT_FAST_WIDTH,
+    MODES as MOTION_MODES, DEFAULT_BACKGROUND, DEFAULT_BG_RATE, BACKGROUNDS,
+)
+
+from detector_backends import create_backend, BACKENDS
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -56,10 +64,23 @@ DEFAULT_COOLDOWN = 5         # Seconds of quiet before finalising a clip
 DEFAULT_PRE_RECORD = 5       # Seconds of footage to keep BEFORE motion
 DEFAULT_POST_RECORD = 3      # Seconds of footage to keep AFTER motion
 DEFAULT_DECODE_INTERVAL = 15 # Decode every N H.264 frames (~2 decoded fps)
+DEFAULT_CLIP_FORMAT = "mp4"  # mp4: original H.264 stream, no re-encode | avi: decoded frames as XVID
+DEFAULT_BUFFER_MB = 64       # In-memory budget per decoded-frame buffer (excess spills to disk)
+DEFAULT_BUFFER_SCALE = 1.0   # Resize decoded frames before buffering
 
 # AI Object Filtering
 DEFAULT_AI_CLASSES = [1, 17, 18] # 1: person, 17: cat, 18: dog (COCO indices)
 DEFAULT_AI_THRESHOLD = 0.45      # Minimum confidence for AI detection
+DEFAULT_AI_BACKEND = "torch"     # torch | onnx | onnx-int8 (see detector_backends.py)
+DEFAULT_AI_LOAD = "warmup"       # warmup: load in background at startup | lazy: on first motion
+DEFAULT_AI_QUEUE = 32            # Max pending requests to the shared detector
+DEFAULT_AI_BATCH = 8             # Max frames per batched forward pass
+DEFAULT_AI_BATCH_WAIT = 0.02     # Seconds to wait for more requests to fill a batch
+DEFAULT_AI_WAIT = 5.0            # Seconds to wait for a pending AI result at clip end
+DEFAULT_AI_MAX_ROIS = 3          # Motion regions cropped per frame (largest first)
+DEFAULT_AI_ROI_PAD = 0.25        # Context added around each motion box (fraction of size)
+DEFAULT_AI_ROI_MIN = 320         # Smallest crop side in pixels (the model's input size)
+DEFAULT_AI_ROI_MAX_COVER = 0.6   # Above this fraction of the frame, just use the full frame
 
 
 # ========================
@@ -107,68 +128,46 @@ def connect_camera_stream(ip, port, username, password):
         return None
 
 
-def parse_h264_frames(response):
-    """Generator yielding raw H.264 frame bytes from multipart stream."""
-    boundary = b"--data-boundary--"
-    buffer = b""
-
-    for chunk in response.iter_content(chunk_size=65536):
-        buffer += chunk
-
-        while True:
-            idx = buffer.find(boundary)
-            if idx == -1:
-                if len(buffer) > 200000:
-                    buffer = buffer[-100000:]
-                break
-
-            after = buffer[idx + len(boundary):]
-            header_end = after.find(b"\r\n\r\n")
-            if header_end == -1:
-                break
-
-            headers_raw = after[:header_end].decode("latin-1")
-            body_start = header_end + 4
-
-            content_length = 0
-            content_type = ""
-            for line in headers_raw.split("\r\n"):
-                lo = line.lower().strip()
-                if lo.startswith("content-length:"):
-                    content_length = int(line.split(":", 1)[1].strip())
-                elif lo.startswith("content-type:"):
-                    content_type = line.split(":", 1)[1].strip()
-
-            if content_length == 0:
-                buffer = after[body_start:]
-                continue
+def motion_crops(boxes, frame_shape, max_crops=DEFAULT_AI_MAX_ROIS, pad=DEFAULT_AI_ROI_PAD,
+                 min_size=DEFAULT_AI_ROI_MIN, max_cover=DEFAULT_AI_ROI_MAX_COVER):
+    """
+    Turn motion boxes (x, y, w, h) into square-ish crop regions (x0, y0, x1, y1).
 
-            if len(after) < body_start + content_length:
+    The largest `max_crops` boxes are padded, grown to at least `min_size`
+    and merged where they overlap.  Returns None when there are no boxes or
+    the crops would cover most of the frame anyway (use the full frame).
+    """
+    if not boxes:
+        return None
+    frame_h, frame_w = frame_shape[:2]
+    regions = []
+    for x, y, w, h in sorted(boxes, key=lambda b: b[2] * b[3], reverse=True)[:max_crops]:
+        side = max(max(w, h) * (1 + 2 * pad), min_size)
+        if side >= min(frame_w, frame_h):
+            return None  # motion as big as the frame — no point cropping
+        x0 = int(min(max(x + w / 2 - side / 2, 0), frame_w - side))
+        y0 = int(min(max(y + h / 2 - side / 2, 0), frame_h - side))
+        regions.append([x0, y0, x0 + int(side), y0 + int(side)])
+
+    # Merge overlapping regions into their union
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                a, b = regions[i], regions[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    regions[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del regions[j]
+                    merged = True
+                    break
+            if merged:
                 break
 
-            frame_data = after[body_start : body_start + content_length]
-            buffer = after[body_start + content_length:]
-
-            if "h264" in content_type.lower() or "video" in content_type.lower():
-                yield frame_data
-
-
-def decode_latest_frame(h264_data, tmp_path):
-    with open(tmp_path, "wb") as f:
-        f.write(h264_data)
-
-    cap = cv2.VideoCapture(tmp_path, cv2.CAP_FFMPEG)
-    if not cap.isOpened():
+    covered = sum((r[2] - r[0]) * (r[3] - r[1]) for r in regions)
+    if covered > max_cover * frame_w * frame_h:
         return None
-
-    last_frame = None
-    while True:
-        ok, frm = cap.read()
-        if not ok:
-            break
-        last_frame = frm
-    cap.release()
-    return last_frame
+    return [tuple(r) for r in regions]
 
 
 # ========================
@@ -177,76 +176,225 @@ def decode_latest_frame(h264_data, tmp_path):
 class ObjectDetector:
     """
     Lightweight SSD-Mobilenet detector to filter motion events.
+
+    When motion boxes are given, only crops around them are converted and
+    run through the model (see motion_crops) instead of the full 1080p
+    frame, so small distant subjects survive the 320x320 downscale.
+    Detections are mapped back to frame coordinates.
+
+    Inference runs on a pluggable backend (eager torch, ONNX Runtime or
+    int8 ONNX — see detector_backends.py).
     """
-    def __init__(self, confidence=DEFAULT_AI_THRESHOLD, classes=DEFAULT_AI_CLASSES):
+    def __init__(self, confidence=DEFAULT_AI_THRESHOLD, classes=DEFAULT_AI_CLASSES,
+                 backend=DEFAULT_AI_BACKEND, model_path=None):
         self.confidence = confidence
         self.classes = classes
-        
-        if HAS_AI:
-            print("[*] Loading AI models (Torch + SSD-Mobilenet)...")
-            self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-            self.model = ssdlite320_mobilenet_v3_large(weights=SSDLite320_MobileNet_V3_Large_Weights.DEFAULT)
-            self.model.to(self.device)
-            self.model.eval()
-            print(f"[*] AI ready on {self.device}")
-        else:
-            print("[!] AI imports failed. Falling back to basic motion detection.")
-
-    def detect_relevant_object(self, frame):
-        """Returns True if a relevant object (Person/Animal) is found."""
-        if not HAS_AI:
-            return True # If AI is missing, we don't filter
-        
-        # Preprocess
-        img_tensor = torchvision.transforms.functional.to_tensor(frame).unsqueeze(0).to(self.device)
-        
-        with torch.no_grad():
-            predictions = self.model(img_tensor)[0]
-        
-        # Filter by class and confidence
-        for i in range(len(predictions['labels'])):
-            label = int(predictions['labels'][i])
-            score = float(predictions['scores'][i])
-            
-            if score >= self.confidence and label in self.classes:
-                return True, label, score
-                
-        return False, None, 0
+        self.backend = None
+
+        print(f"[*] Loading AI model (SSD-Mobilenet, backend={backend})...")
+        try:
+            self.backend = create_backend(backend, model_path)
+            print(f"[*] AI ready on {self.backend}")
+        except (ImportError, FileNotFoundError) as e:
+            print(f"[!] AI backend unavailable ({e}). Falling back to basic motion detection.")
+
+    def detect_relevant_object(self, frame, boxes=None):
+        """Returns (found, label, score) for the best relevant object (Person/Animal)."""
+        return self.detect_relevant_objects([frame], [boxes])[0]
+
+    def detect_relevant_objects(self, frames, boxes=None):
+        """
+        Batched version of detect_relevant_object: one forward pass for all
+        frames, returns a (found, label, score) tuple per frame.
+        """
+        if self.backend is None:
+            return [(True, None, 0)] * len(frames) # If AI is missing, we don't filter
+
+        results = []
+        for detections in self.detect_objects(frames, boxes):
+            if detections:
+                label, score, _ = detections[0]
+                results.append((True, label, score))
+            else:
+                results.append((False, None, 0))
+        return results
+
+    def detect_objects(self, frames, boxes=None):
+        """
+        Run one batched forward pass over the motion crops of every frame.
+
+        Args:
+            frames: BGR frames.
+            boxes: Per frame, a list of motion boxes (x, y, w, h) or None
+                   to run on the full frame.
+
+        Returns:
+            Per frame, a list of (label, score, (x1, y1, x2, y2)) relevant
+            detections in frame coordinates, best first.
+        """
+        if boxes is None:
+            boxes = [None] * len(frames)
+
+        # Preprocess: crop (or take the full frame), BGR -> RGB
+        crops, owners = [], []
+        for idx, (frame, frame_boxes) in enumerate(zip(frames, boxes)):
+            regions = motion_crops(frame_boxes, frame.shape) or [(0, 0, frame.shape[1], frame.shape[0])]
+            for x0, y0, x1, y1 in regions:
+                crops.append(cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2RGB))
+                owners.append((idx, x0, y0))
+
+        predictions = self.backend.predict(crops)
+
+        detections = [[] for _ in frames]
+        for (idx, x0, y0), (pred_boxes, labels, scores) in zip(owners, predictions):
+            for i in range(len(labels)):
+                label = int(labels[i])
+                score = float(scores[i])
+                if score >= self.confidence and label in self.classes:
+                    bx1, by1, bx2, by2 = (float(v) for v in pred_boxes[i])
+                    detections[idx].append((label, score, (bx1 + x0, by1 + y0, bx2 + x0, by2 + y0)))
+
+        for dets in detections:
+            dets.sort(key=lambda d: d[1], reverse=True)
+        return detections
 
 
 # ========================
-# Motion Detector
+# Shared Detector Service
 # ========================
-class MotionDetector:
-    def __init__(self, threshold=DEFAULT_THRESHOLD, min_area=DEFAULT_MIN_AREA):
-        self.threshold = threshold
-        self.min_area = min_area
-        self.prev_gray = None
+class DetectorService:
+    """
+    Process-wide inference service owning a single ObjectDetector.
+
+    Every CameraMonitor submits frames through one queue instead of loading
+    its own model, so memory stays flat as cameras are added and the model
+    is loaded once.  The model (and torch itself) is loaded in the worker
+    thread — immediately with `warmup=True`, otherwise on the first request —
+    so creating the service never delays the camera receivers.
+
+    Requests that arrive together (several cameras triggered by the same
+    gust of wind or pair of headlights) are collected into micro-batches of
+    up to `max_batch` frames, waiting at most `batch_wait` seconds after the
+    first one, and run as a single batched forward pass (torch backend; the
+    ONNX backends still run one inference per frame, see OnnxBackend).
+    """
+    def __init__(self, confidence=DEFAULT_AI_THRESHOLD, classes=DEFAULT_AI_CLASSES,
+                 backend=DEFAULT_AI_BACKEND, model_path=None,
+                 max_pending=DEFAULT_AI_QUEUE, max_batch=DEFAULT_AI_BATCH,
+                 batch_wait=DEFAULT_AI_BATCH_WAIT, warmup=True):
+        self.confidence = confidence
+        self.classes = classes
+        self.backend = backend
+        self.model_path = model_path
+        self.warmup = warmup
+        self.load_seconds = None
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+        self.requests = queue.Queue(maxsize=max_pending)
+        self.detector = None
+        self.ready = threading.Event()
+
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.batches = 0
+
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def submit(self, frame, boxes=None):
+        """
+        Queue a frame (and optional motion boxes) for detection. Returns a
+        Future resolving to (found, label, score), or None if the service
+        is saturated.
+        """
+        future = Future()
+        try:
+            self.requests.put_nowait((frame, boxes, future))
+        except queue.Full:
+            self.rejected += 1
+            return None
+        self.submitted += 1
+        return future
+
+    def _load(self):
+        """
+        Load the model once.  Any failure (corrupt checkpoint, ONNX Runtime
+        InvalidGraph, ...) leaves `detector` None — the "no AI, don't
+        filter" path — rather than killing the worker with futures pending.
+        """
+        t0 = time.time()
+        try:
+            self.detector = ObjectDetector(confidence=self.confidence, classes=self.classes,
+                                           backend=self.backend, model_path=self.model_path)
+        except Exception as e:
+            print(f"[!] AI model failed to load ({e!r}). Falling back to basic motion detection.")
+            self.detector = None
+        else:
+            self.load_seconds = time.time() - t0
+            print(f"[*] AI model loaded in {self.load_seconds:.1f}s")
+        self.ready.set()
 
-    def detect(self, frame):
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        gray = cv2.GaussianBlur(gray, (21, 21), 0)
+    def _worker(self):
+        if self.warmup:
+            self._load()
 
-        if self.prev_gray is None:
-            self.prev_gray = gray
-            return False, 0, None
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            if not self.ready.is_set():
+                self._load()  # lazy mode: first confirmed-motion request
+            t0 = time.perf_counter()
+            try:
+                if self.detector is None:
+                    results = [(True, None, 0)] * len(batch)  # AI unavailable: don't filter
+                else:
+                    results = self.detector.detect_relevant_objects(
+                        [f for f, _, _ in batch], [b for _, b, _ in batch]
+                    )
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, _, future), result in zip(batch, results):
+                    future.set_result(result)
+            tracer.add("ai", f"ai_batch[{len(batch)}]", t0, time.perf_counter())
+            self.batches += 1
+            self.completed += len(batch)
+
+    def _next_batch(self):
+        """Block for one request, then gather more until the batch is full or the deadline passes."""
+        items = [self.requests.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(items) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return [item for item in items if item[2].set_running_or_notify_cancel()]
 
-        delta = cv2.absdiff(self.prev_gray, gray)
-        thresh = cv2.threshold(delta, self.threshold, 255, cv2.THRESH_BINARY)[1]
-        thresh = cv2.dilate(thresh, None, iterations=2)
+    @property
+    def mean_batch_size(self):
+        return self.completed / self.batches if self.batches else 0.0
 
-        contours, _ = cv2.findContours(
-            thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
-        )
 
-        total_area = 0
-        for c in contours:
-            area = cv2.contourArea(c)
-            if area > self.min_area:
-                total_area += area
+_detector_service = None
+_detector_service_lock = threading.Lock()
 
-        self.prev_gray = gray
-        return total_area > 0, total_area, thresh
+
+def get_detector_service(**kwargs):
+    """
+    Return the process-wide DetectorService, creating it on first use
+    (kwargs are passed to DetectorService and ignored afterwards).
+    """
+    global _detector_service
+    with _detector_service_lock:
+        if _detector_service is None:
+            _detector_service = DetectorService(**kwargs)
+        return _detector_service
 
 
 # ========================
@@ -259,7 +407,11 @@ class CameraMonitor(threading.Thread):
                  force_save_area=DEFAULT_FORCE_SAVE_AREA,
                  cooldown=DEFAULT_COOLDOWN, decode_interval=DEFAULT_DECODE_INTERVAL,
                  pre_record=DEFAULT_PRE_RECORD, post_record=DEFAULT_POST_RECORD,
-                 use_ai=True):
+                 use_ai=True, prefilter=False, clip_format=DEFAULT_CLIP_FORMAT,
+                 buffer_mb=DEFAULT_BUFFER_MB, buffer_quality=DEFAULT_BUFFER_QUALITY,
+                 buffer_scale=DEFAULT_BUFFER_SCALE, clip_writer=None,
+                 motion_mode=DEFAULT_MOTION_MODE, motion_width=DEFAULT_FAST_WIDTH,
+                 background=DEFAULT_BACKGROUND, bg_rate=DEFAULT_BG_RATE):
         super().__init__(daemon=True)
         self.ip = ip
         self.port = port
@@ -274,11 +426,29 @@ class CameraMonitor(threading.Thread):
         self.pre_record = pre_record
         self.post_record = post_record
         self.use_ai = use_ai
+        self.prefilter = prefilter
+        self.clip_format = clip_format
+        self.buffer_mb = buffer_mb
+        self.buffer_quality = buffer_quality
+        self.buffer_scale = buffer_scale
+        self.clip_writer = clip_writer
+        self.motion_mode = motion_mode
+        self.motion_width = motion_width
+        self.background = background
+        self.bg_rate = bg_rate
 
         self.running = False
         self.frames_received = 0
         self.frames_decoded = 0
+        self.frames_skipped = 0
         self.motions_saved = 0
+        self.bytes_received = 0
+        self.reconnects = 0
+        self.last_decode_time = 0.0
+        self._decode_seconds = 0.0       # decoder time since the last decoded frame
+        self.decode_latency = Histogram()
+        self.detect_latency = Histogram()
+        self.ai_latency = Histogram()
         self.last_motion_time = 0
         self.status = "starting"
 
@@ -286,15 +456,28 @@ class CameraMonitor(threading.Thread):
         os.makedirs(cam_dir, exist_ok=True)
         self.cam_dir = cam_dir
         self.tmp_path = os.path.join(cam_dir, f"_decode_{ip.replace('.','_')}.h264")
+        self.spill_dir = os.path.join(cam_dir, "_spill")
+        self.frame_stores = []
 
         self._decoded_fps = max(1.0, 30.0 / decode_interval)
-        self.frame_queue = queue.Queue(maxsize=1000)
+        self.frame_queue = H264FrameQueue(maxsize=1000)
+
+    @property
+    def buffer_bytes(self):
+        """In-memory bytes held by this camera's decoded-frame buffers."""
+        return sum(store.memory_bytes for store in self.frame_stores)
+
+    def _new_frame_store(self, maxlen=None):
+        return FrameStore(
+            budget_bytes=self.buffer_mb * 1024 * 1024, spill_dir=self.spill_dir,
+            quality=self.buffer_quality, scale=self.buffer_scale, maxlen=maxlen,
+        )
 
     def run(self):
         self.running = True
         
         # Start the processing thread
-        processor = threading.Thread(target=self._processor_loop, daemon=True)
+        processor = threading.Thread(target=self._processor_loop, name=f"processor-{self.ip}", daemon=True)
         processor.start()
 
         while self.running:
@@ -306,6 +489,7 @@ class CameraMonitor(threading.Thread):
 
             if self.running:
                 self.status = "reconnecting"
+                self.reconnects += 1
                 time.sleep(10)
 
     def _receiver_loop(self):
@@ -318,117 +502,213 @@ class CameraMonitor(threading.Thread):
         self.status = "streaming"
         for h264_frame in parse_h264_frames(response):
             if not self.running: break
-            try:
-                self.frame_queue.put(h264_frame, timeout=0.1)
-                self.frames_received += 1
-            except queue.Full:
-                pass
+            # Sheds non-reference frames / GOP tails when full, never SPS/PPS/IDR
+            self.frame_queue.put(h264_frame)
+            self.frames_received += 1
+            self.bytes_received += len(h264_frame)
 
     def _processor_loop(self):
-        detector = MotionDetector(threshold=self.threshold, min_area=self.min_area)
-        ai_detector = ObjectDetector() if self.use_ai else None
-
-        h264_buf = b""
-        h264_header = b""
-        h264_count = 0
-        
-        ring_size = max(10, int(self._decoded_fps * self.pre_record))
-        ring_buffer = deque(maxlen=ring_size)
-
-        recording = False
-        ai_confirmed = False
-        max_area_seen = 0
-        motion_clip_frames = []
-        last_motion_at = 0.0
-        clip_start_time = None
-
-        print(f"  [{self.ip}] Processor started (AI={self.use_ai})")
+        self.start_processing()
 
         while self.running:
             try:
+                t0 = time.perf_counter()
                 try:
                     h264_frame = self.frame_queue.get(timeout=1.0)
                 except queue.Empty:
-                    if recording and (time.time() - last_motion_at >= self.post_record):
-                        self._finish_recording(motion_clip_frames, ai_confirmed, max_area_seen, clip_start_time)
-                        recording = False
-                        motion_clip_frames = []
-                    continue
-
-                if not h264_header and len(h264_frame) > 4:
-                    if (h264_frame[4] & 0x1F) in (7, 8):
-                        h264_header += h264_frame
-
-                h264_buf += h264_frame
-                h264_count += 1
-
-                if h264_count > 300 and not recording:
-                    h264_buf = h264_header + h264_frame
-                    h264_count = 1
-
-                if h264_count % self.decode_interval != 0:
+                    self.check_idle()
                     continue
-
-                frame = decode_latest_frame(h264_buf, self.tmp_path)
-                if frame is None: continue
-
-                self.frames_decoded += 1
-                now = time.time()
-                ring_buffer.append((now, frame.copy()))
-
-                # 1. Detect Motion
-                motion, area, _ = detector.detect(frame)
-
-                if motion:
-                    last_motion_at = now
-                    self.last_motion_time = now
-                    max_area_seen = max(max_area_seen, area)
-                    
-                    if not recording:
-                        recording = True
-                        ai_confirmed = False
-                        max_area_seen = area
-                        clip_start_time = now
-                        motion_clip_frames = [f.copy() for (_, f) in ring_buffer]
-                        print(f"  [{self.ip}] >>> Suspected Motion (Area={area:.0f})")
-                    
-                    motion_clip_frames.append(frame.copy())
-                    
-                    # 2. Confirm with AI (if not already confirmed)
-                    if self.use_ai and not ai_confirmed:
-                        found, label, conf = ai_detector.detect_relevant_object(frame)
-                        if found:
-                            ai_confirmed = True
-                            label_name = {1:'person', 17:'cat', 18:'dog'}.get(label, f'obj_{label}')
-                            print(f"  [{self.ip}] AI CONFIRMED: Found {label_name} ({conf:.2f})")
-
-                elif recording:
-                    motion_clip_frames.append(frame.copy())
-                    if now - last_motion_at >= self.post_record:
-                        self._finish_recording(motion_clip_frames, ai_confirmed, max_area_seen, clip_start_time)
-                        recording = False
-                        motion_clip_frames = []
-                        h264_buf = h264_header
-                        h264_count = 0
-
+                tracer.add(self.ip, "queue_wait", t0, time.perf_counter())
+                with tracer.span(self.ip, "frame"):
+                    self.process_frame(h264_frame)
             except Exception as e:
                 print(f"  [{self.ip}] Processor error: {e}")
                 time.sleep(1)
 
-    def _finish_recording(self, frames, ai_confirmed, max_area_seen, start_time):
-        if not frames: return
+        self.stop_processing()
+
+    # ---- Processing steps (also driven by ingest.IngestEngine's worker pool) ----
+    def start_processing(self):
+        self.detector = MotionDetector(threshold=self.threshold, min_area=self.min_area,
+                                       mode=self.motion_mode, width=self.motion_width,
+                                       background=self.background, bg_rate=self.bg_rate)
+        self.ai_service = get_detector_service() if self.use_ai else None
+        self.pending_ai = None  # Future from the shared detector
+
+        self.decoder = H264Decoder(tmp_path=self.tmp_path, output_every=self.decode_interval)
+        self.h264_count = 0
+        self.activity = NalActivityFilter() if self.prefilter else None
         
+        ring_size = max(10, int(self._decoded_fps * self.pre_record))
+        self.ring_buffer = self._new_frame_store(maxlen=ring_size)
+        self.raw_ring = H264ClipRing(self.pre_record) if self.clip_format == "mp4" else None
+
+        self.recording = False
+        self.ai_confirmed = False
+        self.max_area_seen = 0
+        self.motion_clip_frames = None
+        self.frame_stores = [self.ring_buffer]
+        self.raw_clip = None
+        self.raw_fps = 30.0
+        self.last_motion_at = 0.0
+        self.clip_start_time = None
+
+        print(f"  [{self.ip}] Processor started (AI={self.use_ai}, decoder={self.decoder.backend})")
+
+    def check_idle(self):
+        if self.recording and (time.time() - self.last_motion_at >= self.post_record):
+            self._end_clip()
+
+    def process_frame(self, h264_frame):
+        decoder = self.decoder
+
+        # Static scene (compressed-domain check): skip decode + detection
+        if self.activity is not None and not self.recording:
+            if not self.activity.update(h264_frame):
+                decoder.push(h264_frame, decode=False)
+                if self.raw_ring is not None:
+                    self.raw_ring.push(h264_frame, decoder.gop.last_types)
+                self.frames_skipped += 1
+                return
+
+        t0 = time.perf_counter()
+        decoder.push(h264_frame)
+        t1 = time.perf_counter()
+        self._decode_seconds += t1 - t0
+        tracer.add(self.ip, "decode", t0, t1)
+        self.h264_count += 1
+
+        # Keep every compressed frame for passthrough clips
+        if self.raw_ring is not None:
+            self.raw_ring.push(h264_frame, decoder.gop.last_types)
+            if self.raw_clip is not None:
+                self.raw_clip.append(h264_frame)
+
+        if self.h264_count % self.decode_interval != 0:
+            return
+
+        t0 = time.perf_counter()
+        frame = decoder.read()
+        t1 = time.perf_counter()
+        tracer.add(self.ip, "decode", t0, t1)
+        if frame is None: return
+        self.decode_latency.observe(self._decode_seconds + t1 - t0)
+        self._decode_seconds = 0.0
+
+        self.frames_decoded += 1
+        now = time.time()
+        self.last_decode_time = now
+        with tracer.span(self.ip, "append"):
+            self.ring_buffer.append(frame)
+
+        if self.pending_ai is not None and self.pending_ai.done():
+            self.ai_confirmed = self._ai_result(self.pending_ai) or self.ai_confirmed
+            self.pending_ai = None
+
+        # 1. Detect Motion
+        t0 = time.perf_counter()
+        motion, area, _ = self.detector.detect(frame)
+        t1 = time.perf_counter()
+        self.detect_latency.observe(t1 - t0)
+        tracer.add(self.ip, "motion", t0, t1)
+
+        if motion:
+            self.last_motion_at = now
+            self.last_motion_time = now
+            self.max_area_seen = max(self.max_area_seen, area)
+            
+            if not self.recording:
+                self.recording = True
+                self.ai_confirmed = False
+                self.max_area_seen = area
+                self.clip_start_time = now
+                self.motion_clip_frames = self.ring_buffer.copy()
+                self.frame_stores = [self.ring_buffer, self.motion_clip_frames]
+                if self.raw_ring is not None:
+                    self.raw_clip = self.raw_ring.snapshot(header=decoder.gop.header)
+                    self.raw_fps = self.raw_ring.fps
+                print(f"  [{self.ip}] >>> Suspected Motion (Area={area:.0f})")
+            
+            with tracer.span(self.ip, "append"):
+                self.motion_clip_frames.append(frame)
+            
+            # 2. Confirm with AI (if not already confirmed or in flight)
+            if self.use_ai and not self.ai_confirmed and self.pending_ai is None:
+                self.pending_ai = self.ai_service.submit(frame, self.detector.last_boxes)
+                if self.pending_ai is not None:
+                    submitted_at = time.perf_counter()
+                    self.pending_ai.add_done_callback(lambda _, t0=submitted_at: self._ai_done(t0))
+
+        elif self.recording:
+            with tracer.span(self.ip, "append"):
+                self.motion_clip_frames.append(frame)
+            if now - self.last_motion_at >= self.post_record:
+                self._end_clip()
+
+    def stop_processing(self):
+        self.decoder.close()
+        for store in self.frame_stores:
+            store.close()
+
+    def _end_clip(self):
+        with tracer.span(self.ip, "finalize"):
+            if self.pending_ai is not None:
+                self.ai_confirmed = self._ai_result(self.pending_ai, DEFAULT_AI_WAIT) or self.ai_confirmed
+                self.pending_ai = None
+            self._finish_recording(self.motion_clip_frames, self.ai_confirmed, self.max_area_seen,
+                                   self.clip_start_time, self.raw_clip, self.raw_fps)
+        self.recording = False
+        self.motion_clip_frames = None
+        self.frame_stores = [self.ring_buffer]
+        self.raw_clip = None
+
+    def _ai_done(self, submitted_at):
+        """Future callback (detector thread): AI latency from submit to result."""
+        now = time.perf_counter()
+        self.ai_latency.observe(now - submitted_at)
+        tracer.add(self.ip, "ai", submitted_at, now)
+
+    def _ai_result(self, future, timeout=None):
+        """Resolve a detector Future; returns True if a relevant object was found."""
+        try:
+            found, label, conf = future.result(timeout=timeout)
+        except Exception as e:
+            print(f"  [{self.ip}] AI error: {e!r}")
+            return False
+        if found and label is not None:
+            label_name = {1:'person', 17:'cat', 18:'dog'}.get(label, f'obj_{label}')
+            print(f"  [{self.ip}] AI CONFIRMED: Found {label_name} ({conf:.2f})")
+        return found
+
+    def _finish_recording(self, frames, ai_confirmed, max_area_seen, start_time,
+                          raw_clip=None, raw_fps=30.0):
+        """Decide whether to keep the clip; takes ownership of the `frames` store."""
         # Save if AI found something OR if the motion area was significantly large
         should_save = ai_confirmed or (max_area_seen >= self.force_save_area)
         
-        if not should_save:
+        if not frames or not should_save:
             # print(f"  [{self.ip}] Clip dropped (Area={max_area_seen:.0f}, AI=False).")
+            frames.close()
             return
 
         duration = time.time() - start_time
-        self._save_motion_event(frames, duration)
-
-    def _save_motion_event(self, frames, clip_duration=0):
+        if self.clip_writer is None:
+            self._write_clip(frames, duration, raw_clip, raw_fps)
+        else:
+            # Written in the background so decoding/detection keep up with the stream
+            self.clip_writer.submit(self._write_clip, frames, duration, raw_clip, raw_fps)
+
+    def _write_clip(self, frames, clip_duration, raw_clip, raw_fps):
+        try:
+            with tracer.span(self.ip, "clip_write"):
+                self._save_motion_event(frames, clip_duration, raw_clip, raw_fps)
+        except Exception as e:
+            print(f"  [{self.ip}] Clip save error: {e}")
+            raise
+        finally:
+            frames.close()
+
+    def _save_motion_event(self, frames, clip_duration=0, raw_clip=None, raw_fps=30.0):
         now = datetime.datetime.now()
         timestamp = now.strftime("%Y%m%d_%H%M%S")
         date_dir = os.path.join(self.cam_dir, now.strftime("%Y-%m-%d"))
@@ -438,27 +718,42 @@ class CameraMonitor(threading.Thread):
         jpg_path = os.path.join(date_dir, f"motion_{timestamp}.jpg")
         cv2.imwrite(jpg_path, frames[snap_idx], [cv2.IMWRITE_JPEG_QUALITY, 90])
 
-        h, w = frames[0].shape[:2]
-        clip_path = os.path.join(date_dir, f"clip_{timestamp}.avi")
-        writer = cv2.VideoWriter(clip_path, cv2.VideoWriter_fourcc(*"XVID"), self._decoded_fps, (w, h))
-        for f in frames: writer.write(f)
-        writer.release()
+        if raw_clip:
+            # Passthrough: remux the camera's own H.264 frames (full fps, no re-encode)
+            clip_path = write_h264_clip(raw_clip, os.path.join(date_dir, f"clip_{timestamp}"), raw_fps)
+            frame_count = len(raw_clip)
+        else:
+            h, w = frames[0].shape[:2]
+            clip_path = os.path.join(date_dir, f"clip_{timestamp}.avi")
+            writer = cv2.VideoWriter(clip_path, cv2.VideoWriter_fourcc(*"XVID"), self._decoded_fps, (w, h))
+            for f in frames: writer.write(f)
+            writer.release()
+            frame_count = len(frames)
 
         self.motions_saved += 1
-        print(f"  [{self.ip}] DONE: Saved {len(frames)} frames (~{clip_duration:.1f}s) -> {clip_path}")
+        print(f"  [{self.ip}] DONE: Saved {frame_count} frames (~{clip_duration:.1f}s) -> {clip_path}")
 
     def stop(self):
         self.running = False
 
 
-def status_printer(monitors, interval=60):
+def status_printer(monitors, interval=60, clip_writer=None):
     while True:
         time.sleep(interval)
         print(f"\n--- Status at {datetime.datetime.now():%H:%M:%S} ---")
         for m in monitors:
             elapsed = time.time() - m.last_motion_time if m.last_motion_time else 0
             ago = f"{elapsed:.0f}s ago" if m.last_motion_time else "never"
-            print(f"  [{m.ip}] {m.status} | saved={m.motions_saved} | last={ago}")
+            print(f"  [{m.ip}] {m.status} | saved={m.motions_saved} | "
+                  f"queue={m.frame_queue.qsize()} dropped={m.frame_queue.drops} | "
+                  f"buffers={m.buffer_bytes / 1e6:.1f}MB | last={ago}")
+        print(f"  Frame buffers (all cameras): {FrameStore.total_memory() / 1e6:.1f} MB in memory")
+        if clip_writer is not None:
+            print(f"  [Writer] {clip_writer.stats()}")
+        if _detector_service is not None:
+            svc = _detector_service
+            print(f"  [AI] requests={svc.submitted} done={svc.completed} rejected={svc.rejected} "
+                  f"batches={svc.batches} (avg {svc.mean_batch_size:.1f}/batch)")
 
 def main():
     p = argparse.ArgumentParser()
@@ -467,36 +762,120 @@ def main():
     p.add_argument("--min-area", type=int, default=DEFAULT_MIN_AREA)
     p.add_argument("--force-save-area", type=int, default=DEFAULT_FORCE_SAVE_AREA)
     p.add_argument("--no-ai", action="store_true", help="Disable AI filtering")
+    p.add_argument("--ai-backend", choices=BACKENDS, default=DEFAULT_AI_BACKEND,
+                   help="Inference backend for the AI filter (onnx* need export_detector.py)")
+    p.add_argument("--ai-model", default=None, help="Path to an exported ONNX model")
+    p.add_argument("--ai-load", choices=["warmup", "lazy"], default=DEFAULT_AI_LOAD,
+                   help="Load the AI model in the background at startup, or on first motion")
+    p.add_argument("--prefilter", action="store_true",
+                   help="Skip decoding while P-frame sizes show a static scene")
+    p.add_argument("--motion-mode", choices=MOTION_MODES, default=DEFAULT_MOTION_MODE,
+                   help="full: detect on the full frame; fast: on a downscaled frame")
+    p.add_argument("--motion-width", type=int, default=DEFAULT_FAST_WIDTH,
+                   help="Analysis width of --motion-mode fast")
+    p.add_argument("--background", choices=BACKGROUNDS, default=DEFAULT_BACKGROUND,
+                   help="Background model: previous frame, running average, or MOG2")
+    p.add_argument("--bg-rate", type=float, default=DEFAULT_BG_RATE,
+                   help="Background learning rate per decoded frame")
+    p.add_argument("--tuning", default=None,
+                   help="JSON file of per-camera motion settings (see motion.load_tuning)")
+    p.add_argument("--clip-format", choices=["mp4", "avi"], default=DEFAULT_CLIP_FORMAT,
+                   help="mp4: original H.264 stream, no re-encode; avi: decoded frames as XVID")
+    p.add_argument("--engine", choices=["asyncio", "threads"], default="asyncio",
+                   help="asyncio: all streams on one event loop + shared worker pool; "
+                        "threads: receiver + processor thread per camera")
+    p.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                   help="Processing threads shared by all cameras (--engine asyncio)")
+    p.add_argument("--writers", type=int, default=DEFAULT_WRITERS,
+                   help="Background clip writer threads (0 = save inline)")
+    p.add_argument("--writer-queue", type=int, default=DEFAULT_WRITER_QUEUE,
+                   help="Clips waiting to be written before detection blocks")
+    p.add_argument("--buffer-mb", type=int, default=DEFAULT_BUFFER_MB,
+                   help="In-memory budget (MB) per decoded-frame buffer before spilling to disk")
+    p.add_argument("--buffer-quality", type=int, default=DEFAULT_BUFFER_QUALITY,
+                   help="JPEG quality of buffered decoded frames")
+    p.add_argument("--buffer-scale", type=float, default=DEFAULT_BUFFER_SCALE,
+                   help="Resize buffered decoded frames by this factor (e.g. 0.5)")
+    p.add_argument("--metrics-port", type=int, default=0,
+                   help="Serve Prometheus metrics (and /trace, /profile) on this port (default: off)")
+    p.add_argument("--trace", action="store_true",
+                   help="Record per-frame processing spans (export via /trace or SIGUSR1)")
+    p.add_argument("--trace-spans", type=int, default=DEFAULT_SPANS,
+                   help=f"Spans kept in the trace ring buffer (default: {DEFAULT_SPANS})")
     p.add_argument("--output", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "motion_clips_v2"))
     args = p.parse_args()
 
     print("=" * 60)
     print("  TP-Link Camera — AI-Filtered Motion Monitor (V2)")
     print("=" * 60)
-    print(f"  AI Filtering: {'OFF' if args.no_ai else 'ON (Person/Cat/Dog)'}")
+    print(f"  AI Filtering: {'OFF' if args.no_ai else f'ON (Person/Cat/Dog, {args.ai_backend})'}")
     print(f"  Threshold   : {args.threshold} | Min Area: {args.min_area}")
+    print(f"  Pre-filter  : {'ON' if args.prefilter else 'OFF'}")
+    print(f"  Motion mode : {args.motion_mode} | Background: {args.background}")
+    print(f"  Clip format : {args.clip_format}")
+    print(f"  Engine      : {args.engine}")
     print("=" * 60)
 
+    os.makedirs(args.output, exist_ok=True)
+    if args.trace:
+        tracer.enable(args.trace_spans)
+    install_signal_handlers(args.output)
+
+    if not args.no_ai:
+        # Never blocks: the model loads in the service's worker thread
+        get_detector_service(backend=args.ai_backend, model_path=args.ai_model,
+                             warmup=args.ai_load == "warmup")
+
+    clip_writer = (ClipWriterPool(workers=args.writers, max_pending=args.writer_queue)
+                   if args.writers > 0 else None)
+
+    tuning = load_tuning(args.tuning) if args.tuning else {}
+
     monitors = []
     for ip in args.cameras:
+        motion_settings = dict(threshold=args.threshold, min_area=args.min_area,
+                               motion_mode=args.motion_mode, motion_width=args.motion_width,
+                               background=args.background, bg_rate=args.bg_rate)
+        motion_settings.update(tuning.get(ip, {}))  # per-camera overrides
         m = CameraMonitor(
             ip=ip, 
             output_dir=args.output, 
-            threshold=args.threshold, 
-            min_area=args.min_area,
             force_save_area=args.force_save_area,
-            use_ai=not args.no_ai
+            use_ai=not args.no_ai,
+            prefilter=args.prefilter,
+            clip_format=args.clip_format,
+            buffer_mb=args.buffer_mb,
+            buffer_quality=args.buffer_quality,
+            buffer_scale=args.buffer_scale,
+            clip_writer=clip_writer,
+            **motion_settings,
         )
         monitors.append(m)
-        m.start()
-        time.sleep(2)
+        if args.engine == "threads":
+            m.start()
+            time.sleep(2)
+
+    engine = None
+    if args.engine == "asyncio":
+        engine = IngestEngine(monitors, workers=args.workers)
+        engine.start()
 
-    threading.Thread(target=status_printer, args=(monitors,), daemon=True).start()
+    if args.metrics_port:
+        MetricsServer(args.metrics_port, lambda: dict(
+            monitors=monitors, clip_writer=clip_writer, detector_service=_detector_service,
+        ), routes=http_routes()).start()
+
+    threading.Thread(target=status_printer, args=(monitors, 60, clip_writer), daemon=True).start()
 
     try:
         while True: time.sleep(1)
     except KeyboardInterrupt:
-        for m in monitors: m.stop()
+        if engine is not None:
+            engine.stop()
+        else:
+            for m in monitors: m.stop()
+        if clip_writer is not None:
+            clip_writer.shutdown(wait=True)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Parity check: exported ONNX detector backends vs the eager torch model
+
+Runs the same fixed images through the "torch" backend and each ONNX
+backend, compares the best detection per image (label, score, box IoU)
+and prints per-backend latency.
+
+By default the images are a deterministic synthetic set generated from a
+fixed seed (shapes, gradients and noise at several sizes), so the check
+needs no camera data and gives the same result on every run.  They rarely
+contain a person or animal, so the top detection of any class is compared
+at a low score threshold.  --snapshots uses the motion snapshots saved by
+motion_detect_v2.py (motion_clips_v2/**/motion_*.jpg) instead, compared on
+person/cat/dog only.
+
+Usage:
+    python export_detector.py
+    python test_detector_parity.py
+    python test_detector_parity.py --snapshots
+    python test_detector_parity.py --images a.jpg b.jpg --backends onnx-int8
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from detector_backends import create_backend
+
+RELEVANT_CLASSES = [1, 17, 18]   # person, cat, dog (COCO indices)
+SCORE_THRESHOLD = 0.45
+FIXTURE_SCORE_THRESHOLD = 0.1    # synthetic images only get weak detections
+FIXTURE_SEED = 1234
+FIXTURE_SIZES = [(320, 320), (640, 480), (1280, 720), (1920, 1080)]
+
+# (max score difference, min box IoU) allowed per backend
+TOLERANCES = {
+    "onnx": (0.02, 0.9),
+    "onnx-int8": (0.10, 0.7),
+}
+
+
+def best_detection(boxes, labels, scores, classes=RELEVANT_CLASSES, threshold=SCORE_THRESHOLD):
+    for box, label, score in zip(boxes, labels, scores):
+        if score >= threshold and (classes is None or int(label) in classes):
+            return int(label), float(score), [float(v) for v in box]
+    return None
+
+
+def fixture_images(count, seed=FIXTURE_SEED):
+    """`count` deterministic RGB test images (same pixels on every run)."""
+    rng = np.random.RandomState(seed)
+    images = []
+    for i in range(count):
+        w, h = FIXTURE_SIZES[i % len(FIXTURE_SIZES)]
+        top, bottom = rng.randint(0, 256, 3), rng.randint(0, 256, 3)
+        ramp = np.linspace(0.0, 1.0, h, dtype=np.float32)[:, None, None]
+        img = (top * (1 - ramp) + bottom * ramp).repeat(w, axis=1).astype(np.uint8)
+        for _ in range(rng.randint(3, 9)):
+            color = tuple(int(c) for c in rng.randint(0, 256, 3))
+            x, y = int(rng.randint(0, w)), int(rng.randint(0, h))
+            sw, sh = int(rng.randint(w // 16, w // 3)), int(rng.randint(h // 16, h // 2))
+            if rng.rand() < 0.5:
+                cv2.rectangle(img, (x, y), (x + sw, y + sh), color, -1)
+            else:
+                cv2.ellipse(img, (x, y), (sw // 2, sh // 2), 0, 0, 360, color, -1)
+        noise = rng.randint(-12, 13, img.shape)
+        images.append(np.clip(img.astype(np.int16) + noise, 0, 255).astype(np.uint8))
+    return images
+
+
+def iou(a, b):
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def run_backend(backend, images, classes, threshold):
+    t0 = time.perf_counter()
+    results = backend.predict(images)
+    dt = (time.perf_counter() - t0) / len(images)
+    return [best_detection(*r, classes=classes, threshold=threshold) for r in results], dt
+
+
+def main():
+    default_glob = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "motion_clips_v2", "**", "motion_*.jpg"
+    )
+    p = argparse.ArgumentParser(description="ONNX vs torch detector parity check")
+    p.add_argument("--images", nargs="+", default=None,
+                   help="Images to compare (default: generated fixture set)")
+    p.add_argument("--snapshots", action="store_true",
+                   help=f"Compare on saved motion snapshots ({default_glob})")
+    p.add_argument("--limit", type=int, default=20, help="Max images to use")
+    p.add_argument("--seed", type=int, default=FIXTURE_SEED, help="Fixture set seed")
+    p.add_argument("--backends", nargs="+", default=["onnx", "onnx-int8"])
+    args = p.parse_args()
+
+    if args.images or args.snapshots:
+        paths = args.images or sorted(glob.glob(default_glob, recursive=True))
+        paths = paths[:args.limit]
+        if not paths:
+            print("[-] No images found. Pass --images or run motion_detect_v2.py first.")
+            sys.exit(2)
+        images = [cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2RGB) for path in paths]
+        classes, threshold = RELEVANT_CLASSES, SCORE_THRESHOLD
+    else:
+        images = fixture_images(args.limit, args.seed)
+        paths = [f"fixture_{i:02d}" for i in range(len(images))]
+        classes, threshold = None, FIXTURE_SCORE_THRESHOLD
+    print(f"[*] {len(images)} images")
+
+    reference, ref_dt = run_backend(create_backend("torch"), images, classes, threshold)
+    print(f"    torch       {ref_dt * 1000:7.1f} ms/image")
+
+    failures = 0
+    for name in args.backends:
+        results, dt = run_backend(create_backend(name), images, classes, threshold)
+        max_score_diff, min_iou = TOLERANCES[name]
+        print(f"    {name:<11} {dt * 1000:7.1f} ms/image  ({ref_dt / dt:.1f}x vs torch)")
+
+        for path, ref, got in zip(paths, reference, results):
+            if ref is None and got is None:
+                continue
+            if ref is None or got is None or ref[0] != got[0]:
+                print(f"  [FAIL] {name}: {os.path.basename(path)} torch={ref} {name}={got}")
+                failures += 1
+                continue
+            score_diff = abs(ref[1] - got[1])
+            overlap = iou(ref[2], got[2])
+            if score_diff > max_score_diff or overlap < min_iou:
+                print(f"  [FAIL] {name}: {os.path.basename(path)} "
+                      f"score diff={score_diff:.3f} IoU={overlap:.2f}")
+                failures += 1
+
+    if failures:
+        print(f"[-] {failures} mismatches")
+        sys.exit(1)
+    print("[+] All backends match the eager model")
+
+
+if __name__ == "__main__":
+    main()
@@ -36,6 +36,9 @@ import urllib3
 import requests.adapters
 from urllib3.util.ssl_ import create_urllib3_context
 
+from h264_stream import parse_h264_frames, H264Decoder
+from jpeg_cache import JpegCache
+
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 # ========================
@@ -97,7 +100,24 @@ class TPLinkCamera:
 
         self._running = False
         self._latest_frame = None
-        self._frame_lock = threading.Lock()
+        self._frame_seq = 0  # increments with every new _latest_frame
+        self._frame_cond = threading.Condition()
+
+    def _set_latest_frame(self, frame):
+        with self._frame_cond:
+            self._latest_frame = frame
+            self._frame_seq += 1
+            self._frame_cond.notify_all()
+
+    def wait_for_frame(self, after_seq=0, timeout=5.0):
+        """
+        Block until a frame newer than `after_seq` is decoded.
+        Returns (seq, frame); frame is None on timeout.
+        """
+        with self._frame_cond:
+            if not self._frame_cond.wait_for(lambda: self._frame_seq > after_seq, timeout):
+                return after_seq, None
+            return self._frame_seq, self._latest_frame
 
     # --------------------------------------------------
     # Connection helpers
@@ -151,50 +171,10 @@ class TPLinkCamera:
         """
         Generator that yields raw H.264 frame bytes from the camera's
         multipart/x-mixed-replace stream.
-        """
-        boundary = b"--data-boundary--"
-        buffer = b""
 
-        for chunk in response.iter_content(chunk_size=65536):
-            buffer += chunk
-
-            while True:
-                idx = buffer.find(boundary)
-                if idx == -1:
-                    # Trim buffer to avoid unbounded growth
-                    if len(buffer) > 200000:
-                        buffer = buffer[-100000:]
-                    break
-
-                after = buffer[idx + len(boundary):]
-                header_end = after.find(b"\r\n\r\n")
-                if header_end == -1:
-                    break  # need more data for headers
-
-                headers_raw = after[:header_end].decode("latin-1")
-                body_start = header_end + 4
-
-                content_length = 0
-                content_type = ""
-                for line in headers_raw.split("\r\n"):
-                    lo = line.lower().strip()
-                    if lo.startswith("content-length:"):
-                        content_length = int(line.split(":", 1)[1].strip())
-                    elif lo.startswith("content-type:"):
-                        content_type = line.split(":", 1)[1].strip()
-
-                if content_length == 0:
-                    buffer = after[body_start:]
-                    continue
-
-                if len(after) < body_start + content_length:
-                    break  # need more data for body
-
-                frame_data = after[body_start : body_start + content_length]
-                buffer = after[body_start + content_length:]
-
-                if "h264" in content_type.lower() or "video" in content_type.lower():
-                    yield frame_data
+        See h264_stream.MultipartH264Parser for the incremental parser.
+        """
+        return parse_h264_frames(response)
 
     # --------------------------------------------------
     # Live display (OpenCV window)
@@ -203,12 +183,12 @@ class TPLinkCamera:
         """
         Show a live OpenCV window with decoded H.264 frames.
 
-        The camera streams H.264 via HTTP multipart.  We accumulate raw
-        NAL units into a temp file and periodically ask OpenCV (FFMPEG
-        backend) to decode the latest frame.
+        The camera streams H.264 via HTTP multipart.  NAL units are pushed
+        into a persistent decoder session (see h264_stream.H264Decoder)
+        and the newest decoded frame is shown periodically.
 
         Args:
-            decode_interval: Decode after every N received frames.
+            decode_interval: Refresh the window after every N received frames.
                              Lower = fresher image but more CPU.
         """
         response = self.connect_stream()
@@ -216,17 +196,17 @@ class TPLinkCamera:
             return
 
         self._running = True
-        tmp_path = os.path.join(
+        decoder = H264Decoder(tmp_path=os.path.join(
             os.path.dirname(os.path.abspath(__file__)), "_live_buffer.h264"
-        )
+        ), output_every=decode_interval)
         window_name = f"TP-Link Camera ({self.ip})"
 
         print(f"\n[*] Streaming live from {self.ip} ...")
         print(f"    Resolution: 1920x1080 (H.264)")
-        print(f"    Decode every {decode_interval} frames")
+        print(f"    Decoder: {decoder.backend}")
+        print(f"    Refresh every {decode_interval} frames")
         print(f"    Press 'q' in the window to quit\n")
 
-        h264_buf = b""
         count = 0
         t0 = time.time()
 
@@ -235,58 +215,43 @@ class TPLinkCamera:
                 if not self._running:
                     break
 
-                h264_buf += frame_data
+                decoder.push(frame_data)
                 count += 1
 
                 if count % decode_interval == 0:
-                    # Write accumulated H.264 to temp file
-                    with open(tmp_path, "wb") as f:
-                        f.write(h264_buf)
-
-                    cap = cv2.VideoCapture(tmp_path, cv2.CAP_FFMPEG)
-                    if cap.isOpened():
-                        last = None
-                        while True:
-                            ok, frm = cap.read()
-                            if not ok:
-                                break
-                            last = frm
-                        cap.release()
-
-                        if last is not None:
-                            with self._frame_lock:
-                                self._latest_frame = last.copy()
-
-                            # Add overlay
-                            disp = last.copy()
-                            elapsed = time.time() - t0
-                            fps = count / elapsed if elapsed > 0 else 0
-                            cv2.putText(
-                                disp,
-                                f"FPS: {fps:.1f} | Frames: {count}",
-                                (10, 30),
-                                cv2.FONT_HERSHEY_SIMPLEX,
-                                0.8,
-                                (0, 255, 0),
-                                2,
-                            )
-                            cv2.putText(
-                                disp,
-                                f"{self.ip} | 1080p H.264",
-                                (10, 60),
-                                cv2.FONT_HERSHEY_SIMPLEX,
-                                0.6,
-                                (0, 200, 255),
-                                1,
-                            )
-                            cv2.imshow(window_name, disp)
+                    last = decoder.read()
+                    if last is not None:
+                        self._set_latest_frame(last.copy())
+
+                        # Add overlay
+                        disp = last.copy()
+                        elapsed = time.time() - t0
+                        fps = count / elapsed if elapsed > 0 else 0
+                        cv2.putText(
+                            disp,
+                            f"FPS: {fps:.1f} | Frames: {count}",
+                            (10, 30),
+                            cv2.FONT_HERSHEY_SIMPLEX,
+                            0.8,
+                            (0, 255, 0),
+                            2,
+                        )
+                        cv2.putText(
+                            disp,
+                            f"{self.ip} | 1080p H.264",
+                            (10, 60),
+                            cv2.FONT_HERSHEY_SIMPLEX,
+                            0.6,
+                            (0, 200, 255),
+                            1,
+                        )
+                        cv2.imshow(window_name, disp)
 
                     if cv2.waitKey(1) & 0xFF == ord("q"):
                         break
 
-                    # Reset buffer periodically to keep memory bounded
+                    # Restart the FPS average periodically
                     if count > 300:
-                        h264_buf = b""
                         count = 0
                         t0 = time.time()
 
@@ -295,8 +260,7 @@ class TPLinkCamera:
         finally:
             self._running = False
             cv2.destroyAllWindows()
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
+            decoder.close()
 
     # --------------------------------------------------
     # Save H.264 recording
@@ -340,7 +304,7 @@ class TPLinkCamera:
         Args:
             host: Bind address.
             port: HTTP port.
-            decode_interval: Decode every N H.264 frames.
+            decode_interval: Refresh the MJPEG frame every N H.264 frames.
         """
         from flask import Flask, Response
         import socket
@@ -354,56 +318,41 @@ class TPLinkCamera:
             if not response:
                 return
 
-            tmp_path = os.path.join(
+            decoder = H264Decoder(tmp_path=os.path.join(
                 os.path.dirname(os.path.abspath(__file__)), "_web_buffer.h264"
-            )
-            h264_buf = b""
+            ), output_every=decode_interval)
             count = 0
 
-            for frame_data in camera.parse_h264_frames(response):
-                h264_buf += frame_data
-                count += 1
-
-                if count % decode_interval == 0:
-                    with open(tmp_path, "wb") as f:
-                        f.write(h264_buf)
-
-                    cap = cv2.VideoCapture(tmp_path, cv2.CAP_FFMPEG)
-                    if cap.isOpened():
-                        last = None
-                        while True:
-                            ok, frm = cap.read()
-                            if not ok:
-                                break
-                            last = frm
-                        cap.release()
+            try:
+                for frame_data in camera.parse_h264_frames(response):
+                    decoder.push(frame_data)
+                    count += 1
 
+                    if count % decode_interval == 0:
+                        last = decoder.read()
                         if last is not None:
-                            with camera._frame_lock:
-                                camera._latest_frame = last.copy()
-
-                    if count > 300:
-                        h264_buf = b""
-                        count = 0
+                            camera._set_latest_frame(last.copy())
+            finally:
+                decoder.close()
 
         threading.Thread(target=_decoder, daemon=True).start()
+        jpeg_cache = JpegCache(keep=4)
 
         def _mjpeg_gen():
+            # Wait for each new decoded frame; it is encoded once for all viewers
+            seq = 0
             while True:
-                with camera._frame_lock:
-                    frame = camera._latest_frame
-                if frame is not None:
-                    ok, jpeg = cv2.imencode(
-                        ".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 80]
+                seq, frame = camera.wait_for_frame(seq)
+                if frame is None:
+                    continue
+                jpeg = jpeg_cache.get(seq, frame, 80)
+                if jpeg is not None:
+                    yield (
+                        b"--frame\r\n"
+                        b"Content-Type: image/jpeg\r\n\r\n"
+                        + jpeg
+                        + b"\r\n"
                     )
-                    if ok:
-                        yield (
-                            b"--frame\r\n"
-                            b"Content-Type: image/jpeg\r\n\r\n"
-                            + jpeg.tobytes()
-                            + b"\r\n"
-                        )
-                time.sleep(0.1)
 
         @app.route("/")
         def index():
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+TP-Link Kasa Camera — Processing Traces and Profiling
+
+Opt-in instrumentation for the motion monitors' processing path, for
+chasing latency spikes without sprinkling print statements:
+
+- Tracer: records per-frame spans (queue wait, decode, ring-buffer append,
+  motion detect, AI, clip finalize, clip write) into a fixed-size ring and
+  exports them as Chrome trace JSON — open it in chrome://tracing or
+  https://ui.perfetto.dev to see every camera and worker thread on one
+  timeline.  Disabled, a span costs one attribute check.
+- SamplingProfiler: samples the Python stacks of every thread for a while
+  and reports the hottest functions plus collapsed stacks (flamegraph.pl /
+  speedscope).  Costs nothing until it is switched on.
+
+Both are module-level singletons (`tracer`, `profiler`) so the monitors,
+the ingest worker pool and the clip writers share them.  They are driven
+from the monitor CLIs:
+
+    python motion_detect.py --trace --metrics-port 9108
+    curl -o trace.json http://localhost:9108/trace
+    curl "http://localhost:9108/profile?seconds=10"
+    kill -USR1 <pid>     # write trace_<time>.json to the output dir
+    kill -USR2 <pid>     # start / stop the profiler (report to the output dir)
+"""
+
+import collections
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+DEFAULT_SPANS = 50000            # Spans kept in the trace ring (~30 s of 10 cameras)
+DEFAULT_SAMPLE_INTERVAL = 0.005  # Seconds between profiler stack samples
+DEFAULT_PROFILE_SECONDS = 10
+DEFAULT_PROFILE_TOP = 30
+
+
+# ========================
+# Span Tracer
+# ========================
+class _Span:
+    __slots__ = ("tracer", "camera", "name", "start")
+
+    def __init__(self, tracer, camera, name):
+        self.tracer = tracer
+        self.camera = camera
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.add(self.camera, self.name, self.start, time.perf_counter())
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """
+    Ring buffer of (name, camera, thread, start, duration) spans.
+
+    Times are time.perf_counter() seconds.  deque.append is atomic, so any
+    thread can record without a lock; the oldest spans fall off the end.
+    """
+
+    def __init__(self, capacity=DEFAULT_SPANS):
+        self.enabled = False
+        self.spans = collections.deque(maxlen=capacity)
+        # Maps perf_counter to wall-clock time for the exported timestamps
+        self._wall_offset = time.time() - time.perf_counter()
+
+    def enable(self, capacity=None):
+        if capacity and capacity != self.spans.maxlen:
+            self.spans = collections.deque(self.spans, maxlen=capacity)
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, camera, name):
+        """Context manager recording one span (a no-op while disabled)."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, camera, name)
+
+    def add(self, camera, name, start, end):
+        """Record a span measured elsewhere (start/end from time.perf_counter())."""
+        if self.enabled:
+            self.spans.append((name, camera, threading.get_ident(), start, end - start))
+
+    def chrome_trace(self):
+        """The recorded spans as a Chrome trace-event document."""
+        pid = os.getpid()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        events = []
+        tids = set()
+        for name, camera, tid, start, duration in list(self.spans):
+            tids.add(tid)
+            events.append({
+                "name": name, "cat": camera, "ph": "X", "pid": pid, "tid": tid,
+                "ts": round((start + self._wall_offset) * 1e6, 1),
+                "dur": round(duration * 1e6, 1),
+                "args": {"camera": camera},
+            })
+        for tid in tids:
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                           "args": {"name": names.get(tid, f"thread-{tid}")}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+        return path
+
+
+# ========================
+# Sampling Profiler
+# ========================
+class SamplingProfiler:
+    """
+    Periodically samples every thread's Python stack (sys._current_frames).
+
+    cProfile only instruments the thread that enables it (and from Python
+    3.12 only one cProfile can be active per process), so for a pool of
+    processing threads a stack sampler is the practical profiler: it sees
+    all of them at once and its overhead doesn't depend on call counts.
+    """
+
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.active = False
+        self.samples = 0
+        self.stacks = collections.Counter()  # (thread name, frames...) -> samples
+        self.started = 0.0
+        self.seconds = 0.0
+        self.threads = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self, threads=None):
+        """Start sampling; `threads` limits it to thread names with these prefixes."""
+        with self._lock:
+            if self.active:
+                return False
+            self.active = True
+            self.threads = tuple(threads) if threads else None
+            self.samples = 0
+            self.stacks = collections.Counter()
+            self.started = time.time()
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+        return True
+
+    def stop(self):
+        with self._lock:
+            if not self.active:
+                return False
+            self.active = False
+            thread = self._thread
+        thread.join()
+        self.seconds = time.time() - self.started
+        return True
+
+    def toggle(self):
+        """Start if idle, else stop; returns True when profiling is now on."""
+        if self.stop():
+            return False
+        self.start()
+        return True
+
+    def profile(self, seconds=DEFAULT_PROFILE_SECONDS, threads=None):
+        """Profile for `seconds` (blocking) unless a session is already running."""
+        if not self.start(threads):
+            return False
+        time.sleep(seconds)
+        self.stop()
+        return True
+
+    def _run(self):
+        me = threading.get_ident()
+        while self.active:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                name = names.get(tid, f"thread-{tid}")
+                if tid == me or (self.threads and not name.startswith(self.threads)):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(name)
+                self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+
+    def report(self, top=DEFAULT_PROFILE_TOP):
+        """Text table of the functions with the most samples of their own."""
+        own = collections.Counter()
+        total = collections.Counter()
+        all_samples = 0
+        for stack, n in self.stacks.items():
+            all_samples += n
+            own[stack[-1]] += n
+            for func in set(stack[1:]):
+                total[func] += n
+        lines = [
+            f"Sampled {self.samples} times over {self.seconds:.1f}s "
+            f"({all_samples} thread stacks, every {self.interval * 1000:g} ms)",
+            "",
+            f"{'self%':>7}{'total%':>8}  function",
+        ]
+        for func, n in own.most_common(top):
+            lines.append(f"{100.0 * n / max(1, all_samples):>7.1f}"
+                         f"{100.0 * total[func] / max(1, all_samples):>8.1f}  {func}")
+        return "\n".join(lines) + "\n"
+
+    def collapsed(self):
+        """Stacks in the collapsed format of flamegraph.pl / speedscope."""
+        return "".join(f"{';'.join(stack)} {n}\n" for stack, n in self.stacks.most_common())
+
+
+tracer = Tracer()
+profiler = SamplingProfiler()
+
+
+# ========================
+# Triggers (HTTP / signals)
+# ========================
+def http_routes():
+    """
+    Extra routes for metrics.MetricsServer:
+
+        GET /trace                         Chrome trace JSON of the span ring
+        GET /profile?seconds=10[&top=30]   profile for N seconds, text report
+        GET /profile?...&threads=processor only threads named processor*
+        GET /profile?...&format=collapsed  same, as collapsed stacks
+    """
+    def trace(query):
+        return "application/json", json.dumps(tracer.chrome_trace())
+
+    def profile(query):
+        seconds = float(query.get("seconds", [DEFAULT_PROFILE_SECONDS])[0])
+        if not profiler.profile(seconds, query.get("threads")):
+            return "text/plain", "A profiling session is already running\n"
+        if query.get("format", [""])[0] == "collapsed":
+            return "text/plain", profiler.collapsed()
+        return "text/plain", profiler.report(int(query.get("top", [DEFAULT_PROFILE_TOP])[0]))
+
+    return {"/trace": trace, "/profile": profile}
+
+
+def install_signal_handlers(output_dir):
+    """
+    SIGUSR1 writes the span ring to <output_dir>/trace_<time>.json; SIGUSR2
+    starts/stops the profiler and writes its report next to it.  No-op on
+    platforms without these signals (Windows).  Call from the main thread.
+    """
+    sig_trace = getattr(signal, "SIGUSR1", None)
+    sig_profile = getattr(signal, "SIGUSR2", None)
+    if sig_trace is None or sig_profile is None:
+        return False
+
+    def on_trace(signum, frame):
+        if not tracer.enabled:
+            print("[!] Tracing is off (start with --trace)")
+            return
+        path = tracer.dump(os.path.join(output_dir, f"trace_{time.strftime('%Y%m%d_%H%M%S')}.json"))
+        print(f"[*] Wrote {len(tracer.spans)} spans to {path}")
+
+    def on_profile(signum, frame):
+        # The sampler thread is joined in stop(); don't block the main thread on it
+        threading.Thread(target=_toggle_profile, args=(output_dir,), daemon=True).start()
+
+    signal.signal(sig_trace, on_trace)
+    signal.signal(sig_profile, on_profile)
+    return True
+
+
+def _toggle_profile(output_dir):
+    if profiler.toggle():
+        print("[*] Profiling... (send SIGUSR2 again to stop)")
+        return
+    base = os.path.join(output_dir, f"profile_{time.strftime('%Y%m%d_%H%M%S')}")
+    report = profiler.report()
+    with open(base + ".txt", "w") as f:
+        f.write(report)
+    with open(base + ".collapsed", "w") as f:
+        f.write(profiler.collapsed())
+    print(report.rstrip())
+    print(f"[*] Profile written to {base}.txt / .collapsed")
@@ -4,21 +4,74 @@ MJPEG Camera Web Server for UP Board with Intel RealSense F200 Camera
 Integrated with ESP32 Wheelcar Controller
 Works with Python 3.7+
 Access from other computers: http://<UP_BOARD_IP>:5000
+
+Install: pip install flask opencv-python numpy flask-sock
+(flask-sock is optional; without it controls fall back to one HTTP request per event)
 """
 
-from flask import Flask, Response
+from flask import Flask, Response, jsonify, request
+import http.client
+import json
+import os
 import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
 import cv2
 import numpy as np
 
+from jpeg_cache import JpegCache
+
+try:
+    from flask_sock import Sock
+    HAS_WS = True
+except ImportError:
+    HAS_WS = False
+
 app = Flask(__name__)
 
 # Camera configuration - will be auto-detected
 CAMERA_INDEX = None
+CAMERA_CAPTURE = None  # capture left open by find_camera's cache check
 
 # ESP32 Configuration - Change this to your ESP32's IP address
 ESP32_IP = "192.168.1.206"  # Default ESP32 IP
 
+# Capture settings
+FRAME_WIDTH = 1280
+FRAME_HEIGHT = 720
+REOPEN_DELAY = 2.0  # Seconds between attempts to reopen the camera
+FRAME_TIMEOUT = 5.0  # Seconds a client waits for a new frame
+
+# Camera discovery
+PROBE_INDICES = 6     # Camera indices probed (0-5)
+PROBE_TIMEOUT = 3.0   # Seconds to wait for the probes to answer
+CAMERA_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.camera_cache.json')
+
+# The single capture thread that owns the camera (started in __main__)
+broadcaster = None
+
+# JPEG quality of the stream and of /snapshot
+STREAM_QUALITY = 80
+SNAPSHOT_QUALITY = 90
+
+# ESP32 control channel (WebSocket /ws -> one HTTP connection to the ESP32)
+SERVO_INTERVAL = 0.05  # Seconds between servo updates sent (20 Hz, newest angle wins)
+ESP32_TIMEOUT = 1.0    # Seconds to wait for the ESP32 to answer a command
+LATENCY_SAMPLES = 500  # Recent command latencies kept for /control_stats
+
+# Adaptive MJPEG (per viewer, see StreamController)
+TARGET_LATENCY = 0.3   # Seconds from capture until a frame is written to the viewer's socket
+STREAM_LEVELS = [      # (width, JPEG quality), best first
+    (1280, STREAM_QUALITY), (1280, 65), (960, 60), (640, 55), (480, 45), (320, 40),
+]
+FPS_STEPS = [None, 15, 8, 4, 2]  # Frame-rate caps used below the lowest level (None = camera rate)
+ADAPT_INTERVAL = 1.0   # Seconds between two downgrades
+UPGRADE_AFTER = 3.0    # Seconds of latency under half the target before an upgrade
+SEND_BUFFER = 64 * 1024  # Viewer socket send buffer, so a slow link blocks instead of queueing seconds
+
 
 def get_local_ip():
     """Get the local IP address of this device"""
@@ -32,76 +85,612 @@ def get_local_ip():
         return "127.0.0.1"
 
 
+def camera_device_id(index):
+    """
+    Identity of camera `index` for the discovery cache: its /dev/video path
+    and the vendor:product ID of the USB device behind it (Linux sysfs).
+    Elsewhere both are None and the cache is keyed by the index alone.
+    """
+    path = f"/dev/video{index}"
+    if not os.path.exists(path):
+        return {'path': None, 'usb': None}
+    usb = None
+    device = os.path.realpath(f"/sys/class/video4linux/video{index}/device")
+    # The video node hangs off a USB interface; idVendor/idProduct are on its parent(s)
+    while device.startswith("/sys/devices/") and usb is None:
+        try:
+            with open(os.path.join(device, "idVendor")) as f:
+                vendor = f.read().strip()
+            with open(os.path.join(device, "idProduct")) as f:
+                usb = f"{vendor}:{f.read().strip()}"
+        except OSError:
+            device = os.path.dirname(device)
+    return {'path': path, 'usb': usb}
+
+
+def is_color_frame(frame):
+    """
+    True for a colour image, False for the F200's depth/IR streams (one
+    channel, or dominated by green).  Looks at every 8th pixel only.
+    """
+    if frame.ndim != 3 or frame.shape[2] != 3:
+        return False
+    return is_color_average(frame[::8, ::8].reshape(-1, 3).mean(axis=0))
+
+
+def is_color_average(avg_color):
+    """is_color_frame() for a frame's average (B, G, R) colour."""
+    green_ratio = avg_color[1] / (avg_color[0] + avg_color[2] + 1)
+    return green_ratio < 1.5  # Not dominated by green
+
+
+def open_camera(index, width=FRAME_WIDTH, height=FRAME_HEIGHT):
+    """Open camera `index` at the capture resolution; None if it can't be opened."""
+    camera = cv2.VideoCapture(index)
+    camera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    camera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    if not camera.isOpened():
+        camera.release()
+        return None
+    return camera
+
+
+# Run by run_probes() in a child process per index: prints
+# [width, height, channels, average colour of every 8th pixel]
+PROBE_SCRIPT = r"""
+import json, sys
+import cv2
+cap = cv2.VideoCapture(int(sys.argv[1]))
+ret, frame = cap.read() if cap.isOpened() else (False, None)
+if ret and frame is not None:
+    channels = frame.shape[2] if frame.ndim == 3 else 1
+    avg = frame[::8, ::8].reshape(-1, channels).mean(axis=0).tolist()
+    print(json.dumps([frame.shape[1], frame.shape[0], channels, avg]))
+cap.release()
+"""
+
+
+def run_probes(indices, timeout=PROBE_TIMEOUT):
+    """
+    Probe `indices` in parallel, one child process each, waiting at most
+    `timeout` seconds in total.
+
+    Returns {index: (width, height, channels, color)} for the indices that
+    answered.  A probe that hangs (opening or reading) is killed, which
+    closes its device handle; nothing is released from another thread.
+    """
+    procs = {index: subprocess.Popen([sys.executable, '-c', PROBE_SCRIPT, str(index)],
+                                     stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                     text=True)
+             for index in indices}
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and any(p.poll() is None for p in procs.values()):
+        time.sleep(0.05)
+
+    results = {}
+    for index, proc in procs.items():
+        if proc.poll() is None:
+            print(f"    Index {index}: no answer within {timeout:g}s")
+            proc.kill()
+            try:
+                proc.communicate(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                print(f"    Index {index}: probe could not be killed, the device may stay busy")
+            continue
+        out, _ = proc.communicate()  # exited; its one line of output is in the pipe
+        try:
+            w, h, channels, avg = json.loads(out.strip().splitlines()[-1])
+        except (ValueError, IndexError):
+            continue  # could not be opened or read
+        results[index] = (w, h, channels, channels == 3 and is_color_average(avg))
+    return results
+
+
+def open_cached_camera(index, timeout=PROBE_TIMEOUT):
+    """
+    Open cached camera `index` and check that it delivers a colour frame.
+
+    Returns the open capture, handed to the FrameBroadcaster so the device
+    is opened only once, or None.  If the device doesn't answer within
+    `timeout` the check thread is abandoned and releases its own capture
+    when (if) the device answers.
+    """
+    result = {}
+    lock = threading.Lock()
+
+    def check():
+        camera = open_camera(index)
+        if camera is None:
+            return
+        ret, frame = camera.read()
+        with lock:
+            if ret and frame is not None and is_color_frame(frame) and 'abandoned' not in result:
+                result['camera'] = camera
+                return
+        camera.release()
+
+    t = threading.Thread(target=check, daemon=True)
+    t.start()
+    t.join(timeout)
+    with lock:
+        result['abandoned'] = True
+        return result.get('camera')
+
+
+def load_camera_cache():
+    """Cached camera index if that device is still the one that was chosen, else None."""
+    try:
+        with open(CAMERA_CACHE) as f:
+            cached = json.load(f)
+        index = int(cached['index'])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    device = camera_device_id(index)
+    if device['path'] is None:
+        # No /dev/video nodes to compare (Windows): find_camera's frame check decides
+        return index if cached.get('path') is None else None
+    if device != {'path': cached.get('path'), 'usb': cached.get('usb')}:
+        return None
+    return index
+
+
+def save_camera_cache(index):
+    try:
+        with open(CAMERA_CACHE, 'w') as f:
+            json.dump(dict(camera_device_id(index), index=index), f)
+    except OSError as e:
+        print(f"  Could not save camera cache: {e}")
+
+
 def find_camera():
     """
     Auto-detect working camera.
     F200 has multiple streams (RGB, depth, IR) on different indices.
+
+    The chosen device is cached in CAMERA_CACHE.  On the next boot the
+    cached index is used only if it still delivers a colour frame: the F200's
+    RGB, depth and IR nodes share one USB ID, so after a re-enumeration the
+    same index can be the depth or IR stream.  That check opens the device
+    once and the open capture is kept in CAMERA_CAPTURE for the broadcaster.
+    Otherwise all indices are probed in parallel, each for at most
+    PROBE_TIMEOUT seconds.
     """
-    global CAMERA_INDEX
-    
+    global CAMERA_INDEX, CAMERA_CAPTURE
+
+    cached = load_camera_cache()
+    if cached is not None:
+        camera = open_cached_camera(cached)
+        if camera is not None:
+            print(f"  Using cached camera index {cached}")
+            CAMERA_INDEX = cached
+            CAMERA_CAPTURE = camera
+            return True
+        print(f"  Cached camera index {cached} is not a color stream any more")
+
     print("  Scanning for cameras...")
-    
-    for index in range(6):  # Try indices 0-5
-        cap = cv2.VideoCapture(index)
-        if cap.isOpened():
-            ret, frame = cap.read()
-            if ret and frame is not None:
-                h, w = frame.shape[:2]
-                channels = frame.shape[2] if len(frame.shape) == 3 else 1
-                
-                print(f"    Index {index}: {w}x{h}, {channels} channels")
-                
-                # Check if it's a color image (3 channels)
-                if channels == 3:
-                    # Check if image is not all green (depth/IR from F200)
-                    avg_color = np.mean(frame, axis=(0, 1))
-                    green_ratio = avg_color[1] / (avg_color[0] + avg_color[2] + 1)
-                    
-                    if green_ratio < 1.5:  # Not dominated by green
-                        print(f"    -> Selected (color camera)")
-                        CAMERA_INDEX = index
-                        cap.release()
-                        return True
-                    else:
-                        print(f"    -> Skipping (appears to be depth/IR stream)")
-            cap.release()
-    
-    # Fallback: just use index 0
+
+    results = run_probes(range(PROBE_INDICES))  # Try indices 0-5
+
+    # Lowest colour index wins
+    for index in range(PROBE_INDICES):
+        if index not in results:
+            continue
+        w, h, channels, color = results[index]
+        print(f"    Index {index}: {w}x{h}, {channels} channels")
+        if color:
+            print(f"    -> Selected (color camera)")
+            CAMERA_INDEX = index
+            save_camera_cache(index)
+            return True
+        print(f"    -> Skipping (appears to be depth/IR stream)")
+
+    # Fallback: just use index 0 (not cached, so the next boot scans again)
     print("  Could not find color camera, using index 0")
     CAMERA_INDEX = 0
     return True
 
 
-def generate_frames():
-    """Generate MJPEG frames from camera"""
-    camera = cv2.VideoCapture(CAMERA_INDEX)
-    
-    # Set camera resolution (higher resolution)
-    camera.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-    camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-    
-    if not camera.isOpened():
-        print("Error: Cannot open camera")
-        return
-    
-    print("  Stream started")
-    
-    while True:
-        success, frame = camera.read()
-        if not success:
-            print("Error: Cannot read frame")
-            break
-        
-        # Encode as JPEG
-        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-        if not ret:
-            continue
-        
-        frame_bytes = buffer.tobytes()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-    
-    camera.release()
+class Subscriber:
+    """
+    One consumer of the broadcaster's frames.
+
+    Holds up to `max_pending` frames the consumer hasn't taken yet; when it
+    falls further behind, the oldest are dropped.  max_pending=1 (MJPEG
+    viewers) means a slow client always gets the newest frame.
+    """
+
+    def __init__(self, max_pending=1):
+        self.pending = deque(maxlen=max_pending)
+        self.dropped = 0
+        self.delivered = 0
+        self.frame_time = 0.0  # capture time of the frame get() returned last
+
+
+class FrameBroadcaster:
+    """
+    Owns the camera: one thread reads frames and publishes each to every
+    subscriber, and keeps the newest one for snapshots.  Viewers never open
+    the device themselves, so any number of them can watch at once.
+    """
+
+    def __init__(self, index, width=FRAME_WIDTH, height=FRAME_HEIGHT, camera=None):
+        self.index = index
+        self.width = width
+        self.height = height
+        self.camera = camera   # already open capture to start with, if any
+
+        self.frame = None      # newest frame
+        self.seq = 0           # increments with every captured frame
+        self.frame_time = 0.0
+        self.subscribers = []
+        self.cond = threading.Condition()
+        self.running = False
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._capture_loop, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        with self.cond:
+            self.cond.notify_all()
+
+    def _capture_loop(self):
+        camera, self.camera = self.camera, None
+        if camera is not None:
+            print("  Capture started")
+        while self.running:
+            if camera is None:
+                camera = open_camera(self.index, self.width, self.height)
+                if camera is None:
+                    print(f"Error: Cannot open camera {self.index}, retrying...")
+                    time.sleep(REOPEN_DELAY)
+                    continue
+                print("  Capture started")
+
+            success, frame = camera.read()
+            if not success:
+                print("Error: Cannot read frame, reopening camera...")
+                camera.release()
+                camera = None
+                time.sleep(REOPEN_DELAY)
+                continue
+            self._publish(frame)
+
+        if camera is not None:
+            camera.release()
+
+    def _publish(self, frame):
+        with self.cond:
+            self.frame = frame
+            self.seq += 1
+            self.frame_time = time.time()
+            for sub in self.subscribers:
+                if len(sub.pending) == sub.pending.maxlen:
+                    sub.dropped += 1
+                sub.pending.append((self.seq, frame, self.frame_time))
+            self.cond.notify_all()
+
+    def subscribe(self, max_pending=1):
+        sub = Subscriber(max_pending)
+        with self.cond:
+            self.subscribers.append(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self.cond:
+            if sub in self.subscribers:
+                self.subscribers.remove(sub)
+
+    def get(self, sub, timeout=FRAME_TIMEOUT):
+        """Next frame for `sub` as (seq, frame); (None, None) on timeout or stop."""
+        with self.cond:
+            if not self.cond.wait_for(lambda: sub.pending or not self.running, timeout):
+                return None, None
+            if not sub.pending:
+                return None, None
+            sub.delivered += 1
+            seq, frame, sub.frame_time = sub.pending.popleft()
+            return seq, frame
+
+    def latest(self, timeout=FRAME_TIMEOUT):
+        """Newest frame as (seq, frame), waiting only if nothing was captured yet."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.frame is not None or not self.running, timeout)
+            return self.seq, self.frame
+
+
+jpeg_cache = JpegCache()
+
+
+class Esp32Link:
+    """
+    Forwards control commands to the ESP32 from one sender thread over one
+    HTTP connection (kept alive when the ESP32 allows it), so the ESP32's
+    single-threaded handleClient() never sees more than one request.
+
+    Drive actions are queued and sent in order, so a quick forward-then-left
+    (or a tap: forward-then-stop) never loses a command; only a repeat of
+    the last queued action (key auto-repeat) is merged into it.  Servo
+    angles are coalesced into one slot, newest value wins, and go out at
+    most every SERVO_INTERVAL seconds.  Queued drive actions ('stop'
+    included) are always sent before the servo, so dragging the slider
+    can't delay a stop.
+
+    Latency is measured per command, from submit() to the ESP32's reply
+    (for coalesced commands: to the reply of the value that replaced them).
+    """
+
+    def __init__(self, host, servo_interval=SERVO_INTERVAL, timeout=ESP32_TIMEOUT):
+        self.host = host
+        self.servo_interval = servo_interval
+        self.timeout = timeout
+
+        self.actions = deque()  # [value, [(submit time, callback), ...]] in order
+        self.servo = None       # same, newest angle only
+        self.next_servo = 0.0
+        self.cond = threading.Condition()
+        self.running = False
+        self._conn = None
+        self._conn_host = None
+
+        self.sent = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.latency = {'control': deque(maxlen=LATENCY_SAMPLES),
+                        'servo': deque(maxlen=LATENCY_SAMPLES)}
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        with self.cond:
+            self.cond.notify_all()
+
+    def set_host(self, host):
+        with self.cond:
+            if host and host != self.host:
+                print(f"  ESP32 IP changed to {host}")
+                self.host = host
+
+    def submit(self, kind, value, done=None):
+        """
+        Queue a 'control' (action) or 'servo' (angle) command.
+        done(ok, latency_ms) is called from the sender thread once it's sent.
+        """
+        waiter = (time.perf_counter(), done)
+        with self.cond:
+            if kind == 'control':
+                if self.actions and self.actions[-1][0] == value:
+                    self.actions[-1][1].append(waiter)
+                    self.coalesced += 1
+                else:
+                    self.actions.append([value, [waiter]])
+            elif self.servo is None:
+                self.servo = [value, [waiter]]
+            else:
+                self.servo[0] = value
+                self.servo[1].append(waiter)
+                self.coalesced += 1
+            self.cond.notify_all()
+
+    def _next(self):
+        """Wait for the next command to send: (kind, value, waiters, host)."""
+        with self.cond:
+            while self.running:
+                if self.actions:
+                    value, waiters = self.actions.popleft()
+                    return 'control', value, waiters, self.host
+                if self.servo is not None:
+                    wait = self.next_servo - time.monotonic()
+                    if wait <= 0:
+                        (value, waiters), self.servo = self.servo, None
+                        self.next_servo = time.monotonic() + self.servo_interval
+                        return 'servo', value, waiters, self.host
+                    self.cond.wait(wait)
+                else:
+                    self.cond.wait()
+            return None
+
+    def _run(self):
+        while True:
+            command = self._next()
+            if command is None:
+                break
+            kind, value, waiters, host = command
+            if kind == 'control':
+                path = f"/control?action={value}"
+            else:
+                path = f"/servo?angle={value}"
+            ok = self._request(host, path)
+
+            now = time.perf_counter()
+            with self.cond:
+                self.sent += 1
+                if not ok:
+                    self.errors += 1
+            for t0, done in waiters:
+                latency_ms = (now - t0) * 1000
+                self.latency[kind].append(latency_ms)
+                if done is not None:
+                    done(ok, latency_ms)
+        self._close()
+
+    def _request(self, host, path):
+        if self._conn is not None and self._conn_host != host:
+            self._close()
+        reused = self._conn is not None
+        if not reused:
+            # host may be "ip" or "ip:port"
+            self._conn = http.client.HTTPConnection(host, timeout=self.timeout)
+            self._conn_host = host
+        try:
+            self._conn.request('GET', path)
+            response = self._conn.getresponse()
+            response.read()
+        except socket.timeout as e:
+            self._close()
+            print(f"Error: ESP32 {host} {path}: {e}")
+            return False
+        except (OSError, http.client.HTTPException) as e:
+            self._close()
+            if reused:  # the ESP32 dropped the kept-alive connection; reconnect once
+                return self._request(host, path)
+            print(f"Error: ESP32 {host} {path}: {e}")
+            return False
+        if response.will_close:
+            self._close()
+        return response.status == 200
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def stats(self):
+        def summary(samples):
+            ordered = sorted(samples)
+            if not ordered:
+                return {'count': 0}
+            return {
+                'count': len(ordered),
+                'p50_ms': round(ordered[len(ordered) // 2], 1),
+                'p99_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 1),
+                'last_ms': round(samples[-1], 1),
+            }
+
+        return {
+            'esp32_ip': self.host,
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'errors': self.errors,
+            'control': summary(self.latency['control']),
+            'servo': summary(self.latency['servo']),
+        }
+
+
+esp32 = Esp32Link(ESP32_IP)
+
+
+class StreamController:
+    """
+    Stream settings of one MJPEG viewer, adapted to its link.
+
+    The latency of each frame is measured from capture until the server has
+    written it to the viewer's socket (the generator resumes only then, and
+    the socket's send buffer is kept small, so a slow link shows up as send
+    time instead of seconds of queued data).  Above `target` the stream
+    steps down STREAM_LEVELS (smaller, lower quality), then caps the frame
+    rate along FPS_STEPS; after UPGRADE_AFTER seconds under half the target
+    it steps back up.  Since a viewer only ever gets the newest frame,
+    sending less catches up at once.
+
+    quality / width / fps fix that setting; adaptive=False fixes all.
+    """
+
+    def __init__(self, target=TARGET_LATENCY, quality=None, width=None, fps=None, adaptive=True):
+        self.target = target
+        self.quality = quality
+        self.width = width
+        self.fps = fps
+        self.adaptive = adaptive
+
+        self.level = 0
+        self.fps_step = 0
+        self.latency = 0.0  # smoothed, seconds
+        self.changed = time.monotonic()
+        self.good_since = None
+
+    def settings(self):
+        """(width, quality, max_fps) for the next frame; None = unlimited."""
+        width, quality = STREAM_LEVELS[self.level]
+        return (self.width or width,
+                self.quality or quality,
+                self.fps or FPS_STEPS[self.fps_step])
+
+    def _can_lower_level(self):
+        return not (self.width and self.quality) and self.level < len(STREAM_LEVELS) - 1
+
+    def _can_lower_fps(self):
+        return not self.fps and self.fps_step < len(FPS_STEPS) - 1
+
+    def update(self, latency):
+        """Record one frame's latency; True when the settings changed."""
+        self.latency += 0.3 * (latency - self.latency)
+        if not self.adaptive:
+            return False
+        now = time.monotonic()
+
+        if self.latency > self.target:
+            self.good_since = None
+            if now - self.changed < ADAPT_INTERVAL:
+                return False
+            if self._can_lower_level():
+                self.level += 1
+            elif self._can_lower_fps():
+                self.fps_step += 1
+            else:
+                return False
+            self.changed = now
+            return True
+
+        if self.latency > self.target / 2:
+            self.good_since = None
+            return False
+        if self.good_since is None:
+            self.good_since = now
+        if now - self.good_since < UPGRADE_AFTER:
+            return False
+        self.good_since = None
+        if self.fps_step > 0:
+            self.fps_step -= 1
+        elif self.level > 0:
+            self.level -= 1
+        else:
+            return False
+        self.changed = now
+        return True
+
+    def describe(self):
+        width, quality, max_fps = self.settings()
+        fps = f"{max_fps:g} fps" if max_fps else "full fps"
+        return f"{width}px q{quality} {fps} (latency {self.latency:.2f}s)"
+
+
+def generate_frames(controller, viewer=''):
+    """Generate MJPEG frames from the shared capture, sized to the viewer's link"""
+    sub = broadcaster.subscribe()
+    print(f"  Viewer connected ({len(broadcaster.subscribers)} watching)")
+    next_due = 0.0
+    try:
+        while True:
+            seq, frame = broadcaster.get(sub)
+            if frame is None:
+                print("Error: No frames from camera")
+                break
+
+            width, quality, max_fps = controller.settings()
+            if max_fps:
+                if sub.frame_time < next_due:
+                    continue
+                next_due = sub.frame_time + 0.9 / max_fps  # some slack for capture jitter
+
+            # Encoded once per frame and setting, shared with the other viewers
+            frame_bytes = jpeg_cache.get(seq, frame, quality, width)
+            if frame_bytes is None:
+                continue
+
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+
+            # Resumed once the frame was written to the socket
+            if controller.update(time.time() - sub.frame_time):
+                print(f"  Viewer {viewer} stream -> {controller.describe()}")
+    finally:
+        broadcaster.unsubscribe(sub)
+        print(f"  Viewer disconnected ({len(broadcaster.subscribers)} watching)")
 
 
 @app.route('/')
@@ -382,12 +971,55 @@ def index():
     </div>
     
     <script>
+        // Commands go through the server's WebSocket when it has one
+        // (coalesced, stop first); otherwise straight to the ESP32.
+        const USE_WS = {'true' if HAS_WS else 'false'};
+        let ws = null;
+        let nextId = 1;
+        const sentAt = {{}};
+        
         function getEspUrl() {{
             return 'http://' + document.getElementById('espIp').value;
         }}
         
+        function connectWs() {{
+            if (!USE_WS) return;
+            ws = new WebSocket((location.protocol === 'https:' ? 'wss://' : 'ws://') + location.host + '/ws');
+            ws.onopen = () => setEspIp();
+            ws.onmessage = (event) => {{
+                const msg = JSON.parse(event.data);
+                const t0 = sentAt[msg.id];
+                delete sentAt[msg.id];
+                if (!msg.ok) {{
+                    document.getElementById('status').innerText = 'Connection Error';
+                }} else if (msg.type === 'control' && t0 !== undefined) {{
+                    const ms = Math.round(performance.now() - t0);
+                    document.getElementById('status').innerText = msg.value + ' (' + ms + ' ms)';
+                }}
+            }};
+            ws.onclose = () => {{
+                ws = null;
+                setTimeout(connectWs, 1000);
+            }};
+        }}
+        
+        function sendWs(msg) {{
+            if (!ws || ws.readyState !== WebSocket.OPEN) return false;
+            if (msg.type !== 'esp_ip') {{
+                msg.id = nextId++;
+                sentAt[msg.id] = performance.now();
+            }}
+            ws.send(JSON.stringify(msg));
+            return true;
+        }}
+        
+        function setEspIp() {{
+            sendWs({{type: 'esp_ip', ip: document.getElementById('espIp').value}});
+        }}
+        
         function control(action) {{
             document.getElementById('status').innerText = action;
+            if (sendWs({{type: 'control', value: action}})) return;
             fetch(getEspUrl() + '/control?action=' + action)
                 .catch(err => {{
                     console.log('ESP32 Error:', err);
@@ -397,9 +1029,13 @@ def index():
         
         function setServo(angle) {{
             document.getElementById('servoAngle').innerText = angle;
+            if (sendWs({{type: 'servo', value: angle}})) return;
             fetch(getEspUrl() + '/servo?angle=' + angle)
                 .catch(err => console.log('ESP32 Error:', err));
         }}
+        
+        document.getElementById('espIp').addEventListener('change', setEspIp);
+        connectWs();
     </script>
 </body>
 </html>
@@ -408,22 +1044,108 @@ def index():
 
 @app.route('/video_feed')
 def video_feed():
-    """MJPEG video stream endpoint"""
-    return Response(generate_frames(),
+    """
+    MJPEG video stream endpoint, adapted to the viewer's link.
+    Optional overrides: ?quality=60&width=640&fps=10&target=0.2&adaptive=0
+    """
+    args = request.args
+    quality = args.get('quality', type=int)
+    width = args.get('width', type=int)
+    fps = args.get('fps', type=float)
+    controller = StreamController(
+        target=args.get('target', TARGET_LATENCY, type=float),
+        quality=min(100, max(10, quality)) if quality else None,
+        width=max(160, width) if width else None,
+        fps=fps if fps and fps > 0 else None,
+        adaptive=args.get('adaptive', '1').lower() not in ('0', 'false', 'off'),
+    )
+
+    # A small send buffer makes a slow link block the generator (measurable)
+    # instead of hiding seconds of frames in the kernel
+    sock = request.environ.get('werkzeug.socket')
+    if sock is not None:
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER)
+        except OSError:
+            pass
+
+    return Response(generate_frames(controller, request.remote_addr),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 
+CONTROL_ACTIONS = ('forward', 'backward', 'left', 'right', 'stop')
+
+
+def handle_command(msg, reply):
+    """
+    One control message from a WebSocket client:
+        {"type": "control", "value": "forward", "id": 1}
+        {"type": "servo", "value": 120, "id": 2}
+        {"type": "esp_ip", "ip": "192.168.1.206"}
+    Once the command (or the newer one it was coalesced into) reached the
+    ESP32, reply() gets {"id", "type", "value", "ok", "latency_ms"}.
+    """
+    kind = msg.get('type')
+    if kind == 'esp_ip':
+        esp32.set_host(str(msg.get('ip', '')).strip())
+        return
+    if kind == 'control':
+        value = msg.get('value')
+        if value not in CONTROL_ACTIONS:
+            return
+    elif kind == 'servo':
+        try:
+            value = min(180, max(0, int(msg.get('value'))))
+        except (TypeError, ValueError):
+            return
+    else:
+        return
+
+    msg_id = msg.get('id')
+
+    def done(ok, latency_ms):
+        reply({'id': msg_id, 'type': kind, 'value': value,
+               'ok': ok, 'latency_ms': round(latency_ms, 1)})
+
+    esp32.submit(kind, value, done)
+
+
+if HAS_WS:
+    sock = Sock(app)
+
+    @sock.route('/ws')
+    def control_ws(ws):
+        """WebSocket control channel (see handle_command)"""
+        def reply(data):
+            try:
+                ws.send(json.dumps(data))
+            except Exception:
+                pass  # client went away; its command was still sent
+
+        while True:
+            try:
+                msg = json.loads(ws.receive())
+            except ValueError:
+                continue
+            if isinstance(msg, dict):
+                handle_command(msg, reply)
+
+
+@app.route('/control_stats')
+def control_stats():
+    """ESP32 command counters and latency (submit -> ESP32 reply) as JSON"""
+    return jsonify(esp32.stats())
+
+
 @app.route('/snapshot')
 def snapshot():
-    """Single snapshot endpoint"""
-    camera = cv2.VideoCapture(CAMERA_INDEX)
-    success, frame = camera.read()
-    camera.release()
+    """Single snapshot endpoint (newest frame from the shared capture)"""
+    seq, frame = broadcaster.latest()
     
-    if success:
-        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
-        if ret:
-            return Response(buffer.tobytes(), mimetype='image/jpeg')
+    if frame is not None:
+        jpeg = jpeg_cache.get(seq, frame, SNAPSHOT_QUALITY)
+        if jpeg is not None:
+            return Response(jpeg, mimetype='image/jpeg')
     
     return "Camera error", 500
 
@@ -436,11 +1158,19 @@ if __name__ == '__main__':
     print("  Wheelcar Camera Controller")
     print("=" * 50)
     find_camera()
+    broadcaster = FrameBroadcaster(CAMERA_INDEX, camera=CAMERA_CAPTURE)
+    broadcaster.start()
+    esp32.start()
     
     print(f"\n  Access from browser:")
     print(f"  http://{local_ip}:{port}")
     print(f"  http://localhost:{port}")
     print(f"\n  ESP32 IP: {ESP32_IP} (change in code if needed)")
+    if HAS_WS:
+        print(f"  Controls via WebSocket /ws, latency at /control_stats")
+    else:
+        print("  WebSocket control disabled (pip install flask-sock);"
+              " the page talks to the ESP32 directly")
     print("\n  Press Ctrl+C to stop")
     print("=" * 50)
     
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Encode-once JPEG Cache
+
+Used by camera_server.py's MJPEG stream and /snapshot: each captured frame is
+JPEG-encoded once per quality and size, however many viewers are watching.
+
+TPLinkCam/jpeg_cache.py is an identical copy for the TP-Link monitors;
+keep the two in sync.
+"""
+
+import threading
+from collections import OrderedDict
+
+import cv2
+
+_PENDING = object()
+
+
+class JpegCache:
+    """
+    Encoded JPEGs keyed by (frame seq, quality, width).
+
+    The first viewer to ask for a key encodes it; viewers asking for the same
+    key meanwhile wait for that result, so each captured frame is encoded
+    once per quality and size however many viewers there are.  Only the
+    newest `keep` finished keys are kept; keys still being encoded are never
+    evicted, so their waiters always find the result.
+    """
+
+    def __init__(self, keep=16):
+        self.keep = keep
+        self.encodes = 0
+        self.hits = 0
+        self._entries = OrderedDict()
+        self._cond = threading.Condition()
+
+    def get(self, seq, frame, quality=80, width=None):
+        """
+        JPEG bytes of `frame` (captured frame number `seq`), scaled down to
+        `width` pixels if it is wider, or None.
+        """
+        h, w = frame.shape[:2]
+        if width is not None and width >= w:
+            width = None
+        key = (seq, quality, width)
+        with self._cond:
+            while self._entries.get(key) is _PENDING:
+                self._cond.wait()
+            if key in self._entries:
+                self.hits += 1
+                return self._entries[key]
+            self._entries[key] = _PENDING
+
+        data = None
+        try:
+            if width is not None:
+                frame = cv2.resize(frame, (width, max(1, round(h * width / w))),
+                                   interpolation=cv2.INTER_AREA)
+            ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            data = jpeg.tobytes() if ok else None
+        finally:
+            # Also on an exception, so waiters never block on a dead _PENDING
+            with self._cond:
+                self.encodes += 1
+                if data is None:
+                    self._entries.pop(key, None)  # let the next caller retry
+                else:
+                    self._entries[key] = data
+                    self._evict()
+                self._cond.notify_all()
+        return data
+
+    def _evict(self):
+        """Drop the oldest finished entries beyond `keep` (caller holds the lock)."""
+        done = [k for k, v in self._entries.items() if v is not _PENDING]
+        for k in done[:max(0, len(done) - self.keep)]:
+            del self._entries[k]